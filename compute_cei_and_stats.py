@@ -1,5 +1,5 @@
 # -*- coding: utf-8 -*-
-import os, glob, math, json
+import os, sys, glob, math, json
 import numpy as np
 import pandas as pd
 from pathlib import Path
@@ -8,40 +8,165 @@ import matplotlib.pyplot as plt
 
 plt.rcParams['font.size'] = 10
 
+sys.path.insert(0, str(Path(__file__).resolve().parent / 'scripts'))
+from window_engine import (rolling_rms, rolling_slope, window_samples,
+                           windowed_rms, windowed_slope, time_grid, grid_bounds, spectral_features, float_dtype)
+from session_store import SessionStore, ensure_imported
+from feature_cache import FeatureCache
+from resampling import make_rng, bootstrap_ci, sign_flip_test, cohens_d, wilcoxon_r, t_statistic, signed_rank_z
+from signal_quality import emg_quality, gsr_quality, rolling_emg_quality, rolling_gsr_quality, warn_if_all_rejected
+from event_windows import TimeIndex
+from cei_pyramid import CEIPyramid
+from downsample import downsample, point_budget
+
+# demo_pipeline 的特征参数；version 随 features() 的计算逻辑变化而递增，使旧缓存失效
+# ts_scale='auto'：按采样间隔推断时间戳单位 (旧版 demo CSV 的 timestamp 为样本序号)
+FEATURE_PARAMS = {'fs_emg':200, 'fs_gsr':10, 'win_s':2.0, 'step_s':0.5, 'align':'timestamp', 'ts_scale':'auto'}
+FEATURE_VERSION = 5
+
 def windowed(arr, w, step):
     for i in range(0, max(0, len(arr)-w+1), step):
         yield i, arr[i:i+w]
 
-def features(df, fs_emg=200, fs_gsr=10, win_s=2.0, step_s=0.5):
+def quality_thresholds(quality):
+    # quality: False 不检查；True 默认阈值 (GSR 以 µS 为单位)；{'emg': {...}, 'gsr': {...}} 覆盖 signal_quality 的阈值
+    if not quality:
+        return None
+    return {'emg': {}, 'gsr': {}} if quality is True else {'emg': quality.get('emg', {}), 'gsr': quality.get('gsr', {})}
+
+def infer_ts_scale(t, fs):
+    # 由中位采样间隔推断时间戳单位 (换算为秒的系数)：秒 / 毫秒 / 微秒 / 样本序号 (1/fs)
+    dt = np.median(np.diff(t[:100001])) if len(t) > 1 else 1.0/fs
+    if not dt > 0:
+        return 1.0
+    candidates = np.array([1.0, 1e-3, 1e-6, 1.0/fs])
+    return float(candidates[np.argmin(np.abs(np.log(dt*candidates*fs)))])
+
+def sort_by_time(t, x):
+    # 按时间戳稳定排序，与 sort_values('timestamp', kind='stable') 后再取该路的行一致；已排序时原样返回
+    if np.all(t[1:] >= t[:-1]):
+        return t, x
+    order = np.argsort(t, kind='stable')
+    return t[order], x[order]
+
+def aligned_windows(df, fs_emg=200, fs_gsr=10, win_s=2.0, step_s=0.5, ts_scale=1.0, min_coverage=0.5, precision='float64', quality=False):
+    # 按 timestamp 列把两路不同采样率的信号划分到共享时间窗口网格上 (searchsorted)
+    # 每路信号取该列非NaN的行；ts_scale 将时间戳换算为秒 ('auto' 时由EMG采样间隔推断)；时间戳始终为 float64
+    # quality 见 quality_thresholds：不合格窗口不计算特征 (NaN)，标志位写入 emg_quality / gsr_quality 列
+    # 没有任何窗口满足 min_coverage 时 (通常是时间戳单位不符) 报错，而不是返回全为NaN的CEI
+    # 输出的 timestamp 列为窗口起点的原始时间戳单位，time_s 列为换算后的秒
+    t = df['timestamp'].to_numpy(dtype=float)
+    dtype = float_dtype(precision)
+    emg = df['emg'].to_numpy(dtype=dtype); gsr = df['gsr'].to_numpy(dtype=dtype)
+    has_e, has_g = ~np.isnan(emg), ~np.isnan(gsr)
+    # 每路信号只按自身时间戳稳定排序 (已排序时跳过)，不复制整表
+    t_emg, emg = sort_by_time(t[has_e], emg[has_e])
+    t_gsr, gsr = sort_by_time(t[has_g], gsr[has_g])
+    if ts_scale == 'auto':
+        ts_scale = infer_ts_scale(t_emg, fs_emg)
+    # 只换算各路信号自身的时间戳 (原位)，不生成整列换算后的副本
+    t_emg *= ts_scale; t_gsr *= ts_scale
+    # 每个样本覆盖 [t, t+1/fs)，网格跨越两路信号的并集
+    firsts = [ts[0] for ts in (t_emg, t_gsr) if len(ts)]
+    lasts = [ts[-1]+1.0/fs for ts, fs in ((t_emg, fs_emg), (t_gsr, fs_gsr)) if len(ts)]
+    grid = time_grid(min(firsts), max(lasts), win_s, step_s) if firsts else np.empty(0)
+    lo_e, hi_e = grid_bounds(t_emg, grid, win_s)
+    lo_g, hi_g = grid_bounds(t_gsr, grid, win_s)
+    thresholds = quality_thresholds(quality)
+    mask_e = mask_g = None
+    if thresholds:
+        flags_e = emg_quality(emg, lo_e, hi_e, fs_emg, dtype=dtype, **thresholds['emg'])
+        flags_g = gsr_quality(gsr, lo_g, hi_g, dtype=dtype, **thresholds['gsr'])
+        mask_e, mask_g = flags_e == 0, flags_g == 0
+        # 全部窗口被拒时告警 (通常是阈值与信号单位不符)
+        warn_if_all_rejected(flags_e, 'EMG')
+        warn_if_all_rejected(flags_g, 'GSR')
+    rms = windowed_rms(emg, lo_e, hi_e, dtype=dtype, mask=mask_e)
+    # 过零率/中值频率按固定长度的FFT计算：只有样本数恰为名义长度 (无掉线、无间隙) 的窗口
+    # 其 [lo_e, lo_e+w) 才与窗口 [lo_e, hi_e) 一致，其余窗口为NaN，避免混入窗口之后的样本
+    w_emg = int(win_s*fs_emg)
+    full_e = (hi_e-lo_e) == w_emg
+    zcr, mdf = spectral_features(emg, lo_e, w_emg, fs_emg, dtype=dtype,
+                                 mask=full_e if mask_e is None else full_e & mask_e)
+    # 以名义采样间隔为x轴单位，斜率与按位置计算时同量纲
+    slope = windowed_slope(gsr, lo_g, hi_g, x=t_gsr*fs_gsr, dtype=dtype, mask=mask_g)
+    # 掉线导致样本不足的窗口视为缺失
+    sparse_e = (hi_e-lo_e) < min_coverage*win_s*fs_emg
+    sparse_g = (hi_g-lo_g) < min_coverage*win_s*fs_gsr
+    if grid.size and (sparse_e | sparse_g).all():
+        raise ValueError(f"{grid.size} 个窗口均不满足 min_coverage={min_coverage} (ts_scale={ts_scale:g})，"
+                         f"请检查时间戳单位与采样率 fs_emg={fs_emg} / fs_gsr={fs_gsr}")
+    rms[sparse_e] = zcr[sparse_e] = mdf[sparse_e] = np.nan
+    slope[sparse_g] = np.nan
+    out = pd.DataFrame({'idx':lo_e,'timestamp':grid/ts_scale,'time_s':grid,'emg_rms':rms,'emg_zcr':zcr,'emg_mdf':mdf,'gsr_slope':slope})
+    if thresholds:
+        out['emg_quality'], out['gsr_quality'] = flags_e, flags_g
+    return out
+
+def features(df, fs_emg=200, fs_gsr=10, win_s=2.0, step_s=0.5, vectorized=True, align='position', ts_scale=1.0, precision='float64', quality=False):
+    # precision='float32'：信号、块内前缀和与窗口矩阵按单精度存储，窗口特征以单精度输出；
+    # 时间戳始终为 float64，按时间戳对齐时它们占峰值内存的大头，内存约为 float64 模式的 0.85 倍 (1小时会话)
+    # quality: 信号质量检查 (见 quality_thresholds)，不合格窗口不计算、不参与z分数，CEI为NaN
     import numpy as np, math, pandas as pd
-    w_emg, s_emg = int(win_s*fs_emg), int(step_s*fs_emg)
-    w_gsr, s_gsr = int(win_s*fs_gsr), int(step_s*fs_gsr)
-    emg = df['emg'].to_numpy(dtype=float)
-    gsr = df['gsr'].to_numpy(dtype=float)
+    w_emg, s_emg = window_samples(fs_emg, win_s, step_s)
+    w_gsr, s_gsr = window_samples(fs_gsr, win_s, step_s)
+    dtype = float_dtype(precision)
+    emg = df['emg'].to_numpy(dtype=dtype)
+    gsr = df['gsr'].to_numpy(dtype=dtype)
     idx_list, rms_list, slope_list = [], [], []
-    for i, seg in windowed(emg, w_emg, s_emg):
-        rms = math.sqrt(np.mean(seg**2)) if len(seg)>0 else np.nan
-        rms_list.append(rms); idx_list.append(i)
-    for i, seg in windowed(gsr, w_gsr, s_gsr):
-        if len(seg)>1:
-            x = np.arange(len(seg)); k, _ = np.polyfit(x, seg, 1)
-            slope_list.append(k)
-        else:
-            slope_list.append(np.nan)
-    n = min(len(idx_list), len(slope_list))
-    out = pd.DataFrame({'idx':idx_list[:n],'emg_rms':rms_list[:n],'gsr_slope':slope_list[:n]})
+    thresholds = quality_thresholds(quality)
+    mask_e = mask_g = None
+    if thresholds and align != 'timestamp':
+        flags_e = rolling_emg_quality(emg, w_emg, s_emg, fs_emg, include_last=True, dtype=dtype, **thresholds['emg'])
+        flags_g = rolling_gsr_quality(gsr, w_gsr, s_gsr, include_last=True, dtype=dtype, **thresholds['gsr'])
+        mask_e, mask_g = flags_e == 0, flags_g == 0
+        # 全部窗口被拒时告警 (通常是阈值与信号单位不符)
+        warn_if_all_rejected(flags_e, 'EMG')
+        warn_if_all_rejected(flags_g, 'GSR')
+    if align == 'timestamp':
+        out = aligned_windows(df, fs_emg, fs_gsr, win_s, step_s, ts_scale, precision=precision, quality=quality)
+    elif vectorized:
+        # 向量化窗口引擎；vectorized=False 回退到逐窗口参考实现
+        rms_list = rolling_rms(emg, w_emg, s_emg, include_last=True, dtype=dtype, mask=mask_e)
+        idx_list = np.arange(len(rms_list))*s_emg
+        slope_list = rolling_slope(gsr, w_gsr, s_gsr, include_last=True, dtype=dtype, mask=mask_g)
+    else:
+        for i, seg in windowed(emg, w_emg, s_emg):
+            rms = math.sqrt(np.mean(seg**2)) if len(seg)>0 else np.nan
+            rms_list.append(rms); idx_list.append(i)
+        for i, seg in windowed(gsr, w_gsr, s_gsr):
+            if len(seg)>1:
+                x = np.arange(len(seg)); k, _ = np.polyfit(x, seg, 1)
+                slope_list.append(k)
+            else:
+                slope_list.append(np.nan)
+        if thresholds:
+            rms_list = np.where(mask_e, rms_list, np.nan)
+            slope_list = np.where(mask_g, slope_list, np.nan)
+    if align != 'timestamp':
+        # 按位置配对：仅在两路采样率与时间轴一致时成立
+        n = min(len(idx_list), len(slope_list))
+        # 过零率与中值频率：同一批窗口的批量FFT
+        zcr, mdf = spectral_features(emg, idx_list[:n], w_emg, fs_emg, dtype=dtype,
+                                     mask=None if mask_e is None else mask_e[:n])
+        out = pd.DataFrame({'idx':idx_list[:n],'emg_rms':rms_list[:n],'emg_zcr':zcr,'emg_mdf':mdf,'gsr_slope':slope_list[:n]})
+        if thresholds:
+            out['emg_quality'], out['gsr_quality'] = flags_e[:n], flags_g[:n]
     out['emg_rms_z'] = (out['emg_rms']-np.nanmean(out['emg_rms']))/(np.nanstd(out['emg_rms'])+1e-8)
     out['gsr_slope_z'] = (out['gsr_slope']-np.nanmean(out['gsr_slope']))/(np.nanstd(out['gsr_slope'])+1e-8)
     out['CEI'] = 0.6*out['emg_rms_z'] + 0.4*out['gsr_slope_z']
     return out
 
-def paired_test(a, b):
-    import numpy as np, math
+def paired_test(a, b, n_resamples=0, seed=None):
+    # n_resamples>0 时效应量附 bootstrap 95% CI，另给出符号翻转置换p值 (与所选检验同一统计量)；
+    # 默认不重抽样 (Wilcoxon 的 bootstrap 每次重抽样都要重新求秩，大样本下耗时)，重抽样按 MAX_ELEMENTS 分批限制内存
+    # seed: 随机种子或 Generator，同一次分析的重抽样共用一个随机数流
+    import numpy as np
     from scipy import stats
-    a, b = np.asarray(a), np.asarray(b)
+    a, b = np.asarray(a, dtype=float), np.asarray(b, dtype=float)
     n = min(len(a), len(b))
     a, b = a[:n], b[:n]
-    if n < 5: return {'test':'NA','p':None,'effect':'NA','effect_value':None}
+    if n < 5: return {'test':'NA','p':None,'effect':'NA','effect_value':None,'effect_ci':None,'p_perm':None}
     try:
         _, p_a = stats.shapiro(a); _, p_b = stats.shapiro(b)
     except Exception:
@@ -49,14 +174,68 @@ def paired_test(a, b):
     if (p_a>0.1) and (p_b>0.1):
         t, p = stats.ttest_rel(a, b)
         d = (np.mean(a)-np.mean(b))/ (np.std(a, ddof=1)+1e-8)
-        return {'test':'paired t','p':float(p),'effect':'Cohen d','effect_value':float(d)}
+        out = {'test':'paired t','p':float(p),'effect':'Cohen d','effect_value':float(d)}
+        effect, statistic = cohens_d, t_statistic
     else:
         w, p = stats.wilcoxon(a, b)
-        z = stats.norm.ppf(min(p,1-p)) * (-1)
-        r = z / math.sqrt(n)
-        return {'test':'wilcoxon','p':float(p),'effect':'r','effect_value':float(r)}
+        # r = |z|/sqrt(n)，z 为符号秩统计量的正态近似，与 bootstrap CI 同一统计量
+        r = wilcoxon_r(a, b)
+        out = {'test':'wilcoxon','p':float(p),'effect':'r','effect_value':float(r)}
+        effect, statistic = wilcoxon_r, signed_rank_z
+    if not n_resamples:
+        return dict(out, effect_ci=None, p_perm=None)
+    rng = make_rng(seed)
+    ci = bootstrap_ci(effect, (a, b), n_resamples=n_resamples, rng=rng)
+    perm = sign_flip_test(a-b, statistic, n_resamples=n_resamples, rng=rng)
+    return dict(out, effect_ci=[ci['low'], ci['high']], p_perm=perm['p'])
+
+def subject_features(path_b, store_root, cache_root=None, cache_max_bytes=1<<30):
+    # 原始文件与参数均未变化时直接复用缓存的窗口表
+    def compute():
+        store = SessionStore(store_root)
+        b_df = store.read(ensure_imported(path_b, store), columns=['timestamp','emg','gsr'])
+        return features(b_df, **FEATURE_PARAMS)
+    if cache_root is None:
+        return compute()
+    params = dict(FEATURE_PARAMS, version=FEATURE_VERSION)
+    return FeatureCache(cache_root, cache_max_bytes).cached([path_b], params, compute)
+
+def cei_times(feat, fs_emg=200):
+    # 窗口起始时间 (秒)：按时间戳对齐时为换算后的网格时间 (time_s 列，timestamp 列为原始单位)，
+    # 按位置配对时由窗口起点下标换算
+    if 'time_s' in feat:
+        return feat['time_s'].to_numpy(dtype=float)
+    return feat['idx'].to_numpy(dtype=float)/fs_emg
 
-def demo_pipeline(data_dir="data_demo", out_dir="analysis_out"):
+def subject_cei_summary(path_b, store_root, cache_root=None, cache_max_bytes=1<<30, interventions=None, pre_s=300.0, post_s=300.0):
+    # 单个被试的 加载 + features() + 前后聚合；只返回一行汇总，供进程池使用
+    # interventions: 该被试的干预时刻 (秒，与 cei_times 同一时间轴，即换算为秒后的时间戳)；给出时取每次干预前 pre_s / 后 post_s 秒的
+    # CEI 均值再对各次干预平均，否则退化为会话首尾各取 1/4 (至多300个窗口)
+    sid = Path(path_b).stem.split('_')[0]
+    feat_b = subject_features(path_b, store_root, cache_root, cache_max_bytes)
+    if interventions is not None and len(interventions):
+        index = TimeIndex(cei_times(feat_b, FEATURE_PARAMS['fs_emg']), feat_b['CEI'])
+        q = index.pre_post(np.asarray(interventions, dtype=float), pre_s=pre_s, post_s=post_s)
+        pre, post = q['pre'], q['post']
+    else:
+        n5 = min(300, len(feat_b)//4)  # 简化：取固定窗口
+        pre, post = feat_b['CEI'][:n5], feat_b['CEI'][-n5:]
+    out = {'subject_id':sid,'B_pre':float(np.nanmean(pre)),'B_post':float(np.nanmean(post))}
+    # CEI 多分辨率金字塔随会话存放 (store/<会话>/cei_pyramid.npz)，供绘图与按时间范围的查询使用
+    pyramid = CEIPyramid.build(cei_times(feat_b, FEATURE_PARAMS['fs_emg']), feat_b['CEI'])
+    pyramid.save(Path(store_root) / Path(path_b).stem / 'cei_pyramid.npz')
+    # 启用质量检查时附带会话的合格窗口比例
+    for col in ('emg_quality', 'gsr_quality'):
+        if col in feat_b:
+            out[col.replace('quality', 'good')] = float(np.mean(feat_b[col] == 0)) if len(feat_b) else float('nan')
+    return out
+
+def demo_pipeline(data_dir="data_demo", out_dir="analysis_out", workers=None, cache_max_mb=1024, pre_s=300.0, post_s=300.0, downsample_method='lttb'):
+    # workers: 并行计算各被试CEI的进程数，None 为CPU核数，1 为单进程顺序执行
+    # cache_max_mb: 特征缓存 (data_dir/feature_cache) 的大小上限，0 表示不使用缓存
+    # data_dir/interventions.csv (subject_id, timestamp，秒) 存在时，CEI 前后比较以各次干预为锚点，窗口为 pre_s / post_s 秒
+    # (会话CSV的时间戳为其他单位时，干预时刻仍按换算后的秒给出)
+    # downsample_method: 各被试CEI曲线的降采样方法 ('lttb' / 'minmax' / None 不降采样)，点数为图宽的像素数
     Path(out_dir).mkdir(parents=True, exist_ok=True)
     if not os.path.exists(data_dir) or len(glob.glob(f"{data_dir}/*.csv"))==0:
         import numpy as np, pandas as pd
@@ -67,7 +246,7 @@ def demo_pipeline(data_dir="data_demo", out_dir="analysis_out"):
                 n = 2000
                 emg = rng.normal(0.2 if cond=='A' else 0.15, 0.05, size=n)
                 gsr = rng.normal(0.1 if cond=='A' else 0.08, 0.02, size=n)
-                ts = np.arange(n)
+                ts = np.arange(n)/200  # 秒
                 df = pd.DataFrame({'timestamp':ts,'emg':emg,'gsr':gsr,'subject_id':f"S{sid:02d}",'condition':cond})
                 df.to_csv(f"{data_dir}/S{sid:02d}_{cond}.csv", index=False)
         pd.DataFrame({
@@ -79,7 +258,7 @@ def demo_pipeline(data_dir="data_demo", out_dir="analysis_out"):
     import pandas as pd, numpy as np, matplotlib.pyplot as plt, json
     fdf = pd.read_csv(f"{data_dir}/focus_minutes.csv")
     a, b = fdf['focus_min_A'].values, fdf['focus_min_B'].values
-    test = paired_test(b, a)
+    test = paired_test(b, a, n_resamples=10000)
     plt.figure()
     for ai,bi in zip(a,b):
         plt.plot([0,1],[ai,bi], marker='o')
@@ -91,19 +270,26 @@ def demo_pipeline(data_dir="data_demo", out_dir="analysis_out"):
     with open(f"{out_dir}/focus_minutes_stats.json","w") as f:
         json.dump(test, f, indent=2)
 
-    # CEI 前后
-    import glob
-    rows = []
-    for pathA in glob.glob(f"{data_dir}/*_A*.csv"):
-        sid = Path(pathA).stem.split('_')[0]
-        a_df = pd.read_csv(pathA)
-        b_df = pd.read_csv(pathA.replace('_A','_B'))
-        feat_b = features(b_df)
-        n5 = min(300, len(feat_b)//4)  # 简化：取固定窗口
-        pre, post = feat_b['CEI'][:n5], feat_b['CEI'][-n5:]
-        rows.append({'subject_id':sid,'B_pre':np.nanmean(pre),'B_post':np.nanmean(post)})
+    # CEI 前后 (CSV首次使用时导入列式会话存储，之后直接读取二进制列)
+    # 各被试在独立进程中计算，按被试顺序合并结果
+    store_root = f"{data_dir}/store"
+    cache_root = f"{data_dir}/feature_cache" if cache_max_mb else None
+    paths_b = [p.replace('_A','_B') for p in sorted(glob.glob(f"{data_dir}/*_A*.csv"))]
+    anchors = {}
+    if os.path.exists(f"{data_dir}/interventions.csv"):
+        idf = pd.read_csv(f"{data_dir}/interventions.csv")
+        anchors = {sid: g['timestamp'].to_numpy(dtype=float) for sid, g in idf.groupby(idf['subject_id'].astype(str))}
+    subject_anchors = [anchors.get(Path(p).stem.split('_')[0]) for p in paths_b]
+    extra = [[store_root]*len(paths_b), [cache_root]*len(paths_b), [cache_max_mb*(1<<20)]*len(paths_b),
+             subject_anchors, [pre_s]*len(paths_b), [post_s]*len(paths_b)]
+    if workers == 1 or len(paths_b) <= 1:
+        rows = list(map(subject_cei_summary, paths_b, *extra))
+    else:
+        from concurrent.futures import ProcessPoolExecutor
+        with ProcessPoolExecutor(max_workers=workers) as pool:
+            rows = list(pool.map(subject_cei_summary, paths_b, *extra))
     ddf = pd.DataFrame(rows)
-    test2 = paired_test(ddf['B_post'], ddf['B_pre'])
+    test2 = paired_test(ddf['B_post'], ddf['B_pre'], n_resamples=10000)
     plt.figure()
     for pre,post in zip(ddf['B_pre'], ddf['B_post']):
         plt.plot([0,1],[pre,post], marker='o')
@@ -115,5 +301,20 @@ def demo_pipeline(data_dir="data_demo", out_dir="analysis_out"):
     with open(f"{out_dir}/cei_change_within_B_stats.json","w") as f:
         json.dump(test2, f, indent=2)
 
+    # 各被试B会话的CEI曲线 (subject_cei_summary 保存的金字塔中点数不少于像素宽度的最粗一层，区间均值再降采样)
+    fig, ax = plt.subplots()
+    budget = point_budget(ax)
+    for p in paths_b:
+        pyramid = CEIPyramid.load(Path(store_root) / Path(p).stem / 'cei_pyramid.npz')
+        source = pyramid.query(max_points=budget, level=pyramid.source_level(budget))
+        t, cei = downsample(source['time'], source['mean'], budget, downsample_method)
+        ax.plot(t, cei, linewidth=0.8, label=Path(p).stem.split('_')[0])
+    ax.set_xlabel('Time (s)')
+    ax.set_ylabel('Composite Embodied Index (CEI, mean)')
+    ax.set_title('CEI time series in B (nudge) sessions')
+    ax.legend()
+    plt.tight_layout()
+    plt.savefig(f"{out_dir}/cei_timeseries_B.pdf"); plt.close()
+
 if __name__ == "__main__":
     demo_pipeline()
@@ -0,0 +1,206 @@
+#!/usr/bin/env python3
+"""
+GestureFlow ABAB单被试设计的随机化检验
+每名参与者的测量序列 (如逐日专注时长、逐时段CEI) 划分为 A-B-A-B 四个阶段，
+可行的阶段切换方案 = 每阶段至少 min_phase 个测量点的全部切分；
+全部方案的统计量由前缀和一次向量化求出，方案过多时均匀抽样。
+跨参与者合并：以各参与者统计量之和为合并统计量，其随机化分布由各自方案独立组合得到
+"""
+
+from math import comb
+
+import numpy as np
+
+from resampling import make_rng
+
+# 单名参与者枚举方案数的上限，超出时改为抽样
+MAX_SCHEDULES = 100_000
+
+
+def schedule_count(n_points, n_phases=4, min_phase=1):
+    """可行的阶段切换方案数 (隔板法：C(剩余点数 + 阶段数 - 1, 阶段数 - 1))"""
+    spare = n_points - n_phases * min_phase
+    if spare < 0:
+        return 0
+    return comb(spare + n_phases - 1, n_phases - 1)
+
+
+def _combinations(n, k):
+    """n 个元素中取 k 个的全部递增组合 (行数 C(n, k) × k)，逐列向量化展开"""
+    rows = np.arange(n, dtype=np.int64)[:, None]
+    for _ in range(k - 1):
+        last = rows[:, -1]
+        counts = np.maximum(n - 1 - last, 0)
+        parent = np.repeat(np.arange(len(rows)), counts)
+        offsets = np.arange(counts.sum()) - np.repeat(np.cumsum(counts) - counts, counts)
+        rows = np.column_stack([rows[parent], last[parent] + 1 + offsets])
+    return rows if k > 0 else np.empty((1, 0), dtype=np.int64)
+
+
+def _sample_combinations(n, k, size, rng):
+    """从 n 个元素中均匀抽取 size 个 k 元递增组合 (有放回抽样后剔除含重复元素的行)"""
+    out = np.empty((0, k), dtype=np.int64)
+    while len(out) < size:
+        draw = np.sort(rng.integers(0, n, size=(2 * (size - len(out)) + 16, k)), axis=1)
+        ok = np.all(np.diff(draw, axis=1) > 0, axis=1)
+        out = np.concatenate([out, draw[ok]])
+    return out[:size]
+
+
+def enumerate_schedules(n_points, n_phases=4, min_phase=1, max_schedules=MAX_SCHEDULES, rng=None):
+    """
+    阶段切换点矩阵
+    隔板位置 p_1 < ... < p_{k} 对应切换点 c_j = j * min_phase + p_j - (j - 1)
+    Args:
+        n_points: 测量点数
+        n_phases: 阶段数 (ABAB 为4)
+        min_phase: 每阶段最少测量点数
+        max_schedules: 方案数超过该值时均匀抽样
+        rng: 抽样使用的随机数流
+    Returns:
+        (切换点矩阵 [方案数 × (n_phases-1)], 是否完整枚举)
+    """
+    total = schedule_count(n_points, n_phases, min_phase)
+    if total == 0:
+        raise ValueError(f"{n_points} 个测量点不足以划分 {n_phases} 个至少 {min_phase} 点的阶段")
+    k = n_phases - 1
+    n_slots = n_points - n_phases * min_phase + k
+    if total <= max_schedules:
+        bars, exact = _combinations(n_slots, k), True
+    else:
+        bars, exact = _sample_combinations(n_slots, k, max_schedules, make_rng(rng)), False
+    j = np.arange(1, k + 1)
+    return j * min_phase + bars - (j - 1), exact
+
+
+def schedule_statistics(values, change_points, statistic='mean_diff'):
+    """
+    全部方案的 B - A 统计量 (阶段按 A/B 交替，首阶段为A)，NaN测量点不计入
+    Args:
+        values: 测量序列
+        change_points: enumerate_schedules 给出的切换点矩阵
+        statistic: 'mean_diff' 为 B点均值 - A点均值；'phase_mean_diff' 为 B阶段均值的均值 - A阶段均值的均值
+    Returns:
+        每个方案的统计量数组
+    """
+    y = np.asarray(values, dtype=np.float64)
+    valid = ~np.isnan(y)
+    csum = np.concatenate([[0.0], np.cumsum(np.where(valid, y, 0.0))])
+    ccount = np.concatenate([[0], np.cumsum(valid)])
+    n_sched = len(change_points)
+    bounds = np.column_stack([np.zeros(n_sched, dtype=np.int64), change_points,
+                              np.full(n_sched, len(y), dtype=np.int64)])
+    sums = csum[bounds[:, 1:]] - csum[bounds[:, :-1]]
+    counts = ccount[bounds[:, 1:]] - ccount[bounds[:, :-1]]
+    is_b = np.arange(sums.shape[1]) % 2 == 1
+
+    with np.errstate(invalid='ignore', divide='ignore'):
+        if statistic == 'mean_diff':
+            mean_b = sums[:, is_b].sum(axis=1) / counts[:, is_b].sum(axis=1)
+            mean_a = sums[:, ~is_b].sum(axis=1) / counts[:, ~is_b].sum(axis=1)
+            return mean_b - mean_a
+        if statistic == 'phase_mean_diff':
+            phase_means = sums / counts
+            return np.nanmean(phase_means[:, is_b], axis=1) - np.nanmean(phase_means[:, ~is_b], axis=1)
+    raise ValueError(f"未知的统计量: {statistic}")
+
+
+def observed_change_points(conditions, n_phases=4):
+    """
+    由实际的条件序列 (如 'AABBBAABB' 或 ['A', 'B', ...]) 得到切换点
+    Raises:
+        ValueError: 序列不是从A开始、恰好 n_phases 段交替的设计
+    """
+    labels = np.asarray(list(conditions) if isinstance(conditions, str) else conditions).astype(str)
+    changes = np.flatnonzero(labels[1:] != labels[:-1]) + 1
+    if len(labels) == 0 or labels[0] != 'A' or len(changes) != n_phases - 1:
+        raise ValueError(f"条件序列不是从A开始的 {n_phases} 阶段交替设计: {''.join(labels)}")
+    return changes
+
+
+def _p_value(null, observed, alternative, exact):
+    """随机化p值；完整枚举时分布已包含实际方案，抽样时按 (k+1)/(B+1)；观测统计量或零分布无效时为NaN"""
+    null = null[np.isfinite(null)]
+    if not np.isfinite(observed) or null.size == 0:
+        return float('nan')
+    tol = 1e-12 * max(abs(observed), 1.0)
+    if alternative == 'greater':
+        extreme = np.sum(null >= observed - tol)
+    elif alternative == 'less':
+        extreme = np.sum(null <= observed + tol)
+    elif alternative == 'two-sided':
+        extreme = np.sum(np.abs(null) >= abs(observed) - tol)
+    else:
+        raise ValueError(f"未知的备择假设: {alternative}")
+    if exact:
+        return float(extreme / len(null))
+    return float((extreme + 1) / (len(null) + 1))
+
+
+def abab_randomization_test(participants, min_phase=1, statistic='mean_diff', alternative='two-sided',
+                            n_resamples=10000, max_schedules=MAX_SCHEDULES, seed=None):
+    """
+    多名参与者ABAB设计的随机化检验
+    Args:
+        participants: {参与者ID: (测量序列, 条件序列)}，条件序列与测量序列等长，取值 'A'/'B'
+        min_phase: 每阶段最少测量点数
+        statistic: 见 schedule_statistics
+        alternative: 'two-sided' / 'greater' (B > A) / 'less' (B < A)
+        n_resamples: 合并分布的抽样次数；全部组合数不超过该值时完整枚举
+        max_schedules: 单名参与者枚举方案数的上限
+        seed: 随机种子；本次分析的全部抽样共用一个随机数流
+    Returns:
+        {'participants': {ID: {'observed', 'p', 'n_schedules', 'exact'}},
+         'combined': {'observed', 'p', 'n_resamples', 'exact', 'n_participants'}}；
+        统计量无法计算的参与者 (如A阶段全为NaN) observed / p 为NaN，不计入合并统计量；
+        没有可用参与者时 combined 为 None
+    """
+    rng = make_rng(seed)
+    per_participant, nulls, observed_total = {}, [], 0.0
+    for pid, (values, conditions) in participants.items():
+        values = np.asarray(values, dtype=np.float64)
+        if len(conditions) != len(values):
+            raise ValueError(f"参与者 {pid} 的条件序列与测量序列长度不一致")
+        actual = observed_change_points(conditions)
+        if np.min(np.diff(np.concatenate([[0], actual, [len(values)]]))) < min_phase:
+            raise ValueError(f"参与者 {pid} 的实际方案有阶段短于 min_phase={min_phase}")
+        schedules, exact = enumerate_schedules(len(values), 4, min_phase, max_schedules, rng)
+        null = schedule_statistics(values, schedules, statistic)
+        observed = float(schedule_statistics(values, actual[None, :], statistic)[0])
+        per_participant[pid] = {
+            'observed': observed,
+            'p': _p_value(null, observed, alternative, exact),
+            'n_schedules': schedule_count(len(values), 4, min_phase),
+            'exact': exact,
+        }
+        null = null[np.isfinite(null)]
+        if np.isnan(per_participant[pid]['p']):
+            continue
+        nulls.append(null)
+        observed_total += observed
+
+    if not nulls:
+        return {'participants': per_participant, 'combined': None}
+
+    # 合并分布：各参与者独立取一个方案，统计量相加
+    combinations = np.prod([float(len(n)) for n in nulls])
+    exact = bool(all(v['exact'] for v in per_participant.values() if not np.isnan(v['p']))
+                 and combinations <= n_resamples)
+    if exact:
+        combined = np.zeros(1)
+        for null in nulls:
+            combined = (combined[:, None] + null[None, :]).ravel()
+    else:
+        combined = np.zeros(n_resamples)
+        for null in nulls:
+            combined += null[rng.integers(0, len(null), size=n_resamples)]
+    return {
+        'participants': per_participant,
+        'combined': {
+            'observed': observed_total,
+            'p': _p_value(combined, observed_total, alternative, exact),
+            'n_resamples': len(combined),
+            'exact': exact,
+            'n_participants': len(nulls),
+        },
+    }
@@ -0,0 +1,191 @@
+#!/usr/bin/env python3
+"""
+GestureFlow 在线基线跟踪
+长时间佩戴时电极接触变化使 EMG 幅值缓慢漂移 (增益漂移)，固定的校准参数逐渐失准。
+BaselineTracker 随窗口特征流入增量更新归一化参数，每个窗口 O(1)：
+    - 静息窗口 (归一化水平 ≤ rest_band) 上的慢速 EWMA 跟踪静息均值，握拳均值按漂移模型随之平移/缩放
+    - 检测到协议中的 "3 次握拳-放松" 重置动作时，以该动作中的握拳/放松窗口重新校准
+"""
+
+import numpy as np
+from scipy.signal import lfilter
+
+# 跟踪的归一化参数 (与 CALIBRATION_COLUMNS 的前四列一致)
+TRACKED = ['emg_rest_mean', 'emg_grip_mean', 'gsr_rest_mean', 'gsr_grip_mean']
+
+
+def _ewma(values, alpha, state):
+    """y_k = α x_k + (1-α) y_{k-1}，y_{-1} = state；lfilter 逐点递推 (每点 O(1))"""
+    if len(values) == 0:
+        return values
+    return lfilter([alpha], [1.0, alpha - 1.0], values, zi=[(1.0 - alpha) * state])[0]
+
+
+def _runs(states):
+    """游程编码：(起点, 终点(不含), 状态)"""
+    if len(states) == 0:
+        empty = np.empty(0, dtype=np.int64)
+        return empty, empty, states
+    change = np.flatnonzero(states[1:] != states[:-1]) + 1
+    starts = np.concatenate([[0], change])
+    ends = np.concatenate([change, [len(states)]])
+    return starts, ends, states[starts]
+
+
+def _shifted(flags, k):
+    """flags 向后平移 k 位 (前端补 False)，即 out[j] = flags[j - k]"""
+    out = np.zeros(len(flags), dtype=bool)
+    if k < len(flags):
+        out[k:] = flags[:len(flags) - k]
+    return out
+
+
+class BaselineTracker:
+    """
+    CEI 归一化参数的在线跟踪器
+    跨多次 update 调用保持状态，可逐块 (分块会话或多个会话依次) 输入窗口特征
+    """
+
+    def __init__(self, calibration, step_s=0.5, halflife_s=300.0, rest_band=0.15, grip_band=0.6,
+                 emg_drift='gain', cycles=3, grip_s=(1.0, 10.0), release_s=(1.0, 10.0)):
+        """
+        Args:
+            calibration: 初始校准参数 (load_calibration_data 的结果，含 TRACKED 中的键)
+            step_s: 相邻窗口的时间间隔 (秒)
+            halflife_s: 静息基线 EWMA 的半衰期 (按静息窗口累计的时间计)
+            rest_band: 归一化EMG水平不超过该值的窗口视为静息，参与基线更新
+            grip_band: 归一化EMG水平不低于该值的窗口视为握拳
+            emg_drift: 'gain' 握拳/静息比例不变 (增益漂移)；'offset' 握拳-静息差值不变 (偏移漂移)。
+                GSR 斜率的静息值接近0，始终按偏移处理
+            cycles: 重置动作的握拳-放松次数
+            grip_s: 单次握拳的持续时间范围 (秒)
+            release_s: 两次握拳之间放松的持续时间范围 (秒)
+        """
+        if emg_drift not in ('gain', 'offset'):
+            raise ValueError(f"未知的漂移模型: {emg_drift}")
+        self.calibration = {k: float(np.ravel(calibration[k])[0]) for k in TRACKED}
+        self.step_s = step_s
+        self.alpha = 1.0 - 0.5 ** (step_s / halflife_s)
+        self.rest_band = rest_band
+        self.grip_band = grip_band
+        self.emg_drift = emg_drift
+        self.cycles = cycles
+        self.grip_windows = (grip_s[0] / step_s, grip_s[1] / step_s)
+        self.release_windows = (release_s[0] / step_s, release_s[1] / step_s)
+        # 检测重置动作需保留的历史窗口数 (有界)
+        self.span = int(np.ceil(cycles * (grip_s[1] + release_s[1]) / step_s)) + 1
+        self._history = (np.empty(0), np.empty(0))
+        self._set_spans()
+        self.n_windows = 0
+        self.resets = []
+
+    def _set_spans(self):
+        """记录当前校准下握拳相对静息的比例/差值，供漂移跟踪时保持"""
+        cal = self.calibration
+        self._emg_ratio = cal['emg_grip_mean'] / cal['emg_rest_mean'] if cal['emg_rest_mean'] > 0 else None
+        self._emg_span = cal['emg_grip_mean'] - cal['emg_rest_mean']
+        self._gsr_span = cal['gsr_grip_mean'] - cal['gsr_rest_mean']
+
+    def level(self, emg_rms):
+        """当前校准下的归一化EMG水平 (不截断)"""
+        cal = self.calibration
+        span = cal['emg_grip_mean'] - cal['emg_rest_mean']
+        return (np.asarray(emg_rms, dtype=np.float64) - cal['emg_rest_mean']) / (span if span != 0 else 1e-12)
+
+    def update(self, emg_rms, gsr_slope):
+        """
+        输入一段新窗口的特征，更新跟踪状态
+        Args:
+            emg_rms: EMG窗口RMS
+            gsr_slope: 与EMG窗口对齐的GSR斜率 (NaN窗口不参与更新)
+        Returns:
+            {参数名: 数组}，每个窗口生效的归一化参数 (只依赖该窗口及之前的数据)
+        """
+        emg = np.asarray(emg_rms, dtype=np.float64)
+        gsr = np.asarray(gsr_slope, dtype=np.float64)
+        n = len(emg)
+        out = {k: np.empty(n) for k in TRACKED}
+        start = 0
+        while start < n:
+            found = self._find_reset(emg[start:], gsr[start:])
+            stop = n if found is None else start + found[0]
+            self._track(emg[start:stop], gsr[start:stop], out, start)
+            if found is not None:
+                self.calibration.update(found[1])
+                self._set_spans()
+                self.resets.append(self.n_windows)
+                # 重置动作已使用，不再参与后续检测
+                self._history = (np.empty(0), np.empty(0))
+            start = stop
+        return out
+
+    def _track(self, emg, gsr, out, offset):
+        """静息窗口上的 EWMA；每个窗口取截至该窗口的最新基线"""
+        n = len(emg)
+        if n == 0:
+            return
+        cal = self.calibration
+        rest = self.level(emg) <= self.rest_band
+        for name, values, span in (('emg', emg, self._emg_span), ('gsr', gsr, self._gsr_span)):
+            sel = rest & np.isfinite(values)
+            state = cal[f'{name}_rest_mean']
+            smoothed = _ewma(values[sel], self.alpha, state)
+            latest = np.cumsum(sel) - 1
+            baseline = smoothed[np.maximum(latest, 0)] if smoothed.size else np.full(n, state)
+            baseline = np.where(latest >= 0, baseline, state)
+            out[f'{name}_rest_mean'][offset:offset + n] = baseline
+            if name == 'emg' and self.emg_drift == 'gain' and self._emg_ratio is not None:
+                out['emg_grip_mean'][offset:offset + n] = baseline * self._emg_ratio
+            else:
+                out[f'{name}_grip_mean'][offset:offset + n] = baseline + span
+        for k in TRACKED:
+            cal[k] = float(out[k][offset + n - 1])
+
+        hist_e, hist_g = self._history
+        self._history = (np.concatenate([hist_e, emg])[-self.span:], np.concatenate([hist_g, gsr])[-self.span:])
+        self.n_windows += n
+
+    def _find_reset(self, emg, gsr):
+        """
+        在 历史窗口 + 新窗口 中查找完成于新窗口内的首个握拳-放松重置动作
+        Returns:
+            None，或 (重置生效的窗口下标 (相对新窗口), 新的校准参数)
+        """
+        hist_e, hist_g = self._history
+        buf_e = np.concatenate([hist_e, emg])
+        buf_g = np.concatenate([hist_g, gsr])
+        level = self.level(buf_e)
+        # 0 放松 / 1 握拳 / 2 缺失或中间水平 (打断动作序列)
+        states = np.full(len(buf_e), 2, dtype=np.int8)
+        states[level >= self.grip_band] = 1
+        states[level <= self.rest_band] = 0
+        starts, ends, run_state = _runs(states)
+        if len(starts) < 2 * self.cycles:
+            return None
+
+        length = ends - starts
+        grip = (run_state == 1) & (length >= self.grip_windows[0]) & (length <= self.grip_windows[1])
+        release = (run_state == 0) & (length >= self.release_windows[0]) & (length <= self.release_windows[1])
+        # 以第 j 段结束的动作：j, j-2, ... 为握拳段，其间为放松段
+        pattern = grip.copy()
+        for c in range(1, self.cycles):
+            pattern &= _shifted(release, 2 * c - 1) & _shifted(grip, 2 * c)
+        # 动作在新窗口内完成，且随后已进入放松
+        followed = np.concatenate([run_state[1:] == 0, [False]])
+        for j in np.flatnonzero(pattern & followed & (ends >= len(hist_e))):
+            first = j - 2 * (self.cycles - 1)
+            in_grip = np.zeros(len(buf_e), dtype=bool)
+            in_release = np.zeros(len(buf_e), dtype=bool)
+            for r in range(first, j + 1):
+                (in_grip if run_state[r] == 1 else in_release)[starts[r]:ends[r]] = True
+            new = {'emg_rest_mean': float(np.mean(buf_e[in_release])),
+                   'emg_grip_mean': float(np.mean(buf_e[in_grip]))}
+            if new['emg_grip_mean'] <= new['emg_rest_mean']:
+                continue
+            # GSR 在动作中没有有效斜率或未随握拳升高时保留原参数
+            g_rest, g_grip = buf_g[in_release], buf_g[in_grip]
+            if np.isfinite(g_rest).any() and np.isfinite(g_grip).any() and np.nanmean(g_grip) > np.nanmean(g_rest):
+                new['gsr_rest_mean'] = float(np.nanmean(g_rest))
+                new['gsr_grip_mean'] = float(np.nanmean(g_grip))
+            return int(ends[j] - len(hist_e)), new
+        return None
@@ -0,0 +1,199 @@
+#!/usr/bin/env python3
+"""
+GestureFlow 行为指标
+协议中的两项行为指标，在已排序的事件数组上以游程编码 + 二分查找计算：
+    - 中断恢复时间：离开主任务应用 (切到其他应用或失焦) 到重新聚焦主任务的秒数
+    - 击键突发长度：相邻击键间隔不超过 max_gap 的连续击键数
+behavior_on_grid 把指标汇总到与 CEI 相同的时间窗口网格上
+"""
+
+import numpy as np
+import pandas as pd
+
+from window_engine import grid_bounds
+
+# 相邻击键间隔超过该值 (秒) 即为新的突发
+MAX_KEY_GAP = 2.0
+
+
+def _sorted_events(events):
+    """事件 DataFrame (或 dict 列表)，按时间戳稳定排序；缺少可选的 app 列时 (如只有击键的日志) 补为NaN"""
+    table = events if isinstance(events, pd.DataFrame) else pd.DataFrame(list(events))
+    if table.empty:
+        return table.reindex(columns=['timestamp', 'type', 'app'])
+    if 'app' not in table.columns:
+        table = table.assign(app=np.nan)
+    ts = table['timestamp'].to_numpy(dtype=np.float64)
+    if np.any(ts[1:] < ts[:-1]):
+        table = table.iloc[np.argsort(ts, kind='stable')]
+    return table
+
+
+def _split_events(events, key_type='key'):
+    """
+    事件类型只做一次因子化，拆分为窗口事件与击键；没有应用的 focus 事件不计为切换
+    Returns:
+        ((focus/blur 时间戳, 是否 focus, 应用), 击键时间戳)
+    """
+    codes, labels = pd.factorize(events['type'])
+    lookup = {label: i for i, label in enumerate(labels)}
+    is_focus = (codes == lookup.get('focus', -2)) & events['app'].notna().to_numpy()
+    window = is_focus | (codes == lookup.get('blur', -2))
+    t = events['timestamp'].to_numpy(dtype=np.float64)
+    rows = np.flatnonzero(window)
+    app = events['app'].iloc[rows].to_numpy(dtype=object)
+    return (t[rows], is_focus[rows], app), t[codes == lookup.get(key_type, -2)]
+
+
+def main_app(events):
+    """主任务应用：累计聚焦时间最长的应用 (每次 focus 持续到下一条 focus/blur 事件)"""
+    return _main_app(*_split_events(_sorted_events(events))[0])
+
+
+def _main_app(t, is_focus, app):
+    if not is_focus.any():
+        return None
+    held = np.diff(t, append=t[-1])
+    totals = pd.Series(held[is_focus]).groupby(app[is_focus]).sum()
+    return totals.idxmax()
+
+
+def interruptions(events, main=None):
+    """
+    主任务的中断及恢复时间
+    Args:
+        events: 事件 DataFrame 或 dict 列表 (列 timestamp / type / app)
+        main: 主任务应用，None 时取 main_app
+    Returns:
+        DataFrame：start (离开主任务) / end (返回主任务) / recovery (秒) / app (中断时聚焦的应用，失焦为 None)；
+        会话结束仍未返回的中断 end / recovery 为 NaN
+    """
+    return _interruptions(*_split_events(_sorted_events(events))[0], main)
+
+
+def _interruptions(t, is_focus, app, main=None):
+    if main is None:
+        main = _main_app(t, is_focus, app)
+    on_main = is_focus & (app == main)
+    # 状态变化处即游程边界：True→False 为中断开始，False→True 为返回
+    change = np.flatnonzero(on_main[1:] != on_main[:-1]) + 1
+    leave = change[~on_main[change]]
+    back = change[on_main[change]]
+    # 每次中断之后的首次返回 (二分查找)
+    k = np.searchsorted(back, leave)
+    returned = k < len(back)
+    end = np.full(len(leave), np.nan)
+    end[returned] = t[back[k[returned]]]
+    return pd.DataFrame({
+        'start': t[leave],
+        'end': end,
+        'recovery': end - t[leave],
+        'app': np.where(is_focus[leave], app[leave], None),
+    })
+
+
+def keystroke_bursts(key_times, max_gap=MAX_KEY_GAP):
+    """
+    击键突发
+    Args:
+        key_times: 击键时间戳 (秒，递增)
+        max_gap: 突发内相邻击键的最大间隔
+    Returns:
+        DataFrame：start / end / keys (突发长度，击键数) / duration
+    """
+    t = np.asarray(key_times, dtype=np.float64)
+    if t.size == 0:
+        return pd.DataFrame({'start': t, 'end': t, 'keys': np.empty(0, dtype=np.int64), 'duration': t})
+    first = np.flatnonzero(np.r_[True, np.diff(t) > max_gap])
+    last = np.r_[first[1:] - 1, t.size - 1]
+    return pd.DataFrame({
+        'start': t[first],
+        'end': t[last],
+        'keys': last - first + 1,
+        'duration': t[last] - t[first],
+    })
+
+
+def _window_mean(values, lo, hi):
+    """各窗口内 (按开始时刻归属) 有效值的均值，没有有效值为NaN"""
+    valid = ~np.isnan(values)
+    csum = np.concatenate([[0.0], np.cumsum(np.where(valid, values, 0.0))])
+    ccount = np.concatenate([[0], np.cumsum(valid)])
+    count = ccount[hi] - ccount[lo]
+    with np.errstate(invalid='ignore', divide='ignore'):
+        return np.where(count > 0, (csum[hi] - csum[lo]) / count, np.nan)
+
+
+def _covered(starts, ends, t):
+    """不相交区间 [start, end) 在 (-inf, t] 内的累计长度 (区间按开始时刻排序)"""
+    if starts.size == 0:
+        return np.zeros(len(t))
+    lengths = ends - starts
+    before = np.concatenate([[0.0], np.cumsum(lengths)])
+    # 开始于 t 及之前的最后一个区间 j：之前的区间全部计入，区间 j 计入到 t 为止
+    k = np.searchsorted(starts, t, side='right')
+    j = np.maximum(k - 1, 0)
+    return before[j] + np.where(k > 0, np.clip(t - starts[j], 0.0, lengths[j]), 0.0)
+
+
+def behavior_on_grid(grid, win, interrupts=None, bursts=None, key_times=None, session_end=None):
+    """
+    行为指标在时间窗口网格上的汇总 (网格同 aligned_windows 的 timestamp 列 / compute_cei 的窗口)
+    Args:
+        grid: 窗口起始时间数组 (秒)
+        win: 窗口长度 (秒)
+        interrupts: interruptions 的结果
+        bursts: keystroke_bursts 的结果
+        key_times: 击键时间戳
+        session_end: 未返回的中断视为持续到该时刻，None 时取网格末端
+    Returns:
+        DataFrame：timestamp / keystrokes / bursts / burst_keys (窗口内开始的突发的平均长度) /
+        interruptions / recovery (窗口内开始的中断的平均恢复时间) / away_fraction (窗口内离开主任务的时间比例)
+    """
+    grid = np.asarray(grid, dtype=np.float64)
+    out = pd.DataFrame({'timestamp': grid})
+    if key_times is not None:
+        lo, hi = grid_bounds(key_times, grid, win)
+        out['keystrokes'] = hi - lo
+    if bursts is not None:
+        starts = bursts['start'].to_numpy(dtype=np.float64)
+        lo, hi = grid_bounds(starts, grid, win)
+        out['bursts'] = hi - lo
+        out['burst_keys'] = _window_mean(bursts['keys'].to_numpy(dtype=np.float64), lo, hi)
+    if interrupts is not None:
+        starts = interrupts['start'].to_numpy(dtype=np.float64)
+        lo, hi = grid_bounds(starts, grid, win)
+        out['interruptions'] = hi - lo
+        out['recovery'] = _window_mean(interrupts['recovery'].to_numpy(dtype=np.float64), lo, hi)
+        if session_end is None:
+            session_end = grid[-1] + win if grid.size else 0.0
+        ends = np.where(np.isnan(interrupts['end'].to_numpy(dtype=np.float64)), max(session_end, 0.0),
+                        interrupts['end'].to_numpy(dtype=np.float64))
+        ends = np.maximum(ends, starts)
+        out['away_fraction'] = (_covered(starts, ends, grid + win) - _covered(starts, ends, grid)) / win
+    return out
+
+
+def behavior_metrics(events, grid, win, main=None, key_type='key', max_gap=MAX_KEY_GAP):
+    """
+    从一条事件流计算全部行为指标并汇总到时间网格
+    Args:
+        events: 事件 DataFrame 或 dict 列表；focus/blur 为窗口事件，type == key_type 的行为击键
+        grid: 窗口起始时间数组 (秒)
+        win: 窗口长度 (秒)
+        main: 主任务应用，None 时取 main_app
+        key_type: 击键事件的 type
+        max_gap: 见 keystroke_bursts
+    Returns:
+        {'interruptions': ..., 'bursts': ..., 'grid': behavior_on_grid 的结果}
+    """
+    events = _sorted_events(events)
+    window, key_times = _split_events(events, key_type)
+    interrupts = _interruptions(*window, main)
+    bursts = keystroke_bursts(key_times, max_gap)
+    session_end = float(events['timestamp'].iloc[-1]) if len(events) else None
+    return {
+        'interruptions': interrupts,
+        'bursts': bursts,
+        'grid': behavior_on_grid(grid, win, interrupts, bursts, key_times, session_end),
+    }
@@ -0,0 +1,290 @@
+#!/usr/bin/env python3
+"""
+GestureFlow CEI信号处理流程基准测试
+生成确定性的合成EMG/GSR会话 (1分钟 ~ 24小时)，逐阶段计时并记录峰值内存，
+与基线文件对比，超过阈值的变慢/内存增长标记为回归；
+--precision float64 float32 同时运行两种计算精度，报告单精度相对双精度的峰值内存比与误差；
+流式CEI (StreamingCEI 回放 + finalize) 与批处理 features() 的误差超过 STREAM_TOLERANCE 时同样判为失败
+
+用法:
+    python scripts/benchmark_cei_pipeline.py                     # 1min ~ 1h
+    python scripts/benchmark_cei_pipeline.py --max-hours 24
+    python scripts/benchmark_cei_pipeline.py --update-baseline   # 写入新基线
+    python scripts/benchmark_cei_pipeline.py --precision float64 float32
+"""
+
+import argparse
+import importlib.util
+import json
+import platform
+import sys
+import time
+import tracemalloc
+from pathlib import Path
+
+import numpy as np
+import pandas as pd
+
+from compute_cei_and_stats import GestureFlowAnalyzer
+from cei_streaming import StreamingCEI
+
+ROOT = Path(__file__).resolve().parent.parent
+DEFAULT_BASELINE = ROOT / 'benchmarks' / 'cei_pipeline_baseline.json'
+
+# 会话时长 (秒)
+SESSION_SIZES = {
+    '1min': 60,
+    '10min': 600,
+    '1h': 3600,
+    '6h': 6 * 3600,
+    '24h': 24 * 3600,
+}
+
+FS_EMG = 200
+FS_GSR = 10
+
+# 流式CEI finalize 后相对批处理CEI允许的最大绝对误差
+STREAM_TOLERANCE = 1e-6
+
+
+def load_root_pipeline():
+    """按路径加载仓库根目录的 compute_cei_and_stats.py (features / paired_test)，避免与本目录同名模块冲突"""
+    spec = importlib.util.spec_from_file_location('cei_pipeline', ROOT / 'compute_cei_and_stats.py')
+    module = importlib.util.module_from_spec(spec)
+    spec.loader.exec_module(module)
+    return module
+
+
+def synthetic_session(duration_s, seed=0):
+    """
+    生成确定性的合成会话
+    Args:
+        duration_s: 时长 (秒)
+        seed: 随机种子
+    Returns:
+        (emg, gsr)：200Hz EMG (含肌肉激活片段) 与 10Hz GSR (含漂移与皮电反应)
+    """
+    rng = np.random.default_rng(seed)
+    n_emg = int(duration_s * FS_EMG)
+    n_gsr = int(duration_s * FS_GSR)
+
+    envelope = 0.05 + 0.15 * (np.sin(2 * np.pi * np.arange(n_emg) / (FS_EMG * 90.0)) > 0.6)
+    emg = rng.normal(0.0, 1.0, n_emg) * envelope
+
+    t = np.arange(n_gsr) / FS_GSR
+    gsr = 2.0 + 0.2 * np.sin(2 * np.pi * t / 1800.0) + 0.002 * np.cumsum(rng.normal(0, 1, n_gsr))
+    onsets = rng.choice(n_gsr, size=max(1, n_gsr // (FS_GSR * 20)), replace=False)
+    response = 0.1 * (1 - np.exp(-np.arange(60) / 3.0)) * np.exp(-np.arange(60) / 20.0)
+    for onset in onsets:
+        seg = gsr[onset:onset + 60]
+        seg += response[:len(seg)]
+    return emg, gsr
+
+
+def session_frame(emg, gsr):
+    """合成会话的长表 (与CSV会话相同的列)，供 features(align='timestamp') 使用"""
+    return pd.concat([
+        pd.DataFrame({'timestamp': np.arange(len(emg)) / FS_EMG, 'emg': emg, 'gsr': np.nan}),
+        pd.DataFrame({'timestamp': np.arange(len(gsr)) / FS_GSR, 'emg': np.nan, 'gsr': gsr}),
+    ], ignore_index=True)
+
+
+def measure(fn, repeat):
+    """
+    计时 (取多次运行的最短时间) 并单独运行一次记录峰值内存
+    Returns:
+        (结果, {'seconds': ..., 'peak_mb': ...})
+    """
+    best = float('inf')
+    for _ in range(repeat):
+        start = time.perf_counter()
+        result = fn()
+        best = min(best, time.perf_counter() - start)
+
+    tracemalloc.start()
+    fn()
+    _, peak = tracemalloc.get_traced_memory()
+    tracemalloc.stop()
+    return result, {'seconds': best, 'peak_mb': peak / 2**20}
+
+
+def deviation(reference, values):
+    """
+    低精度结果相对 float64 结果的误差
+    Returns:
+        {'max_abs_err': ..., 'max_rel_err': 最大绝对误差 / 参考值最大绝对值, 'nan_mismatch': NaN位置不一致的个数}
+    """
+    ref = np.asarray(reference, dtype=np.float64)
+    val = np.asarray(values, dtype=np.float64)
+    both = np.isfinite(ref) & np.isfinite(val)
+    err = float(np.max(np.abs(ref[both] - val[both]))) if both.any() else 0.0
+    scale = float(np.max(np.abs(ref[both]))) if both.any() else 0.0
+    return {'max_abs_err': err, 'max_rel_err': err / scale if scale > 0 else 0.0,
+            'nan_mismatch': int(np.sum(np.isnan(ref) != np.isnan(val)))}
+
+
+def run_stages(analyzer, pipeline, emg, gsr, frame, precision, n_repeat):
+    """
+    以给定精度运行全部阶段
+    Returns:
+        ({阶段: {'seconds': ..., 'peak_mb': ...}}, {阶段: 输出数组})
+    """
+    stages, outputs = {}, {}
+    outputs['compute_rms'], stages['compute_rms'] = measure(lambda: analyzer.compute_rms(emg), n_repeat)
+    outputs['compute_slope'], stages['compute_slope'] = measure(lambda: analyzer.compute_slope(gsr), n_repeat)
+    outputs['compute_cei'], stages['compute_cei'] = measure(lambda: analyzer.compute_cei(emg, gsr), n_repeat)
+    feat, stages['features'] = measure(lambda: pipeline.features(frame, fs_emg=FS_EMG, fs_gsr=FS_GSR,
+                                                                 align='timestamp', precision=precision), n_repeat)
+    outputs['features'] = feat['CEI'].to_numpy()
+    cei = feat['CEI'].dropna().to_numpy(dtype=np.float64)
+    m = min(len(cei) // 2, 5000)
+    test, stages['paired_test'] = measure(lambda: pipeline.paired_test(cei[m:2 * m], cei[:m]), n_repeat)
+    outputs['paired_test'] = np.array([test['p'], test['effect_value']], dtype=np.float64)
+    if precision == 'float64':
+        # 流式引擎按1分钟数据块回放整段会话，finalize 后应与批处理CEI一致
+        stream, stages['streaming'] = measure(
+            lambda: StreamingCEI(FS_EMG, FS_GSR).replay(emg, gsr, chunk_s=60, finalize=True), n_repeat)
+        outputs['streaming'] = stream['CEI'].to_numpy()
+    return stages, outputs
+
+
+def run_benchmarks(sizes, pipeline, repeat=3, precisions=('float64',)):
+    """
+    对每个会话时长、每种计算精度运行全部阶段
+    非 float64 精度的结果以 '时长@精度' 为键；同时运行 float64 时记录其输出误差
+    Returns:
+        ({时长: {阶段: {'seconds': ..., 'peak_mb': ...}}},
+         {时长: {精度: {阶段: deviation(...)}}},
+         {时长: 流式CEI相对批处理CEI的 deviation(...)})
+    """
+    results, accuracy, streaming = {}, {}, {}
+    for label in sizes:
+        duration = SESSION_SIZES[label]
+        emg64, gsr64 = synthetic_session(duration, seed=duration)
+        rest_emg, grip_emg = synthetic_session(60, seed=1)[0] * 0.3, synthetic_session(60, seed=2)[0] * 3
+        rest_gsr, grip_gsr = synthetic_session(60, seed=3)[1], synthetic_session(60, seed=4)[1] * 1.5
+        n_repeat = repeat if duration <= 3600 else 1
+
+        reference = None
+        for precision in precisions:
+            # 输入在计时之外转换，单精度模式下信号以 float32 进入流程 (如会话存储直接读出的列)
+            emg, gsr = emg64.astype(precision), gsr64.astype(precision)
+            frame = session_frame(emg, gsr).astype({'emg': precision, 'gsr': precision})
+            analyzer = GestureFlowAnalyzer(sampling_rate_emg=FS_EMG, sampling_rate_gsr=FS_GSR, precision=precision)
+            analyzer.load_calibration_data(rest_emg, grip_emg, rest_gsr, grip_gsr)
+
+            stages, outputs = run_stages(analyzer, pipeline, emg, gsr, frame, precision, n_repeat)
+            key = label if precision == 'float64' else f"{label}@{precision}"
+            results[key] = stages
+            if precision == 'float64':
+                reference = outputs
+                streaming[label] = deviation(outputs['features'], outputs.pop('streaming'))
+            elif reference is not None:
+                accuracy.setdefault(label, {})[precision] = {
+                    stage: deviation(reference[stage], outputs[stage]) for stage in outputs}
+            for stage, r in stages.items():
+                print(f"  {key:>14} {stage:<14} {r['seconds'] * 1e3:10.2f} ms {r['peak_mb']:10.1f} MB")
+    return results, accuracy, streaming
+
+
+def precision_report(results, accuracy):
+    """打印低精度相对 float64 的峰值内存比与最大相对误差"""
+    for label, by_precision in accuracy.items():
+        for precision, stages in by_precision.items():
+            print(f"  {label:>6} {precision}:")
+            for stage, dev in stages.items():
+                ref = results[label][stage]['peak_mb']
+                low = results[f"{label}@{precision}"][stage]['peak_mb']
+                ratio = f"{low / ref:6.2f}x" if ref > 0 else '     -'
+                print(f"    {stage:<14} 内存 {ratio}  最大相对误差 {dev['max_rel_err']:.2e}"
+                      f"  NaN不一致 {dev['nan_mismatch']}")
+
+
+def compare(results, baseline, threshold):
+    """
+    与基线对比
+    Args:
+        results: 本次结果
+        baseline: 基线结果
+        threshold: 允许的相对增长 (如 0.2 表示 20%)
+    Returns:
+        回归列表 [(时长, 阶段, 指标, 基线值, 本次值)]
+    """
+    regressions = []
+    for label, stages in results.items():
+        for stage, metrics in stages.items():
+            base = baseline.get(label, {}).get(stage)
+            if not base:
+                continue
+            for metric, value in metrics.items():
+                ref = base.get(metric)
+                # 过小的数值 (<1ms / <1MB) 受噪声影响大，不参与判定
+                floor = 1e-3 if metric == 'seconds' else 1.0
+                if ref is not None and max(ref, value) >= floor and value > ref * (1 + threshold):
+                    regressions.append((label, stage, metric, ref, value))
+    return regressions
+
+
+def main():
+    parser = argparse.ArgumentParser(description='CEI信号处理流程基准测试')
+    parser.add_argument('--max-hours', type=float, default=1.0, help='最长会话时长 (小时)')
+    parser.add_argument('--repeat', type=int, default=3, help='≤1小时会话的重复计时次数')
+    parser.add_argument('--baseline', type=Path, default=DEFAULT_BASELINE, help='基线文件')
+    parser.add_argument('--threshold', type=float, default=0.2, help='判定回归的相对增长阈值')
+    parser.add_argument('--update-baseline', action='store_true', help='将本次结果写为基线')
+    parser.add_argument('--output', type=Path, help='本次结果的JSON输出路径')
+    parser.add_argument('--precision', nargs='+', default=['float64'], choices=['float64', 'float32'],
+                        help='计算精度；同时给出 float64 时报告其他精度的内存与误差')
+    args = parser.parse_args()
+
+    sizes = [k for k, v in SESSION_SIZES.items() if v <= args.max_hours * 3600]
+    # float64 先运行，作为误差参考
+    precisions = sorted(set(args.precision), key=lambda p: p != 'float64')
+    print(f"🧪 CEI pipeline benchmark: {', '.join(sizes)} ({', '.join(precisions)})")
+    results, accuracy, streaming = run_benchmarks(sizes, load_root_pipeline(), repeat=args.repeat,
+                                                  precisions=precisions)
+    if accuracy:
+        print("📐 精度对比 (相对 float64):")
+        precision_report(results, accuracy)
+    stream_failures = [label for label, dev in streaming.items()
+                       if dev['max_abs_err'] > STREAM_TOLERANCE or dev['nan_mismatch']]
+    for label, dev in streaming.items():
+        print(f"  {label:>6} 流式CEI (finalize) 相对批处理: 最大误差 {dev['max_abs_err']:.2e}"
+              f"  NaN不一致 {dev['nan_mismatch']}")
+    report = {
+        'machine': {'python': platform.python_version(), 'numpy': np.__version__,
+                    'platform': platform.platform()},
+        'results': results,
+        'accuracy': accuracy,
+        'streaming': streaming,
+    }
+    if args.output:
+        args.output.write_text(json.dumps(report, indent=2))
+
+    if stream_failures:
+        print(f"❌ 流式CEI与批处理结果不一致 (容差 {STREAM_TOLERANCE:g}): {', '.join(stream_failures)}")
+        return 1
+
+    if args.update_baseline:
+        args.baseline.parent.mkdir(parents=True, exist_ok=True)
+        args.baseline.write_text(json.dumps(report, indent=2))
+        print(f"✅ 基线已写入: {args.baseline}")
+        return 0
+
+    if not args.baseline.exists():
+        print(f"ℹ️  未找到基线文件 {args.baseline}，使用 --update-baseline 创建")
+        return 0
+
+    baseline = json.loads(args.baseline.read_text())['results']
+    regressions = compare(results, baseline, args.threshold)
+    if not regressions:
+        print(f"✅ 无回归 (阈值 +{args.threshold:.0%})")
+        return 0
+    print(f"❌ 发现 {len(regressions)} 项回归 (阈值 +{args.threshold:.0%}):")
+    for label, stage, metric, ref, value in regressions:
+        print(f"   {label} {stage} {metric}: {ref:.4g} -> {value:.4g} ({value / ref - 1:+.0%})")
+    return 1
+
+
+if __name__ == "__main__":
+    sys.exit(main())
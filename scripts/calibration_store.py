@@ -0,0 +1,204 @@
+#!/usr/bin/env python3
+"""
+GestureFlow 个体化校准存储
+一次批量计算全部参与者/会话的校准记录 (静息-握拳 RMS 与 GSR 斜率、p90阈值)，
+按版本持久化；CEI计算时按 参与者 + 时间 查找生效的校准，无需重复计算
+"""
+
+import json
+import time
+from pathlib import Path
+
+import numpy as np
+import pandas as pd
+
+from window_engine import window_starts, windowed_rms, windowed_slope
+
+CALIBRATION_COLUMNS = ['emg_rest_mean', 'emg_grip_mean', 'gsr_rest_mean', 'gsr_grip_mean',
+                       'emg_threshold', 'gsr_threshold']
+
+
+def _segment_windows(lengths, window, step):
+    """
+    多段拼接信号上的窗口 (窗口不跨段)，窗口定义同 GestureFlowAnalyzer.compute_rms
+    Returns:
+        (lo, hi, 段编号)
+    """
+    offsets = np.concatenate([[0], np.cumsum(lengths)[:-1]])
+    starts = [window_starts(n, window, step) + off for n, off in zip(lengths, offsets)]
+    seg = np.repeat(np.arange(len(lengths)), [len(s) for s in starts])
+    lo = np.concatenate(starts) if starts else np.empty(0, dtype=np.int64)
+    return lo, lo + window, seg
+
+
+def _group_mean(values, groups, n_groups):
+    """按组的 nanmean"""
+    ok = ~np.isnan(values)
+    total = np.bincount(groups[ok], weights=values[ok], minlength=n_groups)
+    count = np.bincount(groups[ok], minlength=n_groups)
+    with np.errstate(invalid='ignore', divide='ignore'):
+        return total / count
+
+
+def _group_percentile(values, groups, n_groups, q):
+    """按组的百分位数 (线性插值，与 np.percentile 一致)，忽略NaN"""
+    ok = ~np.isnan(values)
+    values, groups = values[ok], groups[ok]
+    order = np.lexsort((values, groups))
+    values, groups = values[order], groups[order]
+    count = np.bincount(groups, minlength=n_groups)
+    first = np.concatenate([[0], np.cumsum(count)[:-1]])
+    out = np.full(n_groups, np.nan)
+    has = count > 0
+    pos = q / 100.0 * (count[has] - 1)
+    lower = np.floor(pos).astype(np.int64)
+    upper = np.minimum(lower + 1, count[has] - 1)
+    frac = pos - lower
+    base = first[has]
+    out[has] = values[base + lower] * (1 - frac) + values[base + upper] * frac
+    return out
+
+
+def compute_calibrations(records, fs_emg=200, fs_gsr=4, emg_window=1.0, gsr_window=5.0):
+    """
+    批量计算校准参数 (与 GestureFlowAnalyzer.load_calibration_data 的定义相同)
+    所有记录的信号拼接后一次完成全部窗口的RMS/斜率计算，再按记录分组汇总
+    Args:
+        records: 可迭代的字典，含 participant / time (秒) / emg_rest / emg_grip / gsr_rest / gsr_grip
+        fs_emg: EMG采样率 (Hz)
+        fs_gsr: GSR采样率 (Hz)
+        emg_window: RMS窗口 (秒)
+        gsr_window: 斜率窗口 (秒)
+    Returns:
+        每条记录一行的 DataFrame (participant, time, CALIBRATION_COLUMNS)
+    """
+    records = list(records)
+    n = len(records)
+    w_emg = int(emg_window * fs_emg)
+    w_gsr = int(gsr_window * fs_gsr)
+
+    def batch(key, window, kernel, **kwargs):
+        signals = [np.asarray(r[key], dtype=np.float64) for r in records]
+        lo, hi, seg = _segment_windows([len(s) for s in signals], window, window // 2)
+        concat = np.concatenate(signals) if signals else np.empty(0)
+        return kernel(concat, lo, hi, **kwargs), seg
+
+    emg_rest, seg_er = batch('emg_rest', w_emg, windowed_rms)
+    emg_grip, seg_eg = batch('emg_grip', w_emg, windowed_rms)
+    gsr_rest, seg_gr = batch('gsr_rest', w_gsr, windowed_slope, dt=1.0 / fs_gsr)
+    gsr_grip, seg_gg = batch('gsr_grip', w_gsr, windowed_slope, dt=1.0 / fs_gsr)
+
+    return pd.DataFrame({
+        'participant': [str(r['participant']) for r in records],
+        'time': np.array([float(r.get('time', 0.0)) for r in records]),
+        'emg_rest_mean': _group_mean(emg_rest, seg_er, n),
+        'emg_grip_mean': _group_mean(emg_grip, seg_eg, n),
+        'gsr_rest_mean': _group_mean(gsr_rest, seg_gr, n),
+        'gsr_grip_mean': _group_mean(gsr_grip, seg_gg, n),
+        # 个体化阈值：静息与握拳窗口合并后的 p90
+        'emg_threshold': _group_percentile(np.concatenate([emg_rest, emg_grip]),
+                                           np.concatenate([seg_er, seg_eg]), n, 90),
+        'gsr_threshold': _group_percentile(np.concatenate([gsr_rest, gsr_grip]),
+                                           np.concatenate([seg_gr, seg_gg]), n, 90),
+    })
+
+
+class CalibrationStore:
+    """
+    带版本的校准存储：每次保存写出一个新版本 (vNNNN.csv)，manifest.json 记录版本历史
+    """
+
+    def __init__(self, root, version=None):
+        """
+        Args:
+            root: 存储目录
+            version: 读取的版本号，None 为最新版本
+        """
+        self.root = Path(root)
+        self.version = version
+        self._table = None
+
+    def _manifest(self):
+        path = self.root / 'manifest.json'
+        if not path.exists():
+            return {'versions': []}
+        with open(path) as f:
+            return json.load(f)
+
+    def versions(self):
+        """全部版本的元数据"""
+        return self._manifest()['versions']
+
+    def save(self, table, note=''):
+        """
+        保存为新版本 (旧版本保留)
+        Args:
+            table: compute_calibrations 的结果 (可与上一版本合并后传入)
+            note: 版本说明
+        Returns:
+            新版本号
+        """
+        self.root.mkdir(parents=True, exist_ok=True)
+        manifest = self._manifest()
+        version = len(manifest['versions']) + 1
+        table = table.sort_values(['participant', 'time'], kind='stable').reset_index(drop=True)
+        table.to_csv(self.root / f"v{version:04d}.csv", index=False)
+        manifest['versions'].append({
+            'version': version,
+            'created': time.strftime('%Y-%m-%dT%H:%M:%S'),
+            'records': int(len(table)),
+            'note': note,
+        })
+        with open(self.root / 'manifest.json', 'w') as f:
+            json.dump(manifest, f, indent=2, ensure_ascii=False)
+        self._table = None
+        return version
+
+    def build(self, records, note='', **kwargs):
+        """批量计算并保存为新版本，新记录与当前版本合并 (同一参与者同一时间以新记录为准)"""
+        table = compute_calibrations(records, **kwargs)
+        if self.versions():
+            table = pd.concat([self.table(), table], ignore_index=True)
+            table = table.drop_duplicates(['participant', 'time'], keep='last')
+        return self.save(table, note)
+
+    def table(self):
+        """当前读取版本的校准表 (participant, time 排序)"""
+        if self._table is None:
+            versions = self.versions()
+            if not versions:
+                raise FileNotFoundError(f"校准存储为空: {self.root}")
+            version = self.version or versions[-1]['version']
+            self._table = pd.read_csv(self.root / f"v{version:04d}.csv", dtype={'participant': str})
+        return self._table
+
+    def lookup_many(self, participants, times):
+        """
+        按 参与者 + 时间 查找生效的校准：该时间之前最近的一次校准
+        (早于首次校准时使用首次校准)
+        Args:
+            participants: 参与者ID数组
+            times: 时间数组 (秒)
+        Returns:
+            DataFrame，每个查询一行，列为 CALIBRATION_COLUMNS
+        """
+        table = self.table()
+        participants = np.asarray(participants).astype(str)
+        times = np.asarray(times, dtype=np.float64)
+        t = table['time'].to_numpy(dtype=np.float64)
+        # 表已按 (participant, time) 排序：每名参与者对应一段连续行
+        groups = table.groupby('participant', sort=False).indices
+
+        rows = np.empty(len(participants), dtype=np.int64)
+        for pid in np.unique(participants):
+            if pid not in groups:
+                raise KeyError(f"没有参与者 {pid} 的校准记录")
+            idx = groups[pid]
+            q = np.flatnonzero(participants == pid)
+            k = np.searchsorted(t[idx], times[q], side='right') - 1
+            rows[q] = idx[np.maximum(k, 0)]
+        return table.iloc[rows][CALIBRATION_COLUMNS].reset_index(drop=True)
+
+    def lookup(self, participant, time_s=0.0):
+        """单次查找，返回校准参数字典 (与 GestureFlowAnalyzer.calibration 同结构)"""
+        return self.lookup_many([participant], [time_s]).iloc[0].to_dict()
@@ -0,0 +1,153 @@
+#!/usr/bin/env python3
+"""
+GestureFlow CEI 多分辨率金字塔
+第0层为原始序列，之后每层把上一层每 factor 个相邻区间合并为一个 (min / max / 和 / 有效数)，
+绘图与查询按像素宽度选择区间数不超过预算的最细一层，渲染开销与会话长度无关。
+金字塔以 .npz 持久化 (先写临时文件再原子替换)，每个会话一个文件
+"""
+
+import os
+import tempfile
+from pathlib import Path
+
+import numpy as np
+import pandas as pd
+
+# 每层合并的区间数
+FACTOR = 4
+# 最粗一层的区间数不超过该值
+MIN_BINS = 256
+FIELDS = ['t0', 't1', 'min', 'max', 'sum', 'count']
+
+
+def _coarsen(level, factor):
+    """把相邻 factor 个区间合并为一个 (reduceat，末尾不足 factor 个的也合并为一个)"""
+    m = len(level['t0'])
+    starts = np.arange(0, m, factor)
+    ends = np.r_[starts[1:], m] - 1
+    return {
+        't0': level['t0'][starts],
+        't1': level['t1'][ends],
+        # fmin / fmax 忽略NaN，只有全部为NaN时结果才为NaN
+        'min': np.fmin.reduceat(level['min'], starts),
+        'max': np.fmax.reduceat(level['max'], starts),
+        'sum': np.add.reduceat(level['sum'], starts),
+        'count': np.add.reduceat(level['count'], starts),
+    }
+
+
+class CEIPyramid:
+    """一个会话的 min/mean/max 金字塔"""
+
+    def __init__(self, levels, factor=FACTOR):
+        """
+        Args:
+            levels: 各层的数组 dict 列表 (键见 FIELDS)，由细到粗
+            factor: 每层合并的区间数
+        """
+        self.levels = levels
+        self.factor = factor
+
+    @staticmethod
+    def _base(times, values):
+        """第0层：每个样本一个区间"""
+        t = np.asarray(times, dtype=np.float64)
+        y = np.asarray(values)
+        y = y.astype(np.float64, copy=False) if y.dtype.kind != 'f' else y
+        valid = ~np.isnan(y)
+        return {'t0': t, 't1': t, 'min': y, 'max': y,
+                'sum': np.where(valid, y, 0.0).astype(np.float64), 'count': valid.astype(np.int64)}
+
+    @classmethod
+    def build(cls, times, values, factor=FACTOR, min_bins=MIN_BINS):
+        """
+        由时间序列构建金字塔
+        Args:
+            times: 时间 (秒，递增)
+            values: CEI 值 (NaN 为缺失)
+            factor: 每层合并的区间数
+            min_bins: 区间数不超过该值时停止合并
+        """
+        level = cls._base(times, values)
+        levels = [level]
+        while len(level['t0']) > min_bins:
+            level = _coarsen(level, factor)
+            levels.append(level)
+        return cls(levels, factor)
+
+    def level_for(self, max_points, t_start=None, t_end=None):
+        """区间 [t_start, t_end) 内区间数不超过 max_points 的最细一层"""
+        for k, level in enumerate(self.levels):
+            lo, hi = self._bounds(level, t_start, t_end)
+            if hi - lo <= max_points:
+                return k
+        return len(self.levels) - 1
+
+    def source_level(self, min_points, t_start=None, t_end=None):
+        """
+        区间 [t_start, t_end) 内区间数不少于 min_points 的最粗一层，作为降采样的数据源：
+        点数不超过 factor × min_points (除非第0层本身就更长)，降采样开销与会话长度无关；都不足时为第0层
+        """
+        for k in range(len(self.levels) - 1, -1, -1):
+            lo, hi = self._bounds(self.levels[k], t_start, t_end)
+            if hi - lo >= min_points:
+                return k
+        return 0
+
+    @staticmethod
+    def _bounds(level, t_start, t_end):
+        """与 [t_start, t_end) 相交的区间下标范围"""
+        lo = 0 if t_start is None else int(np.searchsorted(level['t1'], t_start, side='left'))
+        hi = len(level['t0']) if t_end is None else int(np.searchsorted(level['t0'], t_end, side='left'))
+        return lo, max(hi, lo)
+
+    def query(self, t_start=None, t_end=None, max_points=2000, level=None):
+        """
+        按点数预算取出时间范围内的汇总序列
+        Args:
+            t_start: 起始时间 (秒，含)，None 表示不限
+            t_end: 结束时间 (秒，不含)，None 表示不限
+            max_points: 区间数上限 (通常取绘图区域的像素宽度)
+            level: 指定层，None 时按 max_points 选择
+        Returns:
+            DataFrame：time (区间中点) / t0 / t1 / min / mean / max / count；attrs['level'] 为所用层
+        """
+        k = self.level_for(max_points, t_start, t_end) if level is None else level
+        data = self.levels[k]
+        lo, hi = self._bounds(data, t_start, t_end)
+        count = data['count'][lo:hi]
+        with np.errstate(invalid='ignore', divide='ignore'):
+            mean = np.where(count > 0, data['sum'][lo:hi] / count, np.nan)
+        out = pd.DataFrame({
+            'time': (data['t0'][lo:hi] + data['t1'][lo:hi]) / 2,
+            't0': data['t0'][lo:hi],
+            't1': data['t1'][lo:hi],
+            'min': data['min'][lo:hi],
+            'mean': mean,
+            'max': data['max'][lo:hi],
+            'count': count,
+        })
+        out.attrs['level'] = k
+        return out
+
+    def save(self, path):
+        """写出为 .npz (原子替换)；第0层只存时间与原始值"""
+        path = Path(path)
+        path.parent.mkdir(parents=True, exist_ok=True)
+        arrays = {f'l{k}_{f}': level[f] for k, level in enumerate(self.levels) if k > 0 for f in FIELDS}
+        arrays['time'] = self.levels[0]['t0']
+        arrays['value'] = self.levels[0]['min']
+        arrays['factor'] = np.array(self.factor)
+        arrays['n_levels'] = np.array(len(self.levels))
+        fd, tmp = tempfile.mkstemp(dir=path.parent, suffix='.tmp')
+        with os.fdopen(fd, 'wb') as f:
+            np.savez(f, **arrays)
+        os.replace(tmp, path)
+
+    @classmethod
+    def load(cls, path):
+        """读取 save 写出的金字塔"""
+        with np.load(path) as data:
+            levels = [cls._base(data['time'], data['value'])]
+            levels += [{f: data[f'l{k}_{f}'] for f in FIELDS} for k in range(1, int(data['n_levels']))]
+            return cls(levels, int(data['factor']))
@@ -0,0 +1,306 @@
+#!/usr/bin/env python3
+"""
+GestureFlow 流式CEI计算
+实时会话中按任意大小的数据块输入EMG/GSR (可附时间戳)，窗口一旦完整即输出CEI
+窗口按与 aligned_windows 相同的共享时间网格划分 (起点为两路首个时间戳中较早者，步长 step_s)，
+两路信号都已越过窗口终点时该窗口完整；一路停顿或掉线超过 max_lag_s 时不再等待，
+按另一路的进度输出窗口，缺失的一路按覆盖率不足记为NaN。
+每路信号缓存在预分配的缓冲区中，只保留尚未输出的窗口所需的样本 (约一个窗口加一个步长)，
+逐样本输入时没有完成的窗口不做任何窗口计算。
+z分数改用Welford在线均值/方差，不依赖整段会话的统计量：实时输出的CEI只用到截至当前的统计量，
+与批处理 features() 的CEI (整段会话的均值/标准差) 不同；会话结束后 finalize 以最终统计量重新标准化，
+结果与 features(align='timestamp') 一致
+"""
+
+import math
+
+import numpy as np
+import pandas as pd
+
+from window_engine import grid_bounds, windowed_rms, windowed_slope
+
+
+class RunningStats:
+    """Welford在线均值/方差 (总体方差，与 np.nanstd 一致)，NaN不参与更新"""
+
+    def __init__(self):
+        self.count = 0
+        self.mean = 0.0
+        self._m2 = 0.0
+
+    def update(self, value):
+        """加入一个样本"""
+        if math.isnan(value):
+            return
+        self.count += 1
+        delta = value - self.mean
+        self.mean += delta / self.count
+        self._m2 += delta * (value - self.mean)
+
+    @property
+    def std(self):
+        return math.sqrt(self._m2 / self.count) if self.count > 0 else float('nan')
+
+    def zscore(self, value):
+        """按当前统计量计算z分数 (与 features() 相同的 +1e-8 平滑)"""
+        return (value - self.mean) / (self.std + 1e-8)
+
+
+class TimedStream:
+    """
+    单路信号的流式时间窗口
+    缓存 (时间戳, 样本)，NaN样本丢弃 (与 aligned_windows 取非NaN行一致)，
+    只保留尚未输出的窗口所需的样本；缓冲区预先分配，丢弃的样本只移动起点，
+    写满时把保留的样本移回开头 (容量不足时才扩容)，窗口计算始终使用连续的视图
+    """
+
+    def __init__(self, fs, capacity=1024):
+        """
+        Args:
+            fs: 采样率 (Hz)，未给出时间戳时按样本序号 / fs 生成
+            capacity: 缓冲区初始容量 (样本数)
+        """
+        self.fs = fs
+        self._t = np.empty(max(int(capacity), 1), dtype=np.float64)
+        self._x = np.empty(max(int(capacity), 1), dtype=np.float64)
+        self._head = 0
+        self._tail = 0
+        # 缓冲区首样本在整段会话 (非NaN样本) 中的下标
+        self.offset = 0
+        self.received = 0
+        self.first = None
+        self.last = -math.inf
+
+    @property
+    def t(self):
+        """缓存样本的时间戳 (视图)"""
+        return self._t[self._head:self._tail]
+
+    @property
+    def x(self):
+        """缓存的样本 (视图)"""
+        return self._x[self._head:self._tail]
+
+    def __len__(self):
+        return self._tail - self._head
+
+    def _reserve(self, n):
+        """保证缓冲区末尾还能写入 n 个样本"""
+        if self._tail + n <= len(self._t):
+            return
+        size = len(self)
+        if size + n > len(self._t):
+            capacity = max(2 * len(self._t), size + n)
+            self._t = np.concatenate([self.t, np.empty(capacity - size)])
+            self._x = np.concatenate([self.x, np.empty(capacity - size)])
+        else:
+            self._t[:size] = self._t[self._head:self._tail]
+            self._x[:size] = self._x[self._head:self._tail]
+        self._head, self._tail = 0, size
+
+    def push(self, chunk, t=None):
+        """
+        追加数据块
+        Args:
+            chunk: 新样本
+            t: 样本时间戳 (秒，单调递增)，None 时接续样本序号 / fs
+        """
+        chunk = np.asarray(chunk, dtype=np.float64).ravel()
+        if t is None:
+            t = (self.received + np.arange(len(chunk))) / self.fs
+        t = np.asarray(t, dtype=np.float64).ravel()
+        if len(t) != len(chunk):
+            raise ValueError(f"时间戳个数 ({len(t)}) 与样本个数 ({len(chunk)}) 不一致")
+        self.received += len(chunk)
+        if not len(chunk):
+            return
+        # NaN样本不计入窗口，但其时间戳仍表示该路信号已推进到此时刻
+        self.last = max(self.last, float(t[-1]))
+        valid = ~np.isnan(chunk)
+        n = int(valid.sum())
+        if not n:
+            return
+        if self.first is None:
+            self.first = float(t[valid][0])
+        self._reserve(n)
+        self._t[self._tail:self._tail + n] = t[valid]
+        self._x[self._tail:self._tail + n] = chunk[valid]
+        self._tail += n
+
+    def bounds(self, starts, win):
+        """各窗口在缓冲区中的下标范围 (同 grid_bounds)"""
+        return grid_bounds(self.t, starts, win)
+
+    def discard_before(self, t0):
+        """丢弃时间早于 t0 的样本 (之后的窗口不再需要)"""
+        k = int(np.searchsorted(self.t, t0, side='left'))
+        self._head += k
+        self.offset += k
+
+
+class StreamingCEI:
+    """
+    流式CEI引擎
+    CEI = 0.6 * z(RMS_EMG) + 0.4 * z(slope_GSR)，窗口划分、覆盖率判定与斜率横坐标与 aligned_windows 相同。
+    push 输出的z分数使用截至当前窗口的Welford统计量 (在线结果，会话早期波动较大)；
+    会话结束后调用 finish 输出末尾窗口，再用 finalize 以最终统计量重新标准化即得到批处理结果
+    (两路的时间差始终在 max_lag_s 以内时)
+    """
+
+    def __init__(self, fs_emg=200, fs_gsr=10, win_s=2.0, step_s=0.5, min_coverage=0.5, max_lag_s=5.0):
+        """
+        Args:
+            fs_emg: EMG采样率 (Hz)
+            fs_gsr: GSR采样率 (Hz)
+            win_s: 窗口长度 (秒)
+            step_s: 步长 (秒)
+            min_coverage: 窗口内样本数低于名义样本数的该比例时视为缺失 (同 aligned_windows)
+            max_lag_s: 一路信号落后另一路超过该时长 (秒) 时不再等待，窗口按较快一路的进度输出，
+                落后一路在已输出窗口内的样本 (迟到的数据) 被丢弃；None 为一直等待 (缓冲区可能无限增长)
+        """
+        self.fs_emg = fs_emg
+        self.fs_gsr = fs_gsr
+        self.win_s = win_s
+        self.step_s = step_s
+        self.min_coverage = min_coverage
+        self.max_lag_s = max_lag_s
+        # 初始容量：一个窗口加一个步长 (再留一倍余量给新到的数据块)
+        self.emg = TimedStream(fs_emg, capacity=2 * math.ceil((win_s + step_s) * fs_emg))
+        self.gsr = TimedStream(fs_gsr, capacity=2 * math.ceil((win_s + step_s) * fs_gsr))
+        self.emg_stats = RunningStats()
+        self.gsr_stats = RunningStats()
+        # 网格起点 (两路都有样本后确定) 与下一个待输出窗口的序号
+        self.origin = None
+        self.next_window = 0
+
+    def push(self, emg_chunk=(), gsr_chunk=(), emg_t=None, gsr_t=None):
+        """
+        输入一块EMG和/或GSR数据
+        Args:
+            emg_chunk: 新的EMG样本 (可为空)
+            gsr_chunk: 新的GSR样本 (可为空)
+            emg_t: EMG样本时间戳 (秒)，None 时按样本序号 / fs_emg
+            gsr_t: GSR样本时间戳 (秒)，None 时按样本序号 / fs_gsr
+        Returns:
+            新完成窗口的DataFrame：idx / timestamp / emg_rms / gsr_slope / emg_rms_z / gsr_slope_z / CEI；
+            没有新窗口时为共享的空表 (不要原地修改)
+        """
+        self.emg.push(emg_chunk, emg_t)
+        self.gsr.push(gsr_chunk, gsr_t)
+        # 两路都已越过窗口终点 (之后不会再有落入该窗口的样本) 时窗口完整；
+        # 一路落后超过 max_lag_s 时按较快一路减去 max_lag_s 的时刻输出
+        horizon = min(self.emg.last, self.gsr.last)
+        if self.max_lag_s is not None:
+            horizon = max(horizon, max(self.emg.last, self.gsr.last) - self.max_lag_s)
+        return self._emit(horizon)
+
+    def finish(self):
+        """
+        会话结束：输出剩余的完整窗口 (网格终点同 aligned_windows：两路末样本 + 1/fs 中较晚者)
+        Returns:
+            同 push
+        """
+        lasts = [s.last + 1.0 / s.fs for s in (self.emg, self.gsr) if s.first is not None]
+        return self._emit(max(lasts) if lasts else -math.inf)
+
+    def _emit(self, horizon):
+        """输出终点不超过 horizon 的全部未输出窗口"""
+        if self.origin is None:
+            firsts = [s.first for s in (self.emg, self.gsr) if s.first is not None]
+            # 网格起点在两路都有样本后确定；一路超过 max_lag_s 仍无数据时以另一路为准
+            if not firsts or (len(firsts) < 2 and not horizon >= min(firsts) + self.win_s):
+                return self._empty()
+            self.origin = min(firsts)
+        n = self.next_window
+        if np.isfinite(horizon):
+            # 终点不超过 horizon 的窗口个数，容忍浮点时间戳的舍入误差 (同 time_grid)
+            n = max(n, int(np.floor((horizon - self.origin - self.win_s) / self.step_s + 1e-9)) + 1)
+        if n == self.next_window:
+            return self._empty()
+        starts = self.origin + np.arange(self.next_window, n, dtype=np.float64) * self.step_s
+
+        lo_e, hi_e = self.emg.bounds(starts, self.win_s)
+        lo_g, hi_g = self.gsr.bounds(starts, self.win_s)
+        rms = windowed_rms(self.emg.x, lo_e, hi_e)
+        slope = windowed_slope(self.gsr.x, lo_g, hi_g, x=self.gsr.t * self.fs_gsr)
+        rms[(hi_e - lo_e) < self.min_coverage * self.win_s * self.fs_emg] = np.nan
+        slope[(hi_g - lo_g) < self.min_coverage * self.win_s * self.fs_gsr] = np.nan
+        idx = lo_e + self.emg.offset
+
+        self.next_window = n
+        next_start = self.origin + n * self.step_s
+        self.emg.discard_before(next_start)
+        self.gsr.discard_before(next_start)
+        return self._frame(idx, starts, rms, slope)
+
+    _EMPTY = pd.DataFrame({'idx': np.empty(0, dtype=np.int64), **{
+        col: np.empty(0) for col in ('timestamp', 'emg_rms', 'gsr_slope', 'emg_rms_z', 'gsr_slope_z', 'CEI')}})
+
+    def _empty(self):
+        """没有新窗口时的输出：共享的空表 (只读)，逐样本输入时不重复构造DataFrame"""
+        return self._EMPTY
+
+    def _frame(self, idx, starts, rms, slope):
+        n = len(rms)
+        rms_z = np.empty(n)
+        slope_z = np.empty(n)
+        for k in range(n):
+            self.emg_stats.update(rms[k])
+            self.gsr_stats.update(slope[k])
+            rms_z[k] = self.emg_stats.zscore(rms[k])
+            slope_z[k] = self.gsr_stats.zscore(slope[k])
+        return pd.DataFrame({
+            'idx': np.asarray(idx, dtype=np.int64),
+            'timestamp': starts,
+            'emg_rms': rms,
+            'gsr_slope': slope,
+            'emg_rms_z': rms_z,
+            'gsr_slope_z': slope_z,
+            'CEI': 0.6 * rms_z + 0.4 * slope_z,
+        })
+
+    def finalize(self, frame):
+        """
+        以最终 (整段会话) 统计量重新标准化已输出的窗口，与 features() 的批处理CEI一致
+        Args:
+            frame: push / finish 输出的全部窗口 (按顺序拼接)
+        Returns:
+            emg_rms_z / gsr_slope_z / CEI 替换为批处理结果的新DataFrame
+        """
+        out = frame.copy()
+        out['emg_rms_z'] = (out['emg_rms'] - self.emg_stats.mean) / (self.emg_stats.std + 1e-8)
+        out['gsr_slope_z'] = (out['gsr_slope'] - self.gsr_stats.mean) / (self.gsr_stats.std + 1e-8)
+        out['CEI'] = 0.6 * out['emg_rms_z'] + 0.4 * out['gsr_slope_z']
+        return out
+
+    def replay(self, emg, gsr, chunk_s=1.0, emg_t=None, gsr_t=None, finalize=False):
+        """
+        按固定时长分块回放整段会话 (用于与批处理结果对照)
+        Args:
+            emg: EMG信号
+            gsr: GSR信号
+            chunk_s: 每块时长 (秒)
+            emg_t: EMG时间戳 (秒)，None 时按样本序号 / fs_emg
+            gsr_t: GSR时间戳 (秒)，None 时按样本序号 / fs_gsr
+            finalize: 为 True 时返回 finalize 重新标准化后的结果
+        Returns:
+            全部窗口的DataFrame (含 finish 输出的末尾窗口)
+        """
+        # 按时间切块 (而非按样本数)，两路每块覆盖同一时段，回放中两路的时间差不超过一块
+        emg_t = np.arange(len(emg)) / self.fs_emg if emg_t is None else np.asarray(emg_t, dtype=np.float64)
+        gsr_t = np.arange(len(gsr)) / self.fs_gsr if gsr_t is None else np.asarray(gsr_t, dtype=np.float64)
+        ends = [ts[-1] for ts in (emg_t, gsr_t) if len(ts)]
+        starts = [ts[0] for ts in (emg_t, gsr_t) if len(ts)]
+        n_chunks = math.floor((max(ends) - min(starts)) / chunk_s) + 1 if ends else 0
+        edges = min(starts, default=0.0) + np.arange(n_chunks + 1) * chunk_s
+        cut_e = np.searchsorted(emg_t, edges, side='left')
+        cut_g = np.searchsorted(gsr_t, edges, side='left')
+        cut_e[-1], cut_g[-1] = len(emg), len(gsr)
+
+        frames = []
+        for k in range(n_chunks):
+            e, g = slice(cut_e[k], cut_e[k + 1]), slice(cut_g[k], cut_g[k + 1])
+            frames.append(self.push(emg[e], gsr[g], emg_t[e], gsr_t[g]))
+        frames.append(self.finish())
+        out = pd.concat(frames, ignore_index=True)
+        return self.finalize(out) if finalize else out
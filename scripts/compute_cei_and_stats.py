@@ -12,16 +12,54 @@ import seaborn as sns
 from scipy import stats
 from pathlib import Path
 
+from window_engine import (rolling_rms, rolling_slope, rolling_emg_features, nearest_window, float_dtype,
+                           window_starts, window_mask)
+from session_loader import open_session, chunked_windows, iter_window_blocks
+from gsr_peaks import detect_peaks, peak_rate
+from calibration_store import compute_calibrations, CALIBRATION_COLUMNS
+from resampling import make_rng, bootstrap_ci, sign_flip_test, cohens_dz, mean_diff, t_statistic
+from abab_randomization import abab_randomization_test
+from signal_quality import (rolling_emg_quality, rolling_gsr_quality, quality_summary, session_rail,
+                            warn_if_all_rejected)
+from baseline_tracker import BaselineTracker
+from focus_episodes import focus_episodes
+from behavior_metrics import behavior_metrics
+from event_windows import TimeIndex
+from cei_pyramid import CEIPyramid
+from downsample import downsample, point_budget
+from figure_build import FigureTask, build_figures
+
 class GestureFlowAnalyzer:
-    def __init__(self, sampling_rate_emg=200, sampling_rate_gsr=4):
+    def __init__(self, sampling_rate_emg=200, sampling_rate_gsr=4, vectorized=True, chunk_seconds=None,
+                 calibration_store=None, precision='float64', quality=None, baseline_tracking=None):
         """
         初始化分析器
         Args:
             sampling_rate_emg: EMG采样率 (Hz)
             sampling_rate_gsr: GSR采样率 (Hz)
+            vectorized: 是否使用向量化窗口引擎 (False时回退到逐窗口参考实现，用于验证)
+            chunk_seconds: 分块计算的块时长 (秒)，None表示整段计算；
+                配合内存映射的会话文件使用，峰值内存只与块大小有关
+            calibration_store: CalibrationStore，compute_cei 按参与者与时间查找校准参数
+            precision: 向量化计算的精度，'float32' 时信号、块内前缀和与窗口矩阵按单精度存储，
+                窗口特征以单精度输出；compute_rms / compute_cei 的峰值内存约为 float64 的一半
+            quality: 信号质量检查，None 不检查；True 使用默认阈值 (GSR 以 µS 为单位)；
+                或 {'emg': {...}, 'gsr': {...}} 覆盖 signal_quality 中的阈值。
+                启用时 compute_cei 只在合格窗口上计算特征，会话质量统计保存在 quality_stats
+            baseline_tracking: 在线基线跟踪，None 不跟踪；True 使用默认参数；
+                或 BaselineTracker 的参数 dict。启用时 compute_cei 的归一化参数随数据增量更新，
+                跟踪状态 (baseline_tracker) 跨多次 compute_cei 调用保持，可逐块输入长会话
         """
         self.fs_emg = sampling_rate_emg
         self.fs_gsr = sampling_rate_gsr
+        self.vectorized = vectorized
+        self.chunk_seconds = chunk_seconds
+        self.calibration_store = calibration_store
+        self.dtype = float_dtype(precision)
+        self.quality = {'emg': {}, 'gsr': {}} if quality is True else quality
+        self.quality_stats = None
+        self.baseline_tracking = {} if baseline_tracking is True else baseline_tracking
+        self.baseline_tracker = None
 
     def load_calibration_data(self, emg_rest, emg_grip, gsr_rest, gsr_grip):
         """
@@ -32,38 +70,38 @@ class GestureFlowAnalyzer:
             gsr_rest: 静息期GSR数据
             gsr_grip: 激活期GSR数据
         """
-        # EMG特征提取
-        emg_rest_rms = self.compute_rms(emg_rest)
-        emg_grip_rms = self.compute_rms(emg_grip)
-
-        # GSR特征提取
-        gsr_rest_slope = self.compute_slope(gsr_rest)
-        gsr_grip_slope = self.compute_slope(gsr_grip)
-
-        # 计算个体化阈值 (p10-p90)
-        self.emg_threshold = np.percentile([emg_rest_rms, emg_grip_rms], 90)
-        self.gsr_threshold = np.percentile([gsr_rest_slope, gsr_grip_slope], 90)
-
-        # 存储校准参数
-        self.calibration = {
-            'emg_rest_mean': np.mean(emg_rest_rms),
-            'emg_grip_mean': np.mean(emg_grip_rms),
-            'gsr_rest_mean': np.mean(gsr_rest_slope),
-            'gsr_grip_mean': np.mean(gsr_grip_slope),
-            'emg_threshold': self.emg_threshold,
-            'gsr_threshold': self.gsr_threshold
-        }
+        # 特征提取与个体化阈值 (p10-p90)，与校准存储的批量计算共用同一定义
+        record = {'participant': '', 'emg_rest': emg_rest, 'emg_grip': emg_grip,
+                  'gsr_rest': gsr_rest, 'gsr_grip': gsr_grip}
+        row = compute_calibrations([record], fs_emg=self.fs_emg, fs_gsr=self.fs_gsr).iloc[0]
+
+        self.emg_threshold = row['emg_threshold']
+        self.gsr_threshold = row['gsr_threshold']
 
-    def compute_rms(self, signal, window_size=1.0):
+        # 存储校准参数；新的校准使在线跟踪重新开始
+        self.calibration = {k: row[k] for k in CALIBRATION_COLUMNS}
+        self.baseline_tracker = None
+
+    def compute_rms(self, signal, window_size=1.0, mask=None):
         """
         计算RMS (均方根)
         Args:
             signal: 输入信号
             window_size: 窗口大小 (秒)
+            mask: 窗口掩码 (如 assess_quality 的 emg_mask)，False 的窗口不计算、输出NaN
         Returns:
             RMS值数组
         """
         samples_per_window = int(window_size * self.fs_emg)
+        if self.vectorized:
+            if self.chunk_seconds:
+                return chunked_windows(signal, samples_per_window, samples_per_window // 2, rolling_rms,
+                                       int(self.chunk_seconds * self.fs_emg), dtype=self.dtype, mask=mask)
+            return rolling_rms(signal, samples_per_window, samples_per_window // 2, dtype=self.dtype, mask=mask)
+        return self._apply_mask(self._compute_rms_reference(signal, samples_per_window), mask)
+
+    def _compute_rms_reference(self, signal, samples_per_window):
+        """逐窗口循环的RMS参考实现"""
         rms_values = []
 
         for i in range(0, len(signal) - samples_per_window, samples_per_window // 2):
@@ -73,16 +111,106 @@ class GestureFlowAnalyzer:
 
         return np.array(rms_values)
 
-    def compute_slope(self, signal, window_size=5.0):
+    def compute_emg_features(self, signal, window_size=1.0, mask=None):
+        """
+        计算EMG窗口特征：RMS、过零率(ZC)、中值频率(MDF)
+        窗口与 compute_rms 相同，全部窗口一次向量化计算
+        Args:
+            signal: 输入信号
+            window_size: 窗口大小 (秒)
+            mask: 窗口掩码，False 的窗口不计算、输出NaN
+        Returns:
+            DataFrame，列为 rms / zcr (次/秒) / mdf (Hz)
+        """
+        samples_per_window = int(window_size * self.fs_emg)
+        step = samples_per_window // 2
+        if not self.chunk_seconds:
+            return pd.DataFrame(rolling_emg_features(signal, samples_per_window, step, self.fs_emg,
+                                                     dtype=self.dtype, mask=mask))
+
+        parts, done = [], 0
+        for n_windows, block in iter_window_blocks(signal, samples_per_window, step,
+                                                   int(self.chunk_seconds * self.fs_emg), dtype=self.dtype):
+            block_mask = None
+            if mask is not None:
+                extra = len(window_starts(len(block), samples_per_window, step, True)) - n_windows
+                block_mask = np.concatenate([mask[done:done + n_windows], np.zeros(extra, dtype=bool)])
+            parts.append(pd.DataFrame(rolling_emg_features(block, samples_per_window, step, self.fs_emg,
+                                                           include_last=True, dtype=self.dtype,
+                                                           mask=block_mask)).iloc[:n_windows])
+            done += n_windows
+        if not parts:
+            return pd.DataFrame(columns=['rms', 'zcr', 'mdf'], dtype=self.dtype)
+        return pd.concat(parts, ignore_index=True)
+
+    def compute_slope(self, signal, window_size=5.0, mask=None):
         """
         计算GSR斜率特征
         Args:
             signal: 输入GSR信号
             window_size: 窗口大小 (秒)
+            mask: 窗口掩码 (如 assess_quality 的 gsr_mask)，False 的窗口不计算、输出NaN
         Returns:
             斜率值数组
         """
         samples_per_window = int(window_size * self.fs_gsr)
+        if self.vectorized:
+            if self.chunk_seconds:
+                return chunked_windows(signal, samples_per_window, samples_per_window // 2, rolling_slope,
+                                       int(self.chunk_seconds * self.fs_gsr), dtype=self.dtype, mask=mask,
+                                       dt=1.0 / self.fs_gsr)
+            return rolling_slope(signal, samples_per_window, samples_per_window // 2,
+                                 dt=1.0 / self.fs_gsr, dtype=self.dtype, mask=mask)
+        return self._apply_mask(self._compute_slope_reference(signal, samples_per_window), mask)
+
+    @staticmethod
+    def _apply_mask(values, mask):
+        """参考实现不支持跳过窗口：计算后将掩码外的窗口置为NaN"""
+        if mask is None:
+            return values
+        values = np.asarray(values, dtype=float).copy()
+        values[~window_mask(mask, len(values))] = np.nan
+        return values
+
+    def assess_quality(self, emg_data, gsr_data, emg_window_size=1.0, gsr_window_size=5.0):
+        """
+        按 compute_rms / compute_slope 的窗口检查信号质量
+        Args:
+            emg_data: EMG数据
+            gsr_data: GSR数据
+            emg_window_size: EMG窗口 (秒)
+            gsr_window_size: GSR窗口 (秒)
+        Returns:
+            {'emg_mask': ..., 'gsr_mask': ... (True 为合格窗口),
+             'stats': {'emg': quality_summary, 'gsr': quality_summary}}；
+            某一路全部窗口不合格时发出 RuntimeWarning
+        """
+        quality = self.quality or {}
+        w_emg = int(emg_window_size * self.fs_emg)
+        w_gsr = int(gsr_window_size * self.fs_gsr)
+        emg_kwargs = dict(quality.get('emg', {}), fs=self.fs_emg)
+        gsr_kwargs = dict(quality.get('gsr', {}))
+        if emg_kwargs.get('clip_level') is None:
+            # 削顶电平按整段会话确定，分块与整段计算的判定一致
+            emg_kwargs['clip_level'] = session_rail(emg_data, self.dtype)
+        if self.chunk_seconds:
+            emg_flags = chunked_windows(emg_data, w_emg, w_emg // 2, rolling_emg_quality,
+                                        int(self.chunk_seconds * self.fs_emg), dtype=self.dtype, **emg_kwargs)
+            gsr_flags = chunked_windows(gsr_data, w_gsr, w_gsr // 2, rolling_gsr_quality,
+                                        int(self.chunk_seconds * self.fs_gsr), dtype=self.dtype, **gsr_kwargs)
+        else:
+            emg_flags = rolling_emg_quality(emg_data, w_emg, w_emg // 2, dtype=self.dtype, **emg_kwargs)
+            gsr_flags = rolling_gsr_quality(gsr_data, w_gsr, w_gsr // 2, dtype=self.dtype, **gsr_kwargs)
+        warn_if_all_rejected(emg_flags, 'EMG')
+        warn_if_all_rejected(gsr_flags, 'GSR')
+        return {
+            'emg_mask': emg_flags == 0,
+            'gsr_mask': gsr_flags == 0,
+            'stats': {'emg': quality_summary(emg_flags), 'gsr': quality_summary(gsr_flags)},
+        }
+
+    def _compute_slope_reference(self, signal, samples_per_window):
+        """逐窗口 np.polyfit 的斜率参考实现"""
         slopes = []
 
         for i in range(0, len(signal) - samples_per_window, samples_per_window // 2):
@@ -94,81 +222,141 @@ class GestureFlowAnalyzer:
 
         return np.array(slopes)
 
-    def compute_cei(self, emg_data, gsr_data):
+    def compute_peak_rate(self, signal, window_size=5.0, **detector_kwargs):
+        """
+        计算GSR峰率 (次/分钟)，窗口与 compute_slope 相同
+        Args:
+            signal: 输入GSR信号
+            window_size: 窗口大小 (秒)
+            **detector_kwargs: 峰检测阈值 (amplitude / refractory_s / rise_s)
+        Returns:
+            峰率数组
+        """
+        samples_per_window = int(window_size * self.fs_gsr)
+        chunk = int(self.chunk_seconds * self.fs_gsr) if self.chunk_seconds else None
+        peaks = detect_peaks(signal, self.fs_gsr, chunk_samples=chunk, **detector_kwargs)
+        return peak_rate(peaks, len(signal), samples_per_window, samples_per_window // 2, self.fs_gsr)
+
+    def compute_cei(self, emg_data, gsr_data, participant=None, start_time=0.0):
         """
         计算CEI (Combination Embodied Index)
         CEI = 0.6 * z(RMS_EMG) + 0.4 * z(slope_GSR)
         Args:
             emg_data: EMG数据
             gsr_data: GSR数据
+            participant: 参与者ID；指定时从校准存储按窗口时间查找校准参数，
+                否则使用 load_calibration_data 的结果
+            start_time: 会话起始时间 (秒，与校准记录的时间同一时间轴)
         Returns:
             CEI时间序列
         """
-        # 计算特征
-        emg_rms = self.compute_rms(emg_data)
-        gsr_slope = self.compute_slope(gsr_data)
+        # 计算特征 (启用质量检查时不合格窗口不计算，CEI为NaN)
+        emg_mask = gsr_mask = None
+        if self.quality is not None:
+            quality = self.assess_quality(emg_data, gsr_data)
+            emg_mask, gsr_mask = quality['emg_mask'], quality['gsr_mask']
+            self.quality_stats = quality['stats']
+        emg_rms = self.compute_rms(emg_data, mask=emg_mask)
+        gsr_slope = self.compute_slope(gsr_data, mask=gsr_mask)
+
+        # 两路特征的窗口不同 (EMG 1s/0.5s，GSR 5s/2.5s)：每个EMG窗口取中心最近的GSR窗口
+        gsr_slope = self._align_gsr_to_emg(len(emg_rms), gsr_slope)
 
         # 归一化处理
-        emg_norm = (emg_rms - self.calibration['emg_rest_mean']) / (self.calibration['emg_grip_mean'] - self.calibration['emg_rest_mean'])
-        gsr_norm = (gsr_slope - self.calibration['gsr_rest_mean']) / (self.calibration['gsr_grip_mean'] - self.calibration['gsr_rest_mean'])
+        if self.baseline_tracking is not None:
+            cal = self._tracked_calibration(emg_rms, gsr_slope, participant, start_time)
+        else:
+            cal = self._calibration_for(len(emg_rms), participant, start_time)
+        emg_norm = (emg_rms - cal['emg_rest_mean']) / (cal['emg_grip_mean'] - cal['emg_rest_mean'])
+        gsr_norm = (gsr_slope - cal['gsr_rest_mean']) / (cal['gsr_grip_mean'] - cal['gsr_rest_mean'])
 
         # 限制在[0,1]范围内
         emg_norm = np.clip(emg_norm, 0, 1)
         gsr_norm = np.clip(gsr_norm, 0, 1)
 
-        # 计算CEI
+        # 计算CEI (校准参数为 float64，结果转回计算精度)
         cei = 0.6 * emg_norm + 0.4 * gsr_norm
 
-        return cei
+        return cei.astype(self.dtype, copy=False)
+
+    def _calibration_for(self, n_emg_windows, participant, start_time, emg_window_size=1.0):
+        """每个EMG窗口生效的校准参数 (标量或与窗口等长的数组)"""
+        if participant is None or self.calibration_store is None:
+            return self.calibration
+        w_emg = int(emg_window_size * self.fs_emg)
+        centers = start_time + (np.arange(n_emg_windows) * (w_emg // 2) + w_emg / 2) / self.fs_emg
+        table = self.calibration_store.lookup_many(np.repeat(participant, n_emg_windows), centers)
+        return {k: table[k].to_numpy() for k in table.columns}
+
+    def _tracked_calibration(self, emg_rms, gsr_slope, participant, start_time, emg_window_size=1.0):
+        """在线跟踪的归一化参数；首次调用时以当前校准 (或校准存储在会话起点的记录) 初始化跟踪器"""
+        if self.baseline_tracker is None:
+            w_emg = int(emg_window_size * self.fs_emg)
+            initial = self._calibration_for(1, participant, start_time)
+            self.baseline_tracker = BaselineTracker(initial, step_s=(w_emg // 2) / self.fs_emg,
+                                                    **self.baseline_tracking)
+        return self.baseline_tracker.update(emg_rms, gsr_slope)
+
+    def _align_gsr_to_emg(self, n_emg_windows, gsr_values, emg_window_size=1.0, gsr_window_size=5.0):
+        """将GSR窗口特征按时间对齐到 compute_rms 的窗口上"""
+        if len(gsr_values) == 0:
+            return np.full(n_emg_windows, np.nan)
+        w_emg = int(emg_window_size * self.fs_emg)
+        w_gsr = int(gsr_window_size * self.fs_gsr)
+        emg_centers = (np.arange(n_emg_windows) * (w_emg // 2) + w_emg / 2) / self.fs_emg
+        gsr_starts = np.arange(len(gsr_values)) * (w_gsr // 2) / self.fs_gsr
+        return np.asarray(gsr_values)[nearest_window(emg_centers, gsr_starts, w_gsr / self.fs_gsr)]
 
     def analyze_focus_duration(self, window_events, session_data):
         """
-        分析专注时长
+        分析专注时长 (列式提取见 focus_episodes；大型日志用 stream_focus_episodes 流式读取)
         Args:
-            window_events: 窗口切换事件
+            window_events: 窗口切换事件 (事件 dict 的列表或事件 DataFrame)
             session_data: 会话数据
         Returns:
-            专注统计结果
-        """
-        focus_durations = []
-        current_app = None
-        focus_start = None
-
-        for event in window_events:
-            if event['type'] == 'focus':
-                if current_app is None:
-                    focus_start = event['timestamp']
-                current_app = event['app']
-
-            elif event['type'] == 'blur':
-                if focus_start is not None:
-                    duration = event['timestamp'] - focus_start
-                    if duration > 60:  # 只计算>1分钟的专注时间
-                        focus_durations.append({
-                            'app': current_app,
-                            'duration': duration,
-                            'timestamp': focus_start
-                        })
-                    focus_start = None
-                    current_app = None
-
-        return focus_durations
-
-    def statistical_analysis(self, condition_A_data, condition_B_data):
+            专注统计结果：每个片段一个 {'app', 'duration', 'timestamp'}
+        """
+        # 只计算>1分钟的专注时间
+        episodes = focus_episodes(window_events, min_duration=60)
+        return episodes[['app', 'duration', 'timestamp']].to_dict('records')
+
+    def analyze_behavior(self, window_events, n_windows, start_time=0.0, emg_window_size=1.0, **kwargs):
+        """
+        中断恢复时间与击键突发长度，汇总到 compute_cei 的窗口上
+        Args:
+            window_events: 事件列表或 DataFrame (focus/blur 窗口事件与 type='key' 的击键事件)
+            n_windows: CEI 窗口数 (len(compute_cei(...)))
+            start_time: 会话起始时间 (秒，与事件时间戳同一时间轴)
+            emg_window_size: EMG窗口 (秒)，与 compute_rms 一致
+            **kwargs: 传给 behavior_metrics (main / key_type / max_gap)
+        Returns:
+            behavior_metrics 的结果；'grid' 的行与CEI窗口一一对应
+        """
+        w_emg = int(emg_window_size * self.fs_emg)
+        grid = start_time + np.arange(n_windows) * (w_emg // 2) / self.fs_emg
+        return behavior_metrics(window_events, grid, w_emg / self.fs_emg, **kwargs)
+
+    def statistical_analysis(self, condition_A_data, condition_B_data, n_resamples=0, seed=None):
         """
         执行统计分析 (配对t检验/Wilcoxon)
+        n_resamples > 0 时效应量与均值变化附 bootstrap 95% 置信区间，另给出符号翻转置换检验p值；
+        默认不重抽样，与根目录 paired_test 一致 (需要时显式传入，如 n_resamples=10000)
         Args:
             condition_A_data: 对照组数据
             condition_B_data: 干预组数据
+            n_resamples: bootstrap/置换次数，0 (默认) 表示只做参数检验
+            seed: 随机种子；本次分析的全部重抽样共用一个随机数流
         Returns:
             统计结果字典
         """
         results = {}
+        rng = make_rng(seed)
 
         # 专注时长比较
         if len(condition_A_data['focus_durations']) > 0 and len(condition_B_data['focus_durations']) > 0:
-            A_focus = [d['duration'] for d in condition_A_data['focus_durations']]
-            B_focus = [d['duration'] for d in condition_B_data['focus_durations']]
+            # 片段可为 analyze_focus_duration 的列表或 focus_episodes 的 DataFrame
+            A_focus = pd.DataFrame(condition_A_data['focus_durations'])['duration'].to_numpy(dtype=float)
+            B_focus = pd.DataFrame(condition_B_data['focus_durations'])['duration'].to_numpy(dtype=float)
 
             # 配对t检验
             t_stat, p_value = stats.ttest_rel(A_focus, B_focus)
@@ -183,6 +371,13 @@ class GestureFlowAnalyzer:
                 'effect_size': effect_size,
                 'significant': p_value < 0.05
             }
+            if n_resamples:
+                ci = bootstrap_ci(cohens_dz, (B_focus, A_focus), n_resamples=n_resamples, rng=rng)
+                perm = sign_flip_test(B_focus - A_focus, t_statistic, n_resamples=n_resamples, rng=rng)
+                results['focus_duration'].update({
+                    'effect_size_ci': (ci['low'], ci['high']),
+                    'p_permutation': perm['p'],
+                })
 
         # CEI变化分析
         if 'pre_intervention_cei' in condition_B_data and 'post_intervention_cei' in condition_B_data:
@@ -199,98 +394,107 @@ class GestureFlowAnalyzer:
                 'p_value': p_value,
                 'significant': p_value < 0.05
             }
+            if n_resamples:
+                pre_cei, post_cei = np.asarray(pre_cei, dtype=float), np.asarray(post_cei, dtype=float)
+                ci = bootstrap_ci(mean_diff, (post_cei, pre_cei), n_resamples=n_resamples, rng=rng)
+                perm = sign_flip_test(post_cei - pre_cei, t_statistic, n_resamples=n_resamples, rng=rng)
+                results['cei_change'].update({
+                    'change_ci': (ci['low'], ci['high']),
+                    'p_permutation': perm['p'],
+                })
 
         return results
 
-    def generate_visualizations(self, results, output_dir='./figures'):
+    def cei_pyramid(self, cei, start_time=0.0, path=None, emg_window_size=1.0):
+        """
+        CEI 的 min/mean/max 多分辨率金字塔 (时间轴为 compute_cei 的窗口起始时间)
+        Args:
+            cei: compute_cei 的结果
+            start_time: 会话起始时间 (秒)
+            path: 给出时保存为 .npz，之后可用 CEIPyramid.load 读取
+            emg_window_size: EMG窗口 (秒)，与 compute_rms 一致
+        Returns:
+            CEIPyramid
+        """
+        w_emg = int(emg_window_size * self.fs_emg)
+        times = start_time + np.arange(len(cei)) * (w_emg // 2) / self.fs_emg
+        pyramid = CEIPyramid.build(times, cei)
+        if path is not None:
+            pyramid.save(path)
+        return pyramid
+
+    def intervention_windows(self, cei_series, interventions, pre_s=300.0, post_s=300.0, gap_s=0.0):
+        """
+        全部参与者全部干预的前后窗口CEI (一次向量化查询)
+        Args:
+            cei_series: 长表 DataFrame，列 participant / time (秒) / cei
+            interventions: DataFrame，列 participant / time (干预时刻，如 MRT 推送)
+            pre_s: 干预前窗口长度 (秒)
+            post_s: 干预后窗口长度 (秒)
+            gap_s: 干预后跳过的时长 (秒)
+        Returns:
+            DataFrame，每次干预一行：participant / anchor / pre / post / pre_n / post_n / change；
+            pre / post 列可作为 statistical_analysis 的 pre_intervention_cei / post_intervention_cei
+        """
+        index = TimeIndex(cei_series['time'], cei_series['cei'], cei_series['participant'].astype(str))
+        windows = index.pre_post(interventions['time'].to_numpy(dtype=float), pre_s=pre_s, post_s=post_s,
+                                 gap_s=gap_s, groups=interventions['participant'].astype(str).to_numpy())
+        return windows.rename(columns={'group': 'participant'})
+
+    def abab_analysis(self, measurements, value='focus_duration', order='day', min_phase=1, **kwargs):
+        """
+        ABAB设计的随机化检验 (替代把A/B数据当作普通配对样本的检验)
+        Args:
+            measurements: 长表 DataFrame，列含 participant / condition ('A'/'B') / order / value
+            value: 测量值列名
+            order: 测量点排序列 (如 day 或时段序号)
+            min_phase: 每阶段最少测量点数
+            **kwargs: 传给 abab_randomization_test (statistic / alternative / n_resamples / seed)
+        Returns:
+            abab_randomization_test 的结果
+        """
+        data = measurements.sort_values(['participant', order], kind='stable')
+        participants = {
+            pid: (group[value].to_numpy(dtype=float), group['condition'].astype(str).tolist())
+            for pid, group in data.groupby('participant', sort=False)
+        }
+        return abab_randomization_test(participants, min_phase=min_phase, **kwargs)
+
+    def generate_visualizations(self, results, output_dir='./figures', workers=None, force=False):
         """
         生成CHI论文所需的可视化图表
+        各图表相互独立，在进程池中并行渲染；输入数据、参数与绘图代码都未变化的图表跳过 (见 figure_build)
         Args:
             results: 分析结果
             output_dir: 输出目录
+            workers: 渲染进程数，None 为CPU核数，1 为在当前进程中顺序渲染
+            force: 为 True 时全部重新渲染
+        Returns:
+            {输出文件路径: 'built' / 'skipped'}
         """
         output_path = Path(output_dir)
         output_path.mkdir(exist_ok=True)
 
+        tasks = []
+
         # 图1: 专注时长对比 (A/B条件)
         if 'focus_duration' in results:
-            fig, (ax1, ax2) = plt.subplots(1, 2, figsize=(12, 5))
-
-            # 左侧：个人对比图
-            participants = results['focus_duration']['participants_data']
-            A_durations = [p['A_duration'] for p in participants]
-            B_durations = [p['B_duration'] for p in participants]
-            participant_ids = [p['id'] for p in participants]
+            tasks.append(FigureTask(output_path / 'figure_2_focus_duration.png', f"{__file__}:plot_focus_duration",
+                                    args=(results['focus_duration'],)))
 
-            x = np.arange(len(participant_ids))
-            width = 0.35
+        # 图2: CEI时间序列变化 (金字塔以路径给出时按文件内容计入哈希)
+        if 'cei_time_series' in results or 'cei_pyramid' in results:
+            data = {key: results[key] for key in CEI_FIGURE_KEYS if key in results}
+            if isinstance(data.get('cei_pyramid'), str):
+                data['cei_pyramid'] = Path(data['cei_pyramid'])
+            tasks.append(FigureTask(output_path / 'figure_3_cei_time_series.png', f"{__file__}:plot_cei_time_series",
+                                    args=(data,), deps=FIGURE_DEPS))
 
-            ax1.bar(x - width/2, A_durations, width, label='Control (A)', alpha=0.7, color='lightcoral')
-            ax1.bar(x + width/2, B_durations, width, label='Intervention (B)', alpha=0.7, color='lightblue')
+        status = build_figures(tasks, workers, force)
 
-            # 添加总体均值线
-            ax1.axhline(y=results['focus_duration']['A_mean'], color='red', linestyle='--', alpha=0.5)
-            ax1.axhline(y=results['focus_duration']['B_mean'], color='blue', linestyle='--', alpha=0.5)
-
-            ax1.set_xlabel('Participants')
-            ax1.set_ylabel('Focus Duration (seconds)')
-            ax1.set_title('Individual Focus Duration: Control vs Intervention')
-            ax1.set_xticks(x)
-            ax1.set_xticklabels(participant_ids)
-            ax1.legend()
-            ax1.grid(True, alpha=0.3)
-
-            # 右侧：汇总柱状图
-            means = [results['focus_duration']['A_mean'], results['focus_duration']['B_mean']]
-            labels = ['Control (A)', 'Intervention (B)']
-            colors = ['lightcoral', 'lightblue']
-
-            bars = ax2.bar(labels, means, color=colors, alpha=0.7)
-            ax2.set_ylabel('Mean Focus Duration (seconds)')
-            ax2.set_title(f'Focus Duration Improvement: +{results["focus_duration"]["improvement_percent"]:.1f}%')
-
-            # 添加数值标签
-            for bar, mean in zip(bars, means):
-                height = bar.get_height()
-                ax2.text(bar.get_x() + bar.get_width()/2., height,
-                        f'{int(mean)}s', ha='center', va='bottom')
-
-            # 添加显著性标记
-            if results['focus_duration']['significant']:
-                ax2.text(0.5, max(means)*1.05, f'p = {results["focus_duration"]["p_value"]:.3f}*',
-                        ha='center', transform=ax2.transAxes)
-
-            ax2.grid(True, alpha=0.3)
-
-            plt.tight_layout()
-            plt.savefig(output_path / 'figure_2_focus_duration.png', dpi=300, bbox_inches='tight')
-            plt.close()
-
-        # 图2: CEI时间序列变化
-        if 'cei_time_series' in results:
-            fig, ax = plt.subplots(figsize=(10, 6))
-
-            time_series = results['cei_time_series']
-            intervention_time = results['intervention_timestamp']
-
-            ax.plot(time_series['time'], time_series['cei'], 'b-', linewidth=2, alpha=0.7, label='CEI')
-            ax.axvline(x=intervention_time, color='red', linestyle='--', alpha=0.7, label='Intervention')
-
-            # 添加5分钟窗口高亮
-            intervention_end = intervention_time + 300  # 5分钟后
-            ax.axvspan(intervention_time, intervention_end, alpha=0.2, color='green', label='5-min window')
-
-            ax.set_xlabel('Time (seconds)')
-            ax.set_ylabel('CEI (Combination Embodied Index)')
-            ax.set_title('CEI Response to Intervention: 5-min Window Analysis')
-            ax.legend()
-            ax.grid(True, alpha=0.3)
-
-            plt.tight_layout()
-            plt.savefig(output_path / 'figure_3_cei_time_series.png', dpi=300, bbox_inches='tight')
-            plt.close()
-
-        print(f"可视化图表已保存到: {output_path}")
+        print(f"可视化图表已保存到: {output_path} "
+              f"(渲染 {list(status.values()).count('built')} 张，跳过 {list(status.values()).count('skipped')} 张)")
+        return status
 
     def export_results_table(self, results, output_path='./results_table.csv'):
         """
@@ -345,14 +549,126 @@ class GestureFlowAnalyzer:
         print(f"结果表格已保存到: {output_path}")
 
 
+# 可视化中各图表的绘图函数：只依赖传入的数据并返回 Figure，由 figure_build 在进程池中渲染
+# figure_3 使用的结果键 (其余键的变化不会使该图表重新渲染)
+CEI_FIGURE_KEYS = ('cei_pyramid', 'cei_time_series', 'intervention_timestamps', 'intervention_timestamp',
+                   'intervention_window_s', 'downsample', 'max_points')
+# figure_3 绘图代码导入的模块，按内容计入哈希
+FIGURE_DEPS = [Path(__file__).with_name(f'{name}.py') for name in ('cei_pyramid', 'downsample', 'event_windows')]
+
+
+def plot_focus_duration(focus_duration):
+    """图1: 专注时长对比 (A/B条件)；focus_duration 为 analyze_focus_duration 的结果"""
+    fig, (ax1, ax2) = plt.subplots(1, 2, figsize=(12, 5))
+
+    # 左侧：个人对比图
+    participants = focus_duration['participants_data']
+    A_durations = [p['A_duration'] for p in participants]
+    B_durations = [p['B_duration'] for p in participants]
+    participant_ids = [p['id'] for p in participants]
+
+    x = np.arange(len(participant_ids))
+    width = 0.35
+
+    ax1.bar(x - width/2, A_durations, width, label='Control (A)', alpha=0.7, color='lightcoral')
+    ax1.bar(x + width/2, B_durations, width, label='Intervention (B)', alpha=0.7, color='lightblue')
+
+    # 添加总体均值线
+    ax1.axhline(y=focus_duration['A_mean'], color='red', linestyle='--', alpha=0.5)
+    ax1.axhline(y=focus_duration['B_mean'], color='blue', linestyle='--', alpha=0.5)
+
+    ax1.set_xlabel('Participants')
+    ax1.set_ylabel('Focus Duration (seconds)')
+    ax1.set_title('Individual Focus Duration: Control vs Intervention')
+    ax1.set_xticks(x)
+    ax1.set_xticklabels(participant_ids)
+    ax1.legend()
+    ax1.grid(True, alpha=0.3)
+
+    # 右侧：汇总柱状图
+    means = [focus_duration['A_mean'], focus_duration['B_mean']]
+    labels = ['Control (A)', 'Intervention (B)']
+    colors = ['lightcoral', 'lightblue']
+
+    bars = ax2.bar(labels, means, color=colors, alpha=0.7)
+    ax2.set_ylabel('Mean Focus Duration (seconds)')
+    ax2.set_title(f'Focus Duration Improvement: +{focus_duration["improvement_percent"]:.1f}%')
+
+    # 添加数值标签
+    for bar, mean in zip(bars, means):
+        height = bar.get_height()
+        ax2.text(bar.get_x() + bar.get_width()/2., height,
+                f'{int(mean)}s', ha='center', va='bottom')
+
+    # 添加显著性标记
+    if focus_duration['significant']:
+        ax2.text(0.5, max(means)*1.05, f'p = {focus_duration["p_value"]:.3f}*',
+                ha='center', transform=ax2.transAxes)
+
+    ax2.grid(True, alpha=0.3)
+
+    plt.tight_layout()
+    return fig
+
+
+def plot_cei_time_series(results):
+    """图2: CEI时间序列变化；results 中使用 CEI_FIGURE_KEYS"""
+    fig, ax = plt.subplots(figsize=(10, 6))
+
+    # 按绘图区域在 300 dpi 下的像素宽度取点：金字塔中对应分辨率的一层给出 min/max 范围，
+    # 曲线为区间均值，由点数不少于预算的最粗一层降采样 (downsample: 'lttb' 默认 / 'minmax' / None 为该层原样)，
+    # 渲染开销不随会话时长增长
+    # cei_pyramid 可为 CEIPyramid 或其 .npz 路径；未给出时由 cei_time_series 构建
+    pyramid = results.get('cei_pyramid')
+    if pyramid is None:
+        pyramid = CEIPyramid.build(results['cei_time_series']['time'], results['cei_time_series']['cei'])
+    elif not isinstance(pyramid, CEIPyramid):
+        pyramid = CEIPyramid.load(pyramid)
+    max_points = results.get('max_points') or point_budget(ax, dpi=300)  # 与 savefig 的 dpi 一致
+    method = results.get('downsample', 'lttb')
+    series = pyramid.query(max_points=max_points)
+    # 第0层每个区间只有一个窗口 (min 即原值)，只用于干预前后的统计
+    time_series = {'time': pyramid.levels[0]['t0'], 'cei': pyramid.levels[0]['min']}
+    # 干预时刻：intervention_timestamps (多次) 或 intervention_timestamp (单次)；窗口长度默认5分钟
+    anchors = np.atleast_1d(results.get('intervention_timestamps',
+                                        results.get('intervention_timestamp', []))).astype(float)
+    window_s = results.get('intervention_window_s', 300)
+
+    if series.attrs['level'] == 0:
+        ax.plot(series['time'], series['mean'], 'b-', linewidth=2, alpha=0.7, label='CEI')
+    else:
+        ax.fill_between(series['time'], series['min'], series['max'], color='b', alpha=0.15,
+                        linewidth=0, label='CEI range')
+        source = pyramid.query(max_points=max_points, level=pyramid.source_level(max_points))
+        line_t, line_cei = downsample(source['time'], source['mean'], max_points, method)
+        ax.plot(line_t, line_cei, 'b-', linewidth=1, alpha=0.7, label='CEI (mean)')
+    title = 'CEI Response to Intervention'
+    for i, anchor in enumerate(anchors):
+        ax.axvline(x=anchor, color='red', linestyle='--', alpha=0.7, label='Intervention' if i == 0 else None)
+        ax.axvspan(anchor, anchor + window_s, alpha=0.2, color='green',
+                   label=f'{window_s / 60:g}-min window' if i == 0 else None)
+    if anchors.size:
+        windows = TimeIndex(time_series['time'], time_series['cei']).pre_post(anchors, window_s, window_s)
+        title += f': {window_s / 60:g}-min Window Analysis (mean Δ = {np.nanmean(windows["change"]):+.3f})'
+
+    ax.set_xlabel('Time (seconds)')
+    ax.set_ylabel('CEI (Combination Embodied Index)')
+    ax.set_title(title)
+    ax.legend()
+    ax.grid(True, alpha=0.3)
+
+    plt.tight_layout()
+    return fig
+
+
 def main():
     """主函数示例用法"""
     print("🧠 GestureFlow CEI计算和统计分析脚本")
     print("📋 严格限制: 仅使用1路sEMG (200Hz) + 1路GSR (4-10Hz)")
     print("🎯 专注于CHI Poster论文所需的关键分析")
 
-    # 创建分析器实例
-    analyzer = GestureFlowAnalyzer()
+    # 创建分析器实例 (按10分钟数据块计算，长会话无需整体读入内存)
+    analyzer = GestureFlowAnalyzer(chunk_seconds=600)
 
     # 示例数据路径 (实际使用时替换为真实数据)
     emg_data_file = "data/emg_session.npy"
@@ -361,9 +677,9 @@ def main():
     if Path(emg_data_file).exists() and Path(gsr_data_file).exists():
         print(f"✅ 找到数据文件，开始分析...")
 
-        # 加载数据
-        emg_data = np.load(emg_data_file)
-        gsr_data = np.load(gsr_data_file)
+        # 以内存映射方式打开数据
+        emg_data = open_session(emg_data_file)
+        gsr_data = open_session(gsr_data_file)
 
         # 加载校准数据
         # (实际使用时需要从校准文件加载)
@@ -375,7 +691,7 @@ def main():
 
         # 生成可视化
         print("📈 生成可视化图表...")
-        results = {'cei_time_series': {'time': np.arange(len(cei))/200, 'cei': cei}}
+        results = {'cei_pyramid': analyzer.cei_pyramid(cei, path='data/cei_pyramid.npz')}
         analyzer.generate_visualizations(results)
 
         print("✅ 分析完成！")
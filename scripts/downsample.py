@@ -0,0 +1,143 @@
+#!/usr/bin/env python3
+"""
+GestureFlow 时间序列降采样 (绘图用)
+    - lttb：Largest-Triangle-Three-Buckets，每个桶保留与前一选中点、后一桶均值构成三角形面积最大的点
+    - minmax：每个桶保留最小值与最大值两点 (按时间顺序)，线图的像素列包络与原序列一致
+两者都只选取原序列中的点，逐点计算全部向量化 (lttb 只有逐桶的递推是循环)；
+点数预算默认取绘图区域在输出 dpi 下的像素宽度，渲染开销与序列长度无关
+"""
+
+import numpy as np
+
+METHODS = ('lttb', 'minmax')
+
+
+def point_budget(ax, dpi=None, per_pixel=1.0):
+    """
+    绘图区域在输出分辨率下的像素宽度 (点数预算)
+    Args:
+        ax: matplotlib Axes
+        dpi: 输出 dpi (与 savefig 一致)，None 时取 figure.dpi
+        per_pixel: 每个像素列的点数
+    """
+    fig = ax.figure
+    dpi = fig.dpi if dpi is None else dpi
+    width = ax.get_position().width * fig.get_size_inches()[0] * dpi
+    return max(int(width * per_pixel), 3)
+
+
+def _buckets(values, start, stop, n_buckets, fill):
+    """values[start:stop] 按顺序等分为 n_buckets 个桶，补齐为 (n_buckets, 桶长) 的二维数组"""
+    size = -(-(stop - start) // n_buckets)
+    padded = np.full(n_buckets * size, fill, dtype=np.float64)
+    padded[:stop - start] = values[start:stop]
+    return padded.reshape(n_buckets, size), size
+
+
+def lttb(x, y, n_out):
+    """
+    Largest-Triangle-Three-Buckets 降采样
+    Args:
+        x: 时间 (递增)
+        y: 值；NaN 点只在整个桶都为 NaN 时被选中 (使折线在缺失处断开)
+        n_out: 输出点数上限 (>= 3)
+    Returns:
+        (x, y) 降采样后的数组 (首尾两点保留)
+    """
+    x = np.asarray(x, dtype=np.float64)
+    y = np.asarray(y, dtype=np.float64)
+    n = len(x)
+    if n <= max(n_out, 3):
+        return x, y
+    n_buckets = min(n_out - 2, n - 2)
+    bx, size = _buckets(x, 1, n - 1, n_buckets, np.nan)
+    by, _ = _buckets(y, 1, n - 1, n_buckets, np.nan)
+    n_buckets = -(-(n - 2) // size)
+    bx, by = bx[:n_buckets], by[:n_buckets]
+
+    # 每个桶之后的参照点：下一桶有效点的均值，最后一个桶为末点；全为 NaN 的桶沿用其后最近的有效均值
+    valid = ~np.isnan(by)
+    count = valid.sum(axis=1)
+    with np.errstate(invalid='ignore', divide='ignore'):
+        mx = np.where(valid, bx, 0.0).sum(axis=1) / count
+        my = np.where(valid, by, 0.0).sum(axis=1) / count
+    cx = np.r_[mx[1:], x[-1]]
+    cy = np.r_[my[1:], y[-1]]
+    ar = np.arange(n_buckets)
+    nxt = np.minimum.accumulate(np.where(np.isnan(cy), n_buckets - 1, ar)[::-1])[::-1]
+    cx, cy = cx[nxt], cy[nxt]
+
+    # 以 a 为前一选中点时，候选点 p 的三角形面积 (乘2) 为 |α + β·ax + γ·ay|，α/β/γ 与 a 无关，一次算出
+    alpha = bx * cy[:, None] - cx[:, None] * by
+    beta = by - cy[:, None]
+    gamma = cx[:, None] - bx
+    # 缺失点的系数置0 (面积为0)，只有桶内没有更大的有效面积时才可能被选中，此时退化处理
+    alpha, beta, gamma = (np.where(valid, v, 0.0) for v in (alpha, beta, gamma))
+
+    rows = np.arange(n_buckets)
+    pick = np.zeros(n_buckets, dtype=np.int64)
+    ax_, ay_ = x[0], y[0]
+    for i in rows:
+        area = np.abs(alpha[i] + beta[i] * ax_ + gamma[i] * ay_)
+        k = area.argmax()
+        if not valid[i, k] or np.isnan(area[k]):
+            # 前一选中点或参照点缺失时取桶内有效点的中间一个；整桶缺失时取首点 (NaN)
+            j = np.flatnonzero(valid[i])
+            k = j[len(j) // 2] if len(j) else 0
+        pick[i] = k
+        if valid[i, k]:
+            ax_, ay_ = bx[i, k], by[i, k]
+    idx = np.r_[0, 1 + rows * size + pick, n - 1]
+    return x[idx], y[idx]
+
+
+def minmax(x, y, n_out):
+    """
+    每桶最小/最大值降采样
+    Args:
+        x: 时间 (递增)
+        y: 值；整桶为 NaN 时输出一个 NaN 点
+        n_out: 输出点数上限 (每桶两点)
+    Returns:
+        (x, y) 降采样后的数组
+    """
+    x = np.asarray(x, dtype=np.float64)
+    y = np.asarray(y, dtype=np.float64)
+    n = len(x)
+    if n <= max(n_out, 2):
+        return x, y
+    n_buckets = max(n_out // 2, 1)
+    by, size = _buckets(y, 0, n, n_buckets, np.nan)
+    n_buckets = -(-n // size)
+    by = by[:n_buckets]
+    valid = ~np.isnan(by)
+    lo = np.where(valid, by, np.inf).argmin(axis=1)
+    hi = np.where(valid, by, -np.inf).argmax(axis=1)
+    base = np.arange(n_buckets) * size
+    # 桶内按时间先后输出两点，相同时只保留一个
+    first = base + np.minimum(lo, hi)
+    second = base + np.maximum(lo, hi)
+    idx = np.stack([first, second], axis=1).ravel()
+    keep = np.r_[True, idx[1:] != idx[:-1]]
+    idx = idx[keep]
+    return x[idx], y[idx]
+
+
+def downsample(x, y, n_out, method='lttb'):
+    """
+    按 method 降采样；method 为 None 时原样返回
+    Args:
+        x: 时间 (递增)
+        y: 值
+        n_out: 输出点数上限 (通常为 point_budget)
+        method: 'lttb' / 'minmax' / None
+    Returns:
+        (x, y)
+    """
+    if method is None:
+        return np.asarray(x), np.asarray(y)
+    if method == 'lttb':
+        return lttb(x, y, n_out)
+    if method == 'minmax':
+        return minmax(x, y, n_out)
+    raise ValueError(f"未知的降采样方法: {method} (可选 {METHODS})")
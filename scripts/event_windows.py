@@ -0,0 +1,107 @@
+#!/usr/bin/env python3
+"""
+GestureFlow 干预锚定的时间窗口查询
+把多名参与者的 CEI 序列合并到一条有序时间索引上 (每名参与者占据互不重叠的一段)，
+任意长度的干预前/后窗口由一次 searchsorted 定位并截断在所属参与者的范围内、前缀和求均值，
+对全部参与者的全部干预同时向量化计算
+"""
+
+import numpy as np
+import pandas as pd
+
+
+class TimeIndex:
+    """多序列的有序时间索引，建立一次后可反复查询"""
+
+    def __init__(self, times, values, groups=None):
+        """
+        Args:
+            times: 时间戳 (秒)
+            values: 对应的值 (如 CEI)，NaN 不计入窗口统计
+            groups: 每个样本所属的序列 (如参与者ID)，None 表示只有一条序列
+        """
+        t = np.asarray(times, dtype=np.float64)
+        y = np.asarray(values, dtype=np.float64)
+        g = np.zeros(len(t), dtype=np.int64) if groups is None else np.asarray(groups)
+        self.labels, codes = np.unique(g, return_inverse=True)
+        order = np.lexsort((t, codes))
+        self.codes, self.times, self.values = codes[order], t[order], y[order]
+
+        # 各序列首尾相接平移到互不重叠的一段，合并后的键整体有序；查询结果再截断在所属序列的行范围内
+        n_groups = len(self.labels)
+        self._first_row = np.searchsorted(self.codes, np.arange(n_groups), side='left')
+        self._end_row = np.searchsorted(self.codes, np.arange(n_groups), side='right')
+        self._origin = self.times[self._first_row] if len(t) else np.zeros(0)
+        span = self.times[self._end_row - 1] - self._origin if len(t) else np.zeros(0)
+        self._shift = np.concatenate([[0.0], np.cumsum(span + 1.0)])[:-1]
+        self.key = self.times - self._origin[self.codes] + self._shift[self.codes]
+
+        valid = ~np.isnan(self.values)
+        self._csum = np.concatenate([[0.0], np.cumsum(np.where(valid, self.values, 0.0))])
+        self._ccount = np.concatenate([[0], np.cumsum(valid)])
+
+    def _anchor_codes(self, anchors, groups):
+        """锚点所属序列的编号，以及该序列是否存在于索引中"""
+        n = len(np.asarray(anchors))
+        if len(self.labels) == 0:
+            return np.zeros(n, dtype=np.int64), np.zeros(n, dtype=bool)
+        if groups is None:
+            if len(self.labels) != 1:
+                raise ValueError("索引包含多条序列时需给出锚点所属的 groups")
+            return np.zeros(n, dtype=np.int64), np.ones(n, dtype=bool)
+        g = np.asarray(groups)
+        codes = np.minimum(np.searchsorted(self.labels, g), len(self.labels) - 1)
+        return codes, self.labels[codes] == g
+
+    def bounds(self, anchors, start_s, end_s, groups=None):
+        """
+        窗口 [anchor + start_s, anchor + end_s) 在 times / values 中的下标范围
+        Returns:
+            (lo, hi)：values[lo:hi] 即窗口内的样本；未知序列的锚点 lo == hi
+        """
+        codes, known = self._anchor_codes(anchors, groups)
+        lo = np.zeros(len(codes), dtype=np.int64)
+        hi = np.zeros(len(codes), dtype=np.int64)
+        if known.any():
+            c = codes[known]
+            keys = np.asarray(anchors, dtype=np.float64)[known] - self._origin[c] + self._shift[c]
+            first, end = self._first_row[c], self._end_row[c]
+            lo[known] = np.clip(np.searchsorted(self.key, keys + start_s, side='left'), first, end)
+            hi[known] = np.clip(np.searchsorted(self.key, keys + end_s, side='left'), first, end)
+        return lo, np.maximum(hi, lo)
+
+    def window_mean(self, anchors, start_s, end_s, groups=None):
+        """
+        窗口内有效值的均值与个数
+        Returns:
+            (均值数组 (没有有效值为NaN), 有效值个数数组)
+        """
+        lo, hi = self.bounds(anchors, start_s, end_s, groups)
+        count = self._ccount[hi] - self._ccount[lo]
+        with np.errstate(invalid='ignore', divide='ignore'):
+            mean = np.where(count > 0, (self._csum[hi] - self._csum[lo]) / count, np.nan)
+        return mean, count
+
+    def pre_post(self, anchors, pre_s=300.0, post_s=300.0, gap_s=0.0, groups=None):
+        """
+        全部干预的前后窗口：前 [t - pre_s, t)，后 [t + gap_s, t + gap_s + post_s)
+        Args:
+            anchors: 干预时刻
+            pre_s: 干预前窗口长度 (秒)
+            post_s: 干预后窗口长度 (秒)
+            gap_s: 干预后跳过的时长 (如提示呈现期间)
+            groups: 每个干预所属的序列
+        Returns:
+            DataFrame：group / anchor / pre / post (窗口均值) / pre_n / post_n / change (post - pre)
+        """
+        pre, pre_n = self.window_mean(anchors, -pre_s, 0.0, groups)
+        post, post_n = self.window_mean(anchors, gap_s, gap_s + post_s, groups)
+        return pd.DataFrame({
+            'group': np.zeros(len(pre), dtype=np.int64) if groups is None else np.asarray(groups),
+            'anchor': np.asarray(anchors, dtype=np.float64),
+            'pre': pre,
+            'post': post,
+            'pre_n': pre_n,
+            'post_n': post_n,
+            'change': post - pre,
+        })
@@ -0,0 +1,109 @@
+#!/usr/bin/env python3
+"""
+GestureFlow 特征缓存
+以 输入文件内容 + 特征参数 的哈希为键，将 features() 的窗口表以二进制 (.npz) 存盘，
+输入与参数均未变化时直接复用；总大小超过上限时按最近最少使用 (LRU) 淘汰
+"""
+
+import hashlib
+import json
+import os
+import tempfile
+from pathlib import Path
+
+import numpy as np
+import pandas as pd
+
+
+class FeatureCache:
+    """磁盘特征缓存；条目的修改时间即最近访问时间，多进程共享同一目录是安全的"""
+
+    def __init__(self, root, max_bytes=1 << 30):
+        """
+        Args:
+            root: 缓存目录
+            max_bytes: 缓存总大小上限 (字节)
+        """
+        self.root = Path(root)
+        self.max_bytes = max_bytes
+
+    def key(self, paths, params):
+        """
+        计算缓存键
+        Args:
+            paths: 输入文件路径列表 (按内容哈希，与文件名和修改时间无关)
+            params: 特征参数字典
+        Returns:
+            十六进制哈希字符串
+        """
+        h = hashlib.blake2b(digest_size=20)
+        for path in paths:
+            with open(path, 'rb') as f:
+                for block in iter(lambda: f.read(1 << 20), b''):
+                    h.update(block)
+        h.update(json.dumps(params, sort_keys=True).encode('utf-8'))
+        return h.hexdigest()
+
+    def _path(self, key):
+        return self.root / f"{key}.npz"
+
+    def get(self, key):
+        """
+        读取缓存条目，命中时刷新其访问时间
+        Returns:
+            DataFrame，未命中返回 None
+        """
+        path = self._path(key)
+        try:
+            with np.load(path) as data:
+                columns = [str(c) for c in data['__columns__']]
+                df = pd.DataFrame({c: data[c] for c in columns}, columns=columns)
+            os.utime(path)
+        except (FileNotFoundError, KeyError, ValueError, OSError):
+            # 条目不存在、被其他进程淘汰或文件损坏，均视为未命中
+            return None
+        return df
+
+    def put(self, key, df):
+        """写入缓存条目 (先写临时文件再原子替换)，随后按上限淘汰"""
+        self.root.mkdir(parents=True, exist_ok=True)
+        arrays = {c: df[c].to_numpy() for c in df.columns}
+        arrays['__columns__'] = np.array([str(c) for c in df.columns])
+        fd, tmp = tempfile.mkstemp(dir=self.root, suffix='.tmp')
+        with os.fdopen(fd, 'wb') as f:
+            np.savez(f, **arrays)
+        os.replace(tmp, self._path(key))
+        self.evict()
+
+    def evict(self):
+        """删除最久未访问的条目，直到总大小不超过 max_bytes"""
+        entries = []
+        for path in self.root.glob('*.npz'):
+            try:
+                st = path.stat()
+            except FileNotFoundError:
+                continue
+            entries.append((st.st_mtime, st.st_size, path))
+        total = sum(size for _, size, _ in entries)
+        for _, size, path in sorted(entries):
+            if total <= self.max_bytes:
+                break
+            path.unlink(missing_ok=True)
+            total -= size
+
+    def cached(self, paths, params, compute):
+        """
+        命中则返回缓存结果，否则调用 compute() 计算并写入缓存
+        Args:
+            paths: 输入文件路径列表
+            params: 特征参数字典
+            compute: 无参函数，返回特征 DataFrame
+        Returns:
+            特征 DataFrame
+        """
+        key = self.key(paths, params)
+        df = self.get(key)
+        if df is None:
+            df = compute()
+            self.put(key, df)
+        return df
@@ -0,0 +1,221 @@
+#!/usr/bin/env python3
+"""
+GestureFlow 图表构建
+每张图表为一个 FigureTask (返回 Figure 的绘图函数 + 参数 + 输出文件)，以
+绘图函数源文件 + 依赖文件内容 + 参数 + 保存参数 的哈希为键：输出文件存在且哈希未变的图表直接跳过，
+其余在进程池中以 Agg 后端并行渲染。哈希记录在输出文件旁的 .hash 文件中，输出先写临时文件再原子替换
+"""
+
+import argparse
+import hashlib
+import importlib.util
+import inspect
+import os
+import pickle
+import sys
+from concurrent.futures import ProcessPoolExecutor
+from pathlib import Path
+
+import matplotlib
+import numpy as np
+import pandas as pd
+
+ROOT = Path(__file__).resolve().parent.parent
+PLACEHOLDERS = ROOT / 'figures' / 'placeholders'
+
+# 与各绘图脚本原有的 savefig 参数一致
+SAVE_KWARGS = {'dpi': 300, 'bbox_inches': 'tight'}
+
+
+class FigureTask:
+    """一张图表的构建任务"""
+
+    def __init__(self, output, func, args=(), kwargs=None, deps=(), save_kwargs=None):
+        """
+        Args:
+            output: 输出文件路径 (格式由后缀决定)
+            func: 返回 matplotlib Figure 的绘图函数；模块级函数，或 '文件路径:函数名'
+                (用于不在导入路径上的脚本，如 figures/placeholders 下的图表)
+            args: 绘图函数的位置参数
+            kwargs: 绘图函数的关键字参数
+            deps: 其他影响输出的文件 (如绘图函数导入的模块)，按内容计入哈希
+            save_kwargs: savefig 参数，None 为 SAVE_KWARGS
+        """
+        self.output = Path(output)
+        self.func = func
+        self.args = tuple(args)
+        self.kwargs = dict(kwargs or {})
+        self.deps = [Path(p) for p in deps]
+        self.save_kwargs = dict(SAVE_KWARGS if save_kwargs is None else save_kwargs)
+
+    def source_file(self):
+        """绘图函数所在的源文件"""
+        if isinstance(self.func, str):
+            return Path(self.func.rsplit(':', 1)[0])
+        return Path(inspect.getsourcefile(self.func))
+
+    def digest(self):
+        """输入数据、参数与代码的哈希"""
+        h = hashlib.blake2b(digest_size=20)
+        name = self.func if isinstance(self.func, str) else f"{self.func.__module__}.{self.func.__qualname__}"
+        _update(h, [name.rsplit(':', 1)[-1], matplotlib.__version__])
+        for path in [self.source_file()] + self.deps:
+            _update_file(h, path)
+        _update(h, [self.args, self.kwargs, self.save_kwargs])
+        return h.hexdigest()
+
+    def hash_path(self):
+        return self.output.with_name(self.output.name + '.hash')
+
+    def up_to_date(self, digest=None):
+        """输出文件存在且记录的哈希与当前一致"""
+        digest = self.digest() if digest is None else digest
+        try:
+            return self.output.exists() and self.hash_path().read_text().strip() == digest
+        except OSError:
+            return False
+
+
+def _update_file(h, path):
+    h.update(str(Path(path).name).encode('utf-8'))
+    with open(path, 'rb') as f:
+        for block in iter(lambda: f.read(1 << 20), b''):
+            h.update(block)
+
+
+def _update(h, obj):
+    """把参数对象按内容写入哈希 (数组与表格按数据，路径按文件内容)"""
+    if obj is None or isinstance(obj, (bool, int, float, str, bytes, np.generic)):
+        h.update(f"{type(obj).__name__}:{obj!r};".encode('utf-8'))
+    elif isinstance(obj, np.ndarray):
+        h.update(f"ndarray:{obj.dtype.str}:{obj.shape};".encode('utf-8'))
+        h.update(pickle.dumps(obj, protocol=5) if obj.dtype.hasobject else np.ascontiguousarray(obj).tobytes())
+    elif isinstance(obj, (pd.DataFrame, pd.Series)):
+        h.update(f"{type(obj).__name__}:{list(getattr(obj, 'columns', [obj.name]))!r};".encode('utf-8'))
+        h.update(pd.util.hash_pandas_object(obj, index=True).to_numpy().tobytes())
+    elif isinstance(obj, Path):
+        h.update(b'path;')
+        if obj.is_file():
+            _update_file(h, obj)
+        else:
+            h.update(str(obj).encode('utf-8'))
+    elif isinstance(obj, dict):
+        h.update(f"dict:{len(obj)};".encode('utf-8'))
+        for key in sorted(obj, key=repr):
+            _update(h, key)
+            _update(h, obj[key])
+    elif isinstance(obj, (list, tuple)):
+        h.update(f"{type(obj).__name__}:{len(obj)};".encode('utf-8'))
+        for item in obj:
+            _update(h, item)
+    elif hasattr(obj, '__dict__'):
+        # 结果对象 (如 CEIPyramid) 按类名与属性
+        h.update(f"{type(obj).__qualname__};".encode('utf-8'))
+        _update(h, vars(obj))
+    else:
+        h.update(pickle.dumps(obj, protocol=5))
+
+
+_loaded = {}
+
+
+def _resolve(func):
+    """'文件路径:函数名' 按文件加载 (其所在目录加入导入路径，以便导入同级模块)；可调用对象原样返回"""
+    if not isinstance(func, str):
+        return func
+    path, name = func.rsplit(':', 1)
+    path = str(Path(path).resolve())
+    if path not in _loaded:
+        directory = str(Path(path).parent)
+        if directory not in sys.path:
+            sys.path.insert(0, directory)
+        spec = importlib.util.spec_from_file_location(f"_figure_{len(_loaded)}_{Path(path).stem}", path)
+        module = importlib.util.module_from_spec(spec)
+        spec.loader.exec_module(module)
+        _loaded[path] = module
+    return getattr(_loaded[path], name)
+
+
+def _init_worker():
+    matplotlib.use('Agg')
+
+
+def render(task, digest=None):
+    """
+    渲染一张图表并记录其哈希
+    Returns:
+        输出文件路径
+    """
+    import matplotlib.pyplot as plt
+
+    digest = task.digest() if digest is None else digest
+    task.output.parent.mkdir(parents=True, exist_ok=True)
+    fig = _resolve(task.func)(*task.args, **task.kwargs)
+    # 临时文件按进程区分 (以常规权限创建)，写完后原子替换
+    tmp = task.output.with_name(f".{task.output.stem}.{os.getpid()}{task.output.suffix}")
+    try:
+        fig.savefig(tmp, **task.save_kwargs)
+        os.replace(tmp, task.output)
+    except BaseException:
+        tmp.unlink(missing_ok=True)
+        raise
+    finally:
+        plt.close(fig)
+    # 哈希在输出替换之后写入，中途失败时下次会重新渲染
+    tmp = task.hash_path().with_name(f".{task.hash_path().name}.{os.getpid()}")
+    tmp.write_text(digest)
+    os.replace(tmp, task.hash_path())
+    return task.output
+
+
+def build_figures(tasks, workers=None, force=False):
+    """
+    构建一组相互独立的图表，跳过已是最新的图表
+    Args:
+        tasks: FigureTask 列表
+        workers: 进程数，None 为CPU核数，1 为在当前进程中顺序渲染
+        force: 为 True 时忽略哈希全部重新渲染
+    Returns:
+        {输出文件路径: 'built' / 'skipped'}
+    """
+    digests = [task.digest() for task in tasks]
+    pending = [(task, d) for task, d in zip(tasks, digests) if force or not task.up_to_date(d)]
+    status = {str(task.output): 'skipped' for task in tasks}
+    if workers == 1 or len(pending) <= 1:
+        for task, d in pending:
+            render(task, d)
+    elif pending:
+        with ProcessPoolExecutor(max_workers=min(workers or os.cpu_count(), len(pending)),
+                                 initializer=_init_worker) as pool:
+            list(pool.map(render, *zip(*pending)))
+    status.update({str(task.output): 'built' for task, _ in pending})
+    return status
+
+
+def placeholder_tasks(output_dir=ROOT / 'figures'):
+    """figures/placeholders 下的 CHI Poster 示意图表 (保存参数同各脚本的 main)"""
+    save_kwargs = dict(SAVE_KWARGS, facecolor='white')
+    return [
+        FigureTask(Path(output_dir) / 'figure_1_interaction_loop.png',
+                   f"{PLACEHOLDERS / 'figure_1_interaction_loop.py'}:create_interaction_loop_figure",
+                   save_kwargs=save_kwargs),
+        FigureTask(Path(output_dir) / 'figure_2_study_results.png',
+                   f"{PLACEHOLDERS / 'figure_2_study_results.py'}:create_study_results_figure",
+                   save_kwargs=save_kwargs),
+    ]
+
+
+def main():
+    parser = argparse.ArgumentParser(description='并行构建图表 (跳过输入未变化的图表)')
+    parser.add_argument('--output', default=str(ROOT / 'figures'), help='输出目录')
+    parser.add_argument('--workers', type=int, default=None, help='进程数，默认CPU核数')
+    parser.add_argument('--force', action='store_true', help='忽略哈希全部重新渲染')
+    args = parser.parse_args()
+
+    status = build_figures(placeholder_tasks(args.output), args.workers, args.force)
+    for output, state in status.items():
+        print(f"{'✅' if state == 'built' else '⏭️ '} {state}: {output}")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,161 @@
+#!/usr/bin/env python3
+"""
+GestureFlow 专注片段提取
+窗口 focus/blur 事件表的列式实现 (与 analyze_focus_duration 的逐事件状态机等价)：
+    以 blur 结束的事件段为一个候选片段，段内首个 focus 为开始、末个 focus 的应用为片段应用；
+全部片段由 cumsum 分段 + 段首/段尾下标一次求出。日志按块流式读取，未闭合的片段跨块携带
+"""
+
+from pathlib import Path
+
+import numpy as np
+import pandas as pd
+
+EVENT_COLUMNS = ['timestamp', 'type', 'app']
+EPISODE_COLUMNS = ['app', 'timestamp', 'end', 'duration']
+
+# 流式读取的每块行数
+CHUNK_ROWS = 1_000_000
+
+
+def focus_episodes(events, min_duration=60.0, by=None):
+    """
+    从事件表中提取专注片段
+    Args:
+        events: DataFrame (列含 EVENT_COLUMNS，按时间顺序) 或事件 dict 的列表；focus/blur 以外的事件忽略
+        min_duration: 只保留时长大于该值 (秒) 的片段
+        by: 分组列 (如 'session')，组与组之间状态不延续；None 时整张表为一个事件流
+    Returns:
+        DataFrame：by 中的列 + app / timestamp (开始) / end / duration
+    """
+    return _extract(_event_table(events), min_duration, _as_list(by))[0]
+
+
+def _as_list(by):
+    return [] if by is None else [by] if isinstance(by, str) else list(by)
+
+
+def _event_table(events):
+    """只保留 focus/blur 行的事件表"""
+    table = events if isinstance(events, pd.DataFrame) else pd.DataFrame(list(events))
+    if table.empty:
+        table = table.reindex(columns=EVENT_COLUMNS)
+    return table[table['type'].isin(['focus', 'blur'])]
+
+
+def _extract(table, min_duration, by):
+    """
+    提取已闭合的片段
+    Returns:
+        (片段 DataFrame, 末尾未闭合片段的首/末 focus 行 (供下一块续接))
+    """
+    is_blur = (table['type'] == 'blur').to_numpy()
+    n = len(table)
+    # 新段开始：上一行为 blur，或分组变化
+    new_seg = np.ones(n, dtype=bool)
+    new_seg[1:] = is_blur[:-1]
+    for col in by:
+        key = table[col].to_numpy()
+        new_seg[1:] |= key[1:] != key[:-1]
+    seg = np.cumsum(new_seg) - 1
+
+    focus = np.flatnonzero(~is_blur)
+    seg_f = seg[focus]
+    # 每段首个 focus (开始时刻) 与末个 focus (应用)
+    first = focus[np.r_[True, seg_f[1:] != seg_f[:-1]]] if focus.size else focus
+    last = focus[np.r_[seg_f[1:] != seg_f[:-1], True]] if focus.size else focus
+    # blur 只会出现在段尾；段内有 focus 的 blur 闭合一个片段
+    blur = np.flatnonzero(is_blur)
+    pos = np.searchsorted(seg[first], seg[blur])
+    has_focus = pos < len(first)
+    has_focus[has_focus] = seg[first][pos[has_focus]] == seg[blur][has_focus]
+    closed_first, closed_last = first[pos[has_focus]], last[pos[has_focus]]
+    closing = blur[has_focus]
+
+    ts = table['timestamp'].to_numpy(dtype=np.float64)
+    out = table.iloc[closed_first][by].reset_index(drop=True)
+    out['app'] = table['app'].to_numpy()[closed_last]
+    out['timestamp'] = ts[closed_first]
+    out['end'] = ts[closing]
+    out['duration'] = out['end'] - out['timestamp']
+    out = out[out['duration'] > min_duration].reset_index(drop=True)
+
+    # 最后一段没有 blur 时，保留其首/末 focus 行
+    tail = table.iloc[0:0]
+    if n and not is_blur[-1] and first.size and seg[first[-1]] == seg[-1]:
+        tail = table.iloc[[first[-1], last[-1]]]
+    return out, tail
+
+
+def read_events(path, chunk_rows=CHUNK_ROWS, columns=None):
+    """
+    按块读取事件日志 (JSONL 或 Parquet)
+    Args:
+        path: .jsonl / .json (每行一个事件) 或 .parquet
+        chunk_rows: 每块行数
+        columns: 读取的列，None 为 EVENT_COLUMNS
+    Yields:
+        事件 DataFrame (timestamp 为 float64，type / app 为字符串)
+    """
+    path = Path(path)
+    columns = EVENT_COLUMNS if columns is None else list(columns)
+    if path.suffix == '.parquet':
+        # Parquet 需要 pyarrow，只在读取 Parquet 时导入
+        import pyarrow.parquet as pq
+        batches = (batch.to_pandas() for batch in pq.ParquetFile(path).iter_batches(chunk_rows, columns=columns))
+    else:
+        batches = pd.read_json(path, lines=True, chunksize=chunk_rows, dtype=False)
+    for chunk in batches:
+        chunk = chunk.reindex(columns=columns)
+        chunk['timestamp'] = chunk['timestamp'].astype(np.float64)
+        yield chunk
+
+
+def stream_focus_episodes(path, min_duration=60.0, by=None, chunk_rows=CHUNK_ROWS):
+    """
+    流式提取一个事件日志中的专注片段，内存占用与块大小成正比
+    Args:
+        path: 事件日志路径 (见 read_events)
+        min_duration: 只保留时长大于该值 (秒) 的片段
+        by: 分组列，见 focus_episodes
+        chunk_rows: 每块行数
+    Returns:
+        与 focus_episodes 相同的 DataFrame
+    """
+    by = _as_list(by)
+    parts, tail = [], None
+    for chunk in read_events(path, chunk_rows, columns=EVENT_COLUMNS + [c for c in by if c not in EVENT_COLUMNS]):
+        table = _event_table(chunk)
+        if tail is not None and len(tail):
+            table = pd.concat([tail, table], ignore_index=True)
+        episodes, tail = _extract(table, min_duration, by)
+        parts.append(episodes)
+    if not parts:
+        return pd.DataFrame(columns=by + EPISODE_COLUMNS)
+    return pd.concat(parts, ignore_index=True)
+
+
+def load_focus_episodes(store, pattern='*', min_duration=60.0, chunk_rows=CHUNK_ROWS):
+    """
+    汇总会话存储中各会话的专注片段 (events.jsonl，由 generate_synthetic_study 写出)
+    Args:
+        store: SessionStore
+        pattern: 会话名称通配符
+        min_duration: 只保留时长大于该值 (秒) 的片段
+        chunk_rows: 每块行数
+    Returns:
+        DataFrame：participant / session + EPISODE_COLUMNS
+    """
+    parts = []
+    for name in store.sessions(pattern):
+        path = store.root / name / 'events.jsonl'
+        if not path.exists():
+            continue
+        episodes = stream_focus_episodes(path, min_duration, chunk_rows=chunk_rows)
+        attrs = store.meta(name).get('attrs', {})
+        episodes.insert(0, 'session', name)
+        episodes.insert(0, 'participant', str(attrs.get('participant', name.split('_')[0])))
+        parts.append(episodes)
+    if not parts:
+        return pd.DataFrame(columns=['participant', 'session'] + EPISODE_COLUMNS)
+    return pd.concat(parts, ignore_index=True)
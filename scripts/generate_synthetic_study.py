@@ -0,0 +1,247 @@
+#!/usr/bin/env python3
+"""
+GestureFlow 合成研究数据生成器 (压力测试用)
+生成 N 名参与者 × M 个ABAB实验日 × 每日若干小时的 200Hz EMG 与 4-10Hz (带抖动) GSR，
+包含佩戴漂移、信号掉线、B日MRT轻提示及其生理响应、应用 focus/blur 事件日志
+各会话在独立进程中生成 (SeedSequence.spawn 派生种子，结果与进程数无关)，
+按数据块直接写入列式会话存储，不在内存中构建整段 DataFrame
+
+用法:
+    python scripts/generate_synthetic_study.py --store data_synth/store --participants 15 --days 4 --hours 8
+"""
+
+import argparse
+import json
+import os
+from concurrent.futures import ProcessPoolExecutor
+from pathlib import Path
+
+import numpy as np
+import pandas as pd
+
+from session_store import SessionStore
+
+FS_EMG = 200
+APPS = ['VSCode', 'Figma', 'Overleaf', 'Terminal', 'Browser', 'Slack', 'Mail']
+MAIN_APPS = {'VSCode', 'Figma', 'Overleaf', 'Terminal'}
+
+# 生理模型参数
+DECISION_INTERVAL_S = 600     # MRT决策点间隔
+AVAILABILITY = 0.8            # 决策点可干预的概率
+TREAT_PROB = 0.5              # MRT随机化概率
+NUDGE_EFFECT_S = 300          # 干预效应的时间常数
+SCR_RATE_PER_MIN = 4.0        # 皮电反应基础频率
+DROPOUTS_PER_HOUR = 1.0       # 信号掉线频率
+
+
+def session_plan(n_participants, n_days, hours, seed):
+    """
+    生成全部会话的任务列表
+    每名参与者一个子种子，再按实验日派生，任一会话的数据只由 (seed, 参与者, 日) 决定
+    Returns:
+        [(会话名, 参数字典, SeedSequence)]
+    """
+    participant_seeds = np.random.SeedSequence(seed).spawn(n_participants)
+    plan = []
+    for p, p_seed in enumerate(participant_seeds):
+        traits_rng = np.random.default_rng(p_seed.spawn(1)[0])
+        traits = {
+            'fs_gsr': int(traits_rng.integers(4, 11)),
+            'emg_level': float(traits_rng.uniform(0.08, 0.2)),
+            'gsr_level': float(traits_rng.uniform(1.0, 6.0)),
+            'nudge_effect': float(traits_rng.uniform(0.1, 0.4)),
+        }
+        for d, d_seed in enumerate(p_seed.spawn(n_days)):
+            condition = 'AB'[d % 2]
+            name = f"P{p + 1:02d}_D{d + 1}_{condition}"
+            params = dict(traits, participant=f"P{p + 1:02d}", day=d + 1,
+                          condition=condition, duration_s=hours * 3600.0)
+            plan.append((name, params, d_seed))
+    return plan
+
+
+def _timelines(rng, params):
+    """会话级事件时间线 (数量远小于样本数)：决策点、皮电反应、掉线、压力时段、应用切换"""
+    T = params['duration_s']
+
+    decisions = np.arange(DECISION_INTERVAL_S, T, DECISION_INTERVAL_S)
+    available = rng.random(decisions.size) < AVAILABILITY
+    treated = available & (rng.random(decisions.size) < TREAT_PROB) & (params['condition'] == 'B')
+
+    scr = np.sort(rng.uniform(0, T, rng.poisson(SCR_RATE_PER_MIN * T / 60)))
+    scr_amp = rng.gamma(2.0, 0.05, scr.size)
+
+    n_drop = rng.poisson(DROPOUTS_PER_HOUR * T / 3600)
+    drop_start = np.sort(rng.uniform(0, T, n_drop))
+    drop_end = drop_start + rng.uniform(5, 60, n_drop)
+
+    # 每小时一段10分钟的压力任务 (起点随机)
+    stress_start = np.arange(0, T, 3600) + rng.uniform(0, 2400, int(np.ceil(T / 3600)))
+    stress_end = stress_start + 600
+
+    # 应用专注时段：B日平均时长更长
+    mean_focus = 300 * (1.25 if params['condition'] == 'B' else 1.0)
+    durations = rng.exponential(mean_focus, int(T / mean_focus * 2) + 10) + 5
+    starts = np.concatenate([[0.0], np.cumsum(durations)[:-1]])
+    keep = starts < T
+    focus = pd.DataFrame({
+        'start': starts[keep],
+        'end': np.minimum(starts[keep] + durations[keep], T),
+        'app': rng.choice(APPS, keep.sum(), p=[0.25, 0.15, 0.15, 0.1, 0.2, 0.1, 0.05]),
+    })
+    return {
+        'decisions': decisions, 'available': available, 'treated': treated,
+        'scr': scr, 'scr_amp': scr_amp,
+        'drop_start': drop_start, 'drop_end': drop_end,
+        'stress_start': stress_start, 'stress_end': stress_end,
+        'focus': focus,
+    }
+
+
+def _in_intervals(t, starts, ends):
+    """t 是否落在任一区间 [start, end) 内 (区间按起点排序且互不包含)"""
+    k = np.searchsorted(starts, t, side='right') - 1
+    inside = np.zeros(t.shape, dtype=bool)
+    ok = k >= 0
+    inside[ok] = t[ok] < ends[k[ok]]
+    return inside
+
+
+def _nudge_relief(t, tl, strength):
+    """最近一次已推送的轻提示带来的指数衰减缓解量 [0, strength]"""
+    nudges = tl['decisions'][tl['treated']]
+    k = np.searchsorted(nudges, t, side='right') - 1
+    relief = np.zeros(t.shape)
+    ok = k >= 0
+    relief[ok] = strength * np.exp(-(t[ok] - nudges[k[ok]]) / NUDGE_EFFECT_S)
+    return relief
+
+
+def generate_session(store_root, name, params, seed_seq, chunk_s=600.0):
+    """
+    生成一个会话并分块写入会话存储，同时写出事件日志与MRT决策点表
+    Args:
+        store_root: 会话存储根目录
+        name: 会话名称
+        params: session_plan 给出的参数
+        seed_seq: 该会话的 SeedSequence
+        chunk_s: 每个数据块的时长 (秒)
+    Returns:
+        会话名称
+    """
+    rng = np.random.default_rng(seed_seq)
+    tl = _timelines(rng, params)
+    T = params['duration_s']
+    fs_gsr = params['fs_gsr']
+    store = SessionStore(store_root)
+
+    gsr_t_last = 0.0
+    tonic_last = params['gsr_level']
+    scr_kernel_s = 60.0
+    attrs = {k: params[k] for k in ('participant', 'day', 'condition', 'fs_gsr')}
+
+    with store.writer(name, attrs=attrs) as writer:
+        for c0 in np.arange(0.0, T, chunk_s):
+            c1 = min(c0 + chunk_s, T)
+
+            # EMG：规则200Hz；佩戴漂移使增益缓慢变化，压力时段与按键活动提升幅度
+            t_emg = np.arange(int(round(c0 * FS_EMG)), int(round(c1 * FS_EMG))) / FS_EMG
+            drift = 1.0 + 0.3 * (t_emg / max(T, 1.0)) + 0.05 * np.sin(2 * np.pi * t_emg / 5400)
+            stress = _in_intervals(t_emg, tl['stress_start'], tl['stress_end'])
+            typing = 0.5 + 0.5 * (np.sin(2 * np.pi * t_emg / 47.0) > 0.3)
+            envelope = params['emg_level'] * drift * (1 + 0.8 * stress) * typing
+            envelope *= 1 - _nudge_relief(t_emg, tl, params['nudge_effect'])
+            emg = rng.normal(0.0, 1.0, t_emg.size) * envelope
+
+            # GSR：4-10Hz带±30%抖动的采样时刻；随机游走的张力水平 + 皮电反应
+            n_draw = int(np.ceil((c1 - c0) * fs_gsr * 1.5)) + 2
+            dt = rng.uniform(0.7, 1.3, n_draw) / fs_gsr
+            t_gsr = gsr_t_last + np.cumsum(dt)
+            t_gsr = t_gsr[t_gsr < c1]
+            if t_gsr.size:
+                gsr_t_last = t_gsr[-1]
+            tonic = tonic_last + np.cumsum(rng.normal(0.0, 0.002, t_gsr.size))
+            if tonic.size:
+                tonic_last = tonic[-1]
+            stress_g = _in_intervals(t_gsr, tl['stress_start'], tl['stress_end'])
+            gsr = tonic + 0.3 * stress_g - 0.5 * _nudge_relief(t_gsr, tl, params['nudge_effect'])
+            lo_k, hi_k = np.searchsorted(tl['scr'], [c0 - scr_kernel_s, c1])
+            for onset, amp in zip(tl['scr'][lo_k:hi_k], tl['scr_amp'][lo_k:hi_k]):
+                a, b = np.searchsorted(t_gsr, [onset, onset + scr_kernel_s])
+                k = t_gsr[a:b] - onset
+                gsr[a:b] += amp * (1 - np.exp(-k / 1.5)) * np.exp(-k / 10.0)
+            gsr += rng.normal(0.0, 0.003, t_gsr.size)
+
+            # 掉线：区间内两路信号均无样本
+            keep_e = ~_in_intervals(t_emg, tl['drop_start'], tl['drop_end'])
+            keep_g = ~_in_intervals(t_gsr, tl['drop_start'], tl['drop_end'])
+            writer.append({
+                'timestamp': np.concatenate([t_emg[keep_e], t_gsr[keep_g]]),
+                'emg': np.concatenate([emg[keep_e], np.full(keep_g.sum(), np.nan)]),
+                'gsr': np.concatenate([np.full(keep_e.sum(), np.nan), gsr[keep_g]]),
+            })
+
+    # 应用 focus/blur 事件日志 (JSONL)
+    focus = tl['focus']
+    events = pd.DataFrame({
+        'timestamp': np.concatenate([focus['start'], focus['end']]),
+        'type': ['focus'] * len(focus) + ['blur'] * len(focus),
+        'app': np.concatenate([focus['app'], focus['app']]),
+    }).sort_values(['timestamp', 'type'], kind='stable')
+    events.to_json(store.root / name / 'events.jsonl', orient='records', lines=True)
+
+    # MRT决策点 (仅B日有推送)
+    pd.DataFrame({
+        'time': tl['decisions'],
+        'available': tl['available'].astype(int),
+        'prob': TREAT_PROB if params['condition'] == 'B' else 0.0,
+        'treated': tl['treated'].astype(int),
+    }).to_csv(store.root / name / 'decisions.csv', index=False)
+    return name
+
+
+def generate_study(store_root, n_participants=15, n_days=4, hours=1.0, seed=42, workers=None, chunk_s=600.0):
+    """
+    并行生成整个研究
+    Args:
+        store_root: 会话存储根目录
+        n_participants: 参与者数
+        n_days: 实验日数 (按ABAB交替)
+        hours: 每日记录时长 (小时)
+        seed: 根随机种子
+        workers: 进程数，None 为CPU核数
+        chunk_s: 写入数据块的时长 (秒)
+    Returns:
+        生成的会话名称列表 (按计划顺序)
+    """
+    plan = session_plan(n_participants, n_days, hours, seed)
+    Path(store_root).mkdir(parents=True, exist_ok=True)
+    with open(Path(store_root) / 'study.json', 'w') as f:
+        json.dump({'participants': n_participants, 'days': n_days, 'hours': hours, 'seed': seed,
+                   'sessions': {name: params for name, params, _ in plan}}, f, indent=2)
+
+    names, params, seeds = zip(*plan) if plan else ((), (), ())
+    roots = [store_root] * len(plan)
+    chunks = [chunk_s] * len(plan)
+    if workers == 1:
+        return list(map(generate_session, roots, names, params, seeds, chunks))
+    with ProcessPoolExecutor(max_workers=workers) as pool:
+        return list(pool.map(generate_session, roots, names, params, seeds, chunks))
+
+
+def main():
+    parser = argparse.ArgumentParser(description='生成合成ABAB研究数据')
+    parser.add_argument('--store', required=True, help='会话存储根目录')
+    parser.add_argument('--participants', type=int, default=15)
+    parser.add_argument('--days', type=int, default=4, help='ABAB实验日数')
+    parser.add_argument('--hours', type=float, default=1.0, help='每日记录时长 (小时)')
+    parser.add_argument('--seed', type=int, default=42)
+    parser.add_argument('--workers', type=int, default=os.cpu_count())
+    args = parser.parse_args()
+
+    names = generate_study(args.store, args.participants, args.days, args.hours, args.seed, args.workers)
+    print(f"✅ 已生成 {len(names)} 个会话: {args.store}")
+
+
+if __name__ == "__main__":
+    main()
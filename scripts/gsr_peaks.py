@@ -0,0 +1,109 @@
+#!/usr/bin/env python3
+"""
+GestureFlow GSR峰检测与峰率 (次/分钟)
+峰 = 局部极大值，且相对前 rise_s 秒内最小值的上升幅度 ≥ amplitude，
+与上一个峰的间隔 ≥ refractory_s (不应期)
+检测器保存跨数据块的状态，整段离线检测与实时分块检测结果一致
+"""
+
+import numpy as np
+
+from window_engine import window_starts
+
+
+class GSRPeakDetector:
+    """流式GSR峰检测器"""
+
+    def __init__(self, fs, amplitude=0.02, refractory_s=1.0, rise_s=4.0):
+        """
+        Args:
+            fs: GSR采样率 (Hz)
+            amplitude: 最小上升幅度 (与信号同单位，如 µS)
+            refractory_s: 不应期 (秒)
+            rise_s: 上升幅度的回看时长 (秒)
+        """
+        self.fs = fs
+        self.amplitude = amplitude
+        self.lookback = max(1, int(rise_s * fs))
+        self.refractory = max(1, int(refractory_s * fs))
+        self._buf = np.empty(0, dtype=np.float64)
+        self._offset = 0          # 缓冲区首样本的全局下标
+        self._next = 1            # 下一个待判定样本的全局下标
+        self._last_peak = None    # 上一个峰的全局下标
+
+    def push(self, chunk):
+        """
+        追加数据块，返回新确认的峰
+        最后一个样本需等下一块到来 (需要右邻样本) 才能判定
+        Args:
+            chunk: 新的GSR样本
+        Returns:
+            峰的全局下标数组
+        """
+        buf = np.concatenate([self._buf, np.asarray(chunk, dtype=np.float64).ravel()])
+        a = self._next - self._offset
+        b = len(buf) - 1
+        peaks = np.empty(0, dtype=np.int64)
+
+        if b > a:
+            mid = buf[a:b]
+            cand = np.flatnonzero((mid > buf[a - 1:b - 1]) & (mid >= buf[a + 1:b + 1])) + a
+            if cand.size:
+                # 回看窗口 [i - lookback, i) 的最小值 (会话开头截断)
+                back = cand[:, None] - np.arange(1, self.lookback + 1)
+                trough = buf[np.maximum(back, 0)].min(axis=1)
+                with np.errstate(invalid='ignore'):
+                    cand = cand[(buf[cand] - trough) >= self.amplitude]
+                peaks = self._apply_refractory(cand + self._offset)
+            self._next = b + self._offset
+
+        keep = min(len(buf), self.lookback + 1)
+        self._offset += len(buf) - keep
+        self._buf = buf[len(buf) - keep:].copy()
+        return peaks
+
+    def _apply_refractory(self, candidates):
+        """按时间顺序贪心地保留与上一个峰间隔 ≥ 不应期的候选峰"""
+        accepted = []
+        last = self._last_peak
+        for i in candidates.tolist():
+            if last is None or i - last >= self.refractory:
+                accepted.append(i)
+                last = i
+        self._last_peak = last
+        return np.asarray(accepted, dtype=np.int64)
+
+
+def detect_peaks(signal, fs, chunk_samples=None, **kwargs):
+    """
+    整段信号的峰检测 (可分块读取，如内存映射的会话文件)
+    Args:
+        signal: GSR信号
+        fs: 采样率 (Hz)
+        chunk_samples: 每块样本数，None 为整段一次处理
+        **kwargs: GSRPeakDetector 的阈值参数
+    Returns:
+        峰的下标数组
+    """
+    detector = GSRPeakDetector(fs, **kwargs)
+    step = chunk_samples or max(len(signal), 1)
+    parts = [detector.push(signal[k:k + step]) for k in range(0, len(signal), step)]
+    return np.concatenate(parts) if parts else np.empty(0, dtype=np.int64)
+
+
+def peak_rate(peaks, n_samples, window, step, fs, include_last=False):
+    """
+    滑动窗口内的峰率
+    Args:
+        peaks: 峰的下标数组 (递增)
+        n_samples: 信号长度
+        window: 窗口长度 (样本数)
+        step: 步长 (样本数)
+        fs: 采样率 (Hz)
+        include_last: 见 window_engine.window_starts
+    Returns:
+        每个窗口的峰率 (次/分钟)
+    """
+    starts = window_starts(n_samples, window, step, include_last)
+    counts = np.searchsorted(peaks, starts + window) - np.searchsorted(peaks, starts)
+    return counts / (window / fs / 60.0)
@@ -0,0 +1,146 @@
+#!/usr/bin/env python3
+"""
+GestureFlow MRT决策点分析
+加权中心化最小二乘 (WCLS, Boruvka et al. 2018) 估计因果偏移效应：
+    Y_{t+1} ~ Z_t' α + (A_t - p̃_t) S_t' β
+权重 W_t = I_t · (p̃/p)^A · ((1-p̃)/(1-p))^(1-A)，β 即在调节变量 S_t 上的因果偏移效应；
+标准误为按参与者聚类的稳健三明治估计，全部决策点以批量矩阵运算一次求解
+"""
+
+import numpy as np
+import pandas as pd
+from scipy import stats
+
+DECISION_COLUMNS = ['participant', 'time', 'available', 'prob', 'treated', 'outcome']
+
+
+def proximal_outcome(decision_times, times, values, horizon_s=300.0, offset_s=0.0):
+    """
+    决策点之后的近端结局：(t + offset, t + offset + horizon] 内 CEI 的均值 (忽略NaN)
+    Args:
+        decision_times: 决策时刻数组 (秒)
+        times: CEI 时间轴 (秒，递增)
+        values: CEI 值
+        horizon_s: 结局窗口长度 (秒)
+        offset_s: 结局窗口相对决策时刻的延迟 (秒)
+    Returns:
+        每个决策点的结局；窗口内没有有效值时为NaN
+    """
+    t = np.asarray(times, dtype=np.float64)
+    y = np.asarray(values, dtype=np.float64)
+    valid = ~np.isnan(y)
+    csum = np.concatenate([[0.0], np.cumsum(np.where(valid, y, 0.0))])
+    ccount = np.concatenate([[0], np.cumsum(valid)])
+    start = np.asarray(decision_times, dtype=np.float64) + offset_s
+    lo = np.searchsorted(t, start, side='right')
+    hi = np.searchsorted(t, start + horizon_s, side='right')
+    count = ccount[hi] - ccount[lo]
+    with np.errstate(invalid='ignore', divide='ignore'):
+        return np.where(count > 0, (csum[hi] - csum[lo]) / count, np.nan)
+
+
+def load_decisions(store, pattern='*'):
+    """
+    汇总会话存储中各会话的决策点表 (decisions.csv，由 generate_synthetic_study 写出)
+    Args:
+        store: SessionStore
+        pattern: 会话名称通配符
+    Returns:
+        DataFrame：participant / session / time / available / prob / treated (outcome 需另行计算)
+    """
+    parts = []
+    for name in store.sessions(pattern):
+        path = store.root / name / 'decisions.csv'
+        if not path.exists():
+            continue
+        table = pd.read_csv(path)
+        attrs = store.meta(name).get('attrs', {})
+        table.insert(0, 'session', name)
+        table.insert(0, 'participant', str(attrs.get('participant', name.split('_')[0])))
+        parts.append(table)
+    if not parts:
+        return pd.DataFrame(columns=['participant', 'session', 'time', 'available', 'prob', 'treated'])
+    return pd.concat(parts, ignore_index=True)
+
+
+def _design(decisions, moderators, controls):
+    """常数项加上给定列组成的矩阵"""
+    n = len(decisions)
+    cols = [np.ones(n)] + [decisions[c].to_numpy(dtype=np.float64) for c in controls]
+    mods = [np.ones(n)] + [decisions[c].to_numpy(dtype=np.float64) for c in moderators]
+    return np.column_stack(cols), np.column_stack(mods)
+
+
+def wcls(decisions, moderators=(), controls=(), p_tilde=None, confidence=0.95):
+    """
+    因果偏移效应的WCLS估计
+    Args:
+        decisions: 决策点表，列含 DECISION_COLUMNS 以及 moderators / controls 中的列
+            available: 是否可干预 (0/1)；prob: 随机化概率；treated: 是否推送 (0/1)；outcome: 近端结局；
+            只有可干预且 0 < prob < 1 (确实经过随机化) 的决策点参与估计，如A阶段 prob=0 的决策点被排除
+        moderators: 效应调节变量列名 (S_t，另含常数项)
+        controls: 控制变量列名 (Z_t，另含常数项)
+        p_tilde: 中心化概率 p̃ (常数)，None 时取参与估计的决策点上 prob 的均值
+        confidence: 置信水平
+    Returns:
+        DataFrame，每行一个系数：part ('control' / 'excursion')、term、estimate、se、t、df、p、ci_low、ci_high；
+        excursion 行的 term 'intercept' 为边际因果偏移效应
+    """
+    moderators, controls = list(moderators), list(controls)
+    needed = DECISION_COLUMNS + moderators + controls
+    d = decisions.dropna(subset=needed)
+    # 不可干预或未随机化 (prob 为0或1，不存在反事实) 的决策点权重为0，直接排除
+    d = d[(d['available'] > 0) & (d['prob'] > 0) & (d['prob'] < 1)]
+    if d.empty:
+        raise ValueError("没有可干预且 0 < prob < 1 的决策点")
+    available = d['available'].to_numpy(dtype=np.float64)
+    p = d['prob'].to_numpy(dtype=np.float64)
+    treated = d['treated'].to_numpy(dtype=np.float64)
+    y = d['outcome'].to_numpy(dtype=np.float64)
+
+    if p_tilde is None:
+        p_tilde = float(p.mean())
+    weight = available * np.where(treated > 0, p_tilde / p, (1 - p_tilde) / (1 - p))
+
+    Z, S = _design(d, moderators, controls)
+    X = np.hstack([Z, (treated - p_tilde)[:, None] * S])
+    n_params = X.shape[1]
+
+    # 正规方程 (X'WX) θ = X'WY
+    XW = X * weight[:, None]
+    bread = XW.T @ X
+    theta = np.linalg.solve(bread, XW.T @ y)
+    resid = y - X @ theta
+
+    # 按参与者聚类的得分和：排序后 reduceat 一次求出
+    codes, first = np.unique(d['participant'].astype(str).to_numpy(), return_inverse=True)
+    order = np.argsort(first, kind='stable')
+    scores = XW[order] * resid[order, None]
+    starts = np.flatnonzero(np.r_[True, np.diff(first[order]) != 0])
+    cluster_scores = np.add.reduceat(scores, starts, axis=0)
+    n_clusters = len(codes)
+    meat = cluster_scores.T @ cluster_scores
+
+    bread_inv = np.linalg.inv(bread)
+    cov = bread_inv @ meat @ bread_inv
+    # 小样本修正：K/(K-1) 缩放，t 分布自由度 K - 参数数 (参与者只有10余人时z近似偏乐观)
+    if n_clusters > 1:
+        cov *= n_clusters / (n_clusters - 1)
+    dof = max(n_clusters - n_params, 1)
+
+    se = np.sqrt(np.diag(cov))
+    with np.errstate(invalid='ignore', divide='ignore'):
+        t_value = theta / se
+    q = stats.t.ppf(0.5 + confidence / 2, dof)
+    terms = ['intercept'] + controls + ['intercept'] + moderators
+    return pd.DataFrame({
+        'part': ['control'] * Z.shape[1] + ['excursion'] * S.shape[1],
+        'term': terms,
+        'estimate': theta,
+        'se': se,
+        't': t_value,
+        'df': dof,
+        'p': 2 * stats.t.sf(np.abs(t_value), dof),
+        'ci_low': theta - q * se,
+        'ci_high': theta + q * se,
+    })
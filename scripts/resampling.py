@@ -0,0 +1,165 @@
+#!/usr/bin/env python3
+"""
+GestureFlow 向量化重抽样引擎
+配对数据的 bootstrap 置信区间与符号翻转置换检验：
+每批一次抽取全部重抽样的下标/符号矩阵，统计量沿最后一个轴向量化计算；
+按元素预算分批以限制内存，同一分析内的所有重抽样共用一个随机数流
+"""
+
+import numpy as np
+from scipy import stats
+
+# 每批重抽样矩阵的元素上限 (约 8MB int64；秩统计量每批另有数个同样大小的临时数组)
+MAX_ELEMENTS = 1 << 20
+
+
+def make_rng(seed=None):
+    """一次分析使用的随机数流 (传入已有 Generator 时原样返回)"""
+    if isinstance(seed, np.random.Generator):
+        return seed
+    return np.random.default_rng(seed)
+
+
+def _batches(total, n, max_elements):
+    """按元素预算划分批次，每批行数 × n ≤ max_elements"""
+    rows = max(1, max_elements // max(n, 1))
+    for start in range(0, total, rows):
+        yield start, min(rows, total - start)
+
+
+# ---- 沿最后一个轴计算的统计量 ----
+
+def mean_diff(a, b):
+    """配对均值差"""
+    return np.mean(a - b, axis=-1)
+
+
+def cohens_d(a, b):
+    """Cohen's d，以 a 的标准差标准化 (paired_test 的定义)"""
+    return (np.mean(a, axis=-1) - np.mean(b, axis=-1)) / (np.std(a, ddof=1, axis=-1) + 1e-8)
+
+
+def cohens_dz(a, b):
+    """配对 Cohen's d_z，以差值的标准差标准化"""
+    d = a - b
+    return np.mean(d, axis=-1) / np.std(d, ddof=1, axis=-1)
+
+
+def t_statistic(d):
+    """单样本t统计量"""
+    n = d.shape[-1]
+    with np.errstate(invalid='ignore', divide='ignore'):
+        return np.mean(d, axis=-1) / (np.std(d, ddof=1, axis=-1) / np.sqrt(n))
+
+
+def _signed_rank(d):
+    """非0差值的绝对值秩 (0 的秩为0) 与非0样本数"""
+    absd = np.abs(d)
+    n_zero = np.sum(absd == 0, axis=-1, keepdims=True)
+    # 0 的绝对值最小，在全体中的秩减去0的个数即为在非0样本中的秩
+    ranks = np.maximum(stats.rankdata(absd, axis=-1) - n_zero, 0.0)
+    return ranks, d.shape[-1] - n_zero[..., 0]
+
+
+def _rank_z(d, ranks, n):
+    w_plus = np.sum(np.where(d > 0, ranks, 0.0), axis=-1)
+    with np.errstate(invalid='ignore', divide='ignore'):
+        return (w_plus - n * (n + 1) / 4.0) / np.sqrt(n * (n + 1) * (2 * n + 1) / 24.0)
+
+
+def signed_rank_z(d):
+    """
+    Wilcoxon符号秩统计量的正态近似z值 (差值为0的样本不参与，不做结的校正)
+    """
+    return _rank_z(d, *_signed_rank(d))
+
+
+def wilcoxon_r(a, b):
+    """效应量 r = |z| / sqrt(n)，z 为 signed_rank_z (点估计与 bootstrap 置信区间使用同一统计量)"""
+    return np.abs(signed_rank_z(a - b)) / np.sqrt(a.shape[-1])
+
+
+# ---- 重抽样 ----
+
+def bootstrap_distribution(statistic, samples, n_resamples=10000, rng=None, max_elements=MAX_ELEMENTS):
+    """
+    配对 bootstrap 分布：同一组下标同时作用于所有样本
+    Args:
+        statistic: 统计量函数，接收与 samples 等数量的二维数组 (重抽样数 × n)，沿最后一轴计算
+        samples: 等长一维数组的序列 (如 (a, b))
+        n_resamples: 重抽样次数
+        rng: make_rng 的随机数流
+        max_elements: 每批下标矩阵的元素上限
+    Returns:
+        长度为 n_resamples 的统计量数组
+    """
+    rng = make_rng(rng)
+    samples = [np.asarray(s, dtype=np.float64) for s in samples]
+    n = len(samples[0])
+    out = np.empty(n_resamples)
+    for start, rows in _batches(n_resamples, n, max_elements):
+        idx = rng.integers(0, n, size=(rows, n))
+        out[start:start + rows] = statistic(*[s[idx] for s in samples])
+    return out
+
+
+def bootstrap_ci(statistic, samples, confidence=0.95, n_resamples=10000, rng=None, max_elements=MAX_ELEMENTS):
+    """
+    百分位 bootstrap 置信区间
+    Returns:
+        {'low': ..., 'high': ..., 'se': bootstrap标准误}
+    """
+    dist = bootstrap_distribution(statistic, samples, n_resamples, rng, max_elements)
+    dist = dist[np.isfinite(dist)]
+    if dist.size == 0:
+        return {'low': np.nan, 'high': np.nan, 'se': np.nan}
+    alpha = (1 - confidence) / 2
+    low, high = np.percentile(dist, [100 * alpha, 100 * (1 - alpha)])
+    return {'low': float(low), 'high': float(high), 'se': float(np.std(dist, ddof=1)) if dist.size > 1 else np.nan}
+
+
+def sign_flip_test(diff, statistic=t_statistic, n_resamples=10000, rng=None, max_elements=MAX_ELEMENTS):
+    """
+    配对差值的符号翻转置换检验 (双侧)
+    2^n 不超过 n_resamples 时枚举全部符号组合 (精确检验)，否则随机抽取
+    Args:
+        diff: 配对差值
+        statistic: 沿最后一轴计算的统计量，如 t_statistic / signed_rank_z
+        n_resamples: 随机置换次数
+        rng: make_rng 的随机数流
+        max_elements: 每批符号矩阵的元素上限
+    Returns:
+        {'statistic': 观测统计量, 'p': 置换p值, 'exact': 是否精确枚举, 'n_resamples': 置换次数}
+    """
+    rng = make_rng(rng)
+    d = np.asarray(diff, dtype=np.float64)
+    n = d.size
+    if statistic is signed_rank_z:
+        # 符号翻转不改变 |d|，秩只需计算一次，每次置换只剩按符号求和
+        ranks, n_nonzero = _signed_rank(d)
+
+        def statistic(x):
+            return _rank_z(x, ranks, n_nonzero)
+    observed = float(statistic(d[None, :])[0])
+    if np.isnan(observed):
+        # 差值全为0等退化情形：无法区分零假设
+        return {'statistic': observed, 'p': 1.0, 'exact': False, 'n_resamples': 0}
+    exact = n < 63 and 2 ** n <= n_resamples
+    total = 2 ** n if exact else n_resamples
+    # 容忍浮点舍入，使与观测值相等的置换计入
+    threshold = abs(observed) * (1 - 1e-12)
+
+    extreme = 0
+    bits = np.arange(n, dtype=np.int64)
+    for start, rows in _batches(total, n, max_elements):
+        if exact:
+            codes = np.arange(start, start + rows, dtype=np.int64)
+            signs = 1 - 2 * ((codes[:, None] >> bits) & 1)
+        else:
+            signs = 1 - 2 * rng.integers(0, 2, size=(rows, n))
+        null = statistic(signs * d)
+        extreme += int(np.sum(np.abs(null) >= threshold))
+
+    # 精确枚举已包含观测的符号组合；随机置换按 (k+1)/(B+1) 计算
+    p = extreme / total if exact else (extreme + 1) / (total + 1)
+    return {'statistic': observed, 'p': float(min(p, 1.0)), 'exact': exact, 'n_resamples': total}
@@ -0,0 +1,77 @@
+#!/usr/bin/env python3
+"""
+GestureFlow 会话数据分块加载
+以内存映射方式打开 .npy 会话文件，按固定大小的数据块计算窗口特征，
+相邻数据块之间保留窗口重叠部分，峰值内存只与块大小有关，与会话时长无关
+"""
+
+import numpy as np
+
+from window_engine import window_starts, window_mask, float_dtype
+
+
+def open_session(path):
+    """
+    以只读内存映射方式打开 .npy 会话文件
+    Args:
+        path: .npy 文件路径
+    Returns:
+        np.memmap 数组 (不会整体读入内存)
+    """
+    return np.load(path, mmap_mode='r')
+
+
+def iter_window_blocks(signal, window, step, chunk_samples, include_last=False, dtype=np.float64):
+    """
+    按数据块遍历信号，每块恰好包含若干个完整窗口
+    下一块从下一个窗口起点开始，因此跨块的窗口重叠会被重新读入
+    Args:
+        signal: 输入信号 (可为 np.memmap)
+        window: 窗口长度 (样本数)
+        step: 步长 (样本数)
+        chunk_samples: 每块的目标样本数
+        include_last: 见 window_engine.window_starts
+        dtype: 数据块的精度 (见 window_engine.float_dtype)
+    Yields:
+        (块内窗口数, 数据块)，数据块为读入内存的 dtype 数组
+    """
+    dtype = float_dtype(dtype)
+    starts = window_starts(len(signal), window, step, include_last)
+    per_block = max(1, (chunk_samples - window) // step + 1)
+    for k in range(0, len(starts), per_block):
+        block = starts[k:k + per_block]
+        yield len(block), np.asarray(signal[block[0]:block[-1] + window], dtype=dtype)
+
+
+def chunked_windows(signal, window, step, kernel, chunk_samples, include_last=False, dtype=np.float64, mask=None,
+                    **kwargs):
+    """
+    分块计算全部窗口特征，结果与对整段信号直接调用 kernel 相同
+    Args:
+        signal: 输入信号 (可为 np.memmap)
+        window: 窗口长度 (样本数)
+        step: 步长 (样本数)
+        kernel: 窗口特征函数，如 rolling_rms / rolling_slope
+        chunk_samples: 每块的目标样本数
+        include_last: 见 window_engine.window_starts
+        dtype: 计算精度，同时传给 kernel
+        mask: 全部窗口的掩码，按块切分后传给 kernel (False 的窗口不计算)
+        **kwargs: 传给 kernel 的其他参数 (如 dt)
+    Returns:
+        全部窗口的特征数组
+    """
+    if mask is not None:
+        mask = window_mask(mask, len(window_starts(len(signal), window, step, include_last)))
+    parts = []
+    done = 0
+    for n_windows, block in iter_window_blocks(signal, window, step, chunk_samples, include_last, dtype):
+        if mask is not None:
+            # 块内 include_last=True 的窗口数可能多于 n_windows，多出的窗口不计算
+            extra = len(window_starts(len(block), window, step, True)) - n_windows
+            kwargs['mask'] = np.concatenate([mask[done:done + n_windows], np.zeros(extra, dtype=bool)])
+        values = kernel(block, window, step, include_last=True, dtype=dtype, **kwargs)
+        parts.append(values[:n_windows])
+        done += n_windows
+    if not parts:
+        return np.empty(0, dtype=dtype)
+    return np.concatenate(parts)
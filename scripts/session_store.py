@@ -0,0 +1,206 @@
+#!/usr/bin/env python3
+"""
+GestureFlow 列式会话存储
+替代逐被试的CSV文件：每个会话一个目录，按数据块存放类型化的列
+(int64 timestamp / float32 emg / float32 gsr)，meta.json 记录每块的时间戳范围，
+读取时可只取需要的列、只读与时间范围相交的数据块
+
+用法:
+    python scripts/session_store.py data_demo/*.csv --store data_demo/store
+"""
+
+import argparse
+import json
+from pathlib import Path
+
+import numpy as np
+import pandas as pd
+
+# 默认列类型；时间戳以整数微秒存储
+SCHEMA = {'timestamp': 'int64', 'emg': 'float32', 'gsr': 'float32'}
+TS_SCALE = 1e-6  # 存储的时间戳单位 (秒)
+FORMAT_VERSION = 1
+
+
+class SessionWriter:
+    """按数据块追加写入一个会话，close() 时写出元数据"""
+
+    def __init__(self, path, schema=None, attrs=None):
+        """
+        Args:
+            path: 会话目录
+            schema: 列名 -> numpy dtype，默认为 SCHEMA
+            attrs: 会话属性 (如 subject_id / condition)
+        """
+        self.path = Path(path)
+        self.path.mkdir(parents=True, exist_ok=True)
+        # 覆盖写入：清除旧的数据块与元数据
+        for old in list(self.path.glob('chunk_*.npz')) + [self.path / 'meta.json']:
+            old.unlink(missing_ok=True)
+        self.schema = dict(schema or SCHEMA)
+        self.attrs = dict(attrs or {})
+        self.chunks = []
+
+    def append(self, columns):
+        """
+        写入一个数据块 (块内按时间戳排序)
+        Args:
+            columns: DataFrame 或 列名 -> 数组；timestamp 单位为秒
+        """
+        if isinstance(columns, pd.DataFrame):
+            columns = {name: columns[name].to_numpy() for name in columns.columns}
+        ts = np.rint(np.asarray(columns['timestamp'], dtype=np.float64) / TS_SCALE).astype(np.int64)
+        if len(ts) == 0:
+            return
+        order = np.argsort(ts, kind='stable')
+        arrays = {'timestamp': ts[order]}
+        for name, dtype in self.schema.items():
+            if name != 'timestamp':
+                arrays[name] = np.asarray(columns[name], dtype=dtype)[order]
+
+        name = f"chunk_{len(self.chunks):06d}.npz"
+        np.savez(self.path / name, **arrays)
+        self.chunks.append({
+            'file': name,
+            'rows': int(len(ts)),
+            'ts_min': int(arrays['timestamp'][0]),
+            'ts_max': int(arrays['timestamp'][-1]),
+        })
+
+    def close(self):
+        meta = {
+            'version': FORMAT_VERSION,
+            'schema': self.schema,
+            'ts_scale': TS_SCALE,
+            'attrs': self.attrs,
+            'chunks': self.chunks,
+        }
+        with open(self.path / 'meta.json', 'w') as f:
+            json.dump(meta, f, indent=2, ensure_ascii=False)
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, exc_type, exc, tb):
+        if exc_type is None:
+            self.close()
+
+
+class SessionStore:
+    """会话存储根目录，每个子目录是一个会话 (如 S01_A)"""
+
+    def __init__(self, root):
+        self.root = Path(root)
+
+    def sessions(self, pattern='*'):
+        """按名称排序列出已完成写入的会话"""
+        return sorted(p.parent.name for p in self.root.glob(f"{pattern}/meta.json"))
+
+    def meta(self, name):
+        with open(self.root / name / 'meta.json') as f:
+            return json.load(f)
+
+    def writer(self, name, schema=None, attrs=None):
+        return SessionWriter(self.root / name, schema, attrs)
+
+    def read(self, name, columns=None, t_start=None, t_end=None):
+        """
+        读取会话，支持列投影与时间范围投影
+        Args:
+            name: 会话名称
+            columns: 需要的列，None 为全部列
+            t_start: 起始时间 (秒，含)，None 表示不限
+            t_end: 结束时间 (秒，不含)，None 表示不限
+        Returns:
+            DataFrame；timestamp 列换算为秒 (float64)
+        """
+        meta = self.meta(name)
+        columns = list(meta['schema']) if columns is None else list(columns)
+        lo = None if t_start is None else int(np.rint(t_start / meta['ts_scale']))
+        hi = None if t_end is None else int(np.rint(t_end / meta['ts_scale']))
+        need_ts = lo is not None or hi is not None
+
+        parts = {c: [] for c in columns}
+        for chunk in meta['chunks']:
+            # 用块元数据跳过与时间范围不相交的数据块
+            if lo is not None and chunk['ts_max'] < lo:
+                continue
+            if hi is not None and chunk['ts_min'] >= hi:
+                continue
+            with np.load(self.root / name / chunk['file']) as data:
+                rows = slice(None)
+                if need_ts:
+                    ts = data['timestamp']
+                    a = 0 if lo is None else np.searchsorted(ts, lo, side='left')
+                    b = len(ts) if hi is None else np.searchsorted(ts, hi, side='left')
+                    rows = slice(a, b)
+                for c in columns:
+                    parts[c].append(data[c][rows])
+
+        out = {}
+        for c in columns:
+            dtype = meta['schema'][c]
+            values = np.concatenate(parts[c]) if parts[c] else np.empty(0, dtype=dtype)
+            out[c] = values * meta['ts_scale'] if c == 'timestamp' else values
+        return pd.DataFrame(out, columns=columns)
+
+
+def import_csv(csv_path, store, name=None, ts_scale=1.0, chunk_rows=1_000_000):
+    """
+    将CSV会话文件导入存储 (分块读取，不整体载入内存)
+    Args:
+        csv_path: CSV文件路径 (需含 timestamp/emg/gsr 列)
+        store: SessionStore
+        name: 会话名称，默认为文件名 (如 S01_A)
+        ts_scale: CSV时间戳单位 (秒)
+        chunk_rows: 每个数据块的行数
+    Returns:
+        会话名称
+    """
+    name = name or Path(csv_path).stem
+    attrs = {}
+    with store.writer(name) as writer:
+        for df in pd.read_csv(csv_path, chunksize=chunk_rows):
+            # 常量字符串列 (subject_id / condition) 记入会话属性
+            for c in df.columns:
+                if c not in writer.schema and not pd.api.types.is_numeric_dtype(df[c]) and df[c].nunique() == 1:
+                    attrs.setdefault(c, str(df[c].iloc[0]))
+            df = df.assign(timestamp=df['timestamp'] * ts_scale)
+            writer.append(df)
+        writer.attrs.update(attrs)
+    return name
+
+
+def ensure_imported(csv_path, store, ts_scale=1.0):
+    """
+    CSV尚未导入或比存储中的会话更新时重新导入
+    Args:
+        csv_path: CSV文件路径
+        store: SessionStore
+        ts_scale: CSV时间戳单位 (秒)
+    Returns:
+        会话名称
+    """
+    name = Path(csv_path).stem
+    meta_path = store.root / name / 'meta.json'
+    if not meta_path.exists() or meta_path.stat().st_mtime < Path(csv_path).stat().st_mtime:
+        import_csv(csv_path, store, name=name, ts_scale=ts_scale)
+    return name
+
+
+def main():
+    parser = argparse.ArgumentParser(description='将CSV会话文件导入列式会话存储')
+    parser.add_argument('csv', nargs='+', help='CSV文件')
+    parser.add_argument('--store', required=True, help='存储根目录')
+    parser.add_argument('--ts-scale', type=float, default=1.0, help='CSV时间戳单位 (秒)')
+    parser.add_argument('--chunk-rows', type=int, default=1_000_000, help='每个数据块的行数')
+    args = parser.parse_args()
+
+    store = SessionStore(args.store)
+    for path in args.csv:
+        name = import_csv(path, store, ts_scale=args.ts_scale, chunk_rows=args.chunk_rows)
+        print(f"✅ {path} -> {store.root / name}")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,205 @@
+#!/usr/bin/env python3
+"""
+GestureFlow 信号质量检查
+按窗口给出质量标志位 (平直/削顶/工频干扰/GSR超量程)，全部检查由前缀和向量化完成；
+标志为0的窗口为合格窗口，特征计算只在合格窗口上进行 (对应协议中的拒识/弱信号策略)；
+窗口按 QUALITY_BLOCK 样本分组检查，临时数组只覆盖一组窗口，不随会话长度增长
+"""
+
+import warnings
+
+import numpy as np
+
+from window_engine import window_starts, prefix_sum, float_dtype
+
+# 质量标志位
+FLATLINE = 1
+CLIPPING = 2
+POWERLINE = 4
+OUT_OF_RANGE = 8
+CHECKS = {'flatline': FLATLINE, 'clipping': CLIPPING, 'powerline': POWERLINE, 'out_of_range': OUT_OF_RANGE}
+
+# 每组窗口覆盖的样本数上限 (单个窗口更长时单独成组)
+QUALITY_BLOCK = 1 << 16
+
+# 默认阈值 (EMG单位 mV，GSR单位 µS；GSR 的 valid_range 只适用于以 µS 记录的皮电导，
+# 去均值/标准化后的信号或其他单位需相应设置 valid_range，否则全部窗口会被判为超量程)
+EMG_QUALITY = {
+    'flat_delta': 1e-4,         # 相邻样本变化量小于该值视为未变化
+    'min_active': 0.2,          # 变化样本比例低于该值视为平直 (电极脱落)
+    'clip_level': None,         # 削顶电平，None 时取整段信号绝对值最大值 (ADC满量程，见 session_rail)
+    'max_clip_fraction': 0.01,  # 处于削顶电平的样本比例上限
+    'mains_hz': 50.0,           # 工频
+    'max_line_ratio': 0.5,      # 工频分量功率 / 总功率 上限
+}
+GSR_QUALITY = {
+    'flat_delta': 0.0,
+    'min_active': 0.05,
+    'valid_range': (0.05, 100.0),  # 皮电导的合理量程 (µS)
+    'max_out_fraction': 0.0,       # 超量程样本比例上限
+}
+
+
+def session_rail(signal, dtype=np.float64):
+    """
+    整段信号绝对值的最大值 (NaN忽略)，作为默认削顶电平
+    分块调用 emg_quality 时应按整段会话计算一次并以 clip_level 传入，使各块的判定一致
+    """
+    rail = 0.0
+    for k in range(0, len(signal), QUALITY_BLOCK):
+        block = np.abs(np.asarray(signal[k:k + QUALITY_BLOCK], dtype=float_dtype(dtype)))
+        if block.size and not np.isnan(block).all():
+            rail = max(rail, float(np.nanmax(block)))
+    return rail
+
+
+def _window_groups(lo, hi, block=QUALITY_BLOCK):
+    """
+    按顺序把窗口分组，每组覆盖的样本范围不超过 block
+    Yields:
+        (组内窗口的切片, 覆盖范围起点, 覆盖范围终点)
+    """
+    i = 0
+    while i < lo.size:
+        j = max(int(np.searchsorted(hi, lo[i] + block, side='right')), i + 1)
+        yield slice(i, j), int(lo[i:j].min()), int(hi[i:j].max())
+        i = j
+
+
+def _window_sum(indicator, lo, hi):
+    """indicator 在各窗口 [lo, hi) 内之和"""
+    csum = prefix_sum(indicator)
+    return csum[hi] - csum[lo]
+
+
+def _flatline(x, lo, hi, flat_delta, min_active):
+    """窗口内相邻样本发生变化的比例过低"""
+    # 第k个差分位于样本 k 与 k+1 之间，窗口 [lo, hi) 含差分 lo .. hi-2
+    moving = np.abs(np.diff(x)) > flat_delta
+    steps = np.maximum(hi - lo - 1, 0)
+    csum = prefix_sum(moving)
+    active = csum[np.maximum(hi - 1, lo)] - csum[lo]
+    with np.errstate(invalid='ignore', divide='ignore'):
+        return (steps > 0) & (active / steps < min_active)
+
+
+def _clipping(x, lo, hi, clip_level, max_clip_fraction):
+    """窗口内处于削顶电平的样本比例过高"""
+    at_rail = np.abs(x) >= clip_level * (1 - 1e-9)
+    count = np.maximum(hi - lo, 1)
+    return _window_sum(at_rail, lo, hi) / count > max_clip_fraction
+
+
+def _line_ratio(x, lo, hi, fs, mains_hz):
+    """
+    工频分量占窗口方差的比例
+    单频点DFT的前缀和：窗口 [lo, hi) 的DFT系数 = 前缀和之差 × 相位因子，幅值与相位因子无关；
+    系数按窗口去均值 (减去 均值 × 相位因子之和)，结果与信号的直流电平及分组方式无关
+    """
+    if not 0 < mains_hz < fs / 2:
+        return np.zeros(lo.size)
+    n = hi - lo
+    phase = np.exp(-2j * np.pi * mains_hz / fs * np.arange(len(x)))
+    coef = np.concatenate([[0.0], np.cumsum(x * phase)])
+    turns = np.concatenate([[0.0], np.cumsum(phase)])
+    s1 = _window_sum(x, lo, hi)
+    s2 = _window_sum(x * x, lo, hi)
+    with np.errstate(invalid='ignore', divide='ignore'):
+        mean = s1 / n
+        line = 2 * np.abs(coef[hi] - coef[lo] - mean * (turns[hi] - turns[lo])) ** 2
+        var = s2 / n - mean ** 2
+        return np.where(var > 0, line / (n * n) / var, 0.0)
+
+
+def emg_quality(signal, lo, hi, fs, dtype=np.float64, **thresholds):
+    """
+    EMG窗口的质量标志 (FLATLINE / CLIPPING / POWERLINE 的按位或)
+    Args:
+        signal: EMG信号 (NaN样本按0处理，掉线由窗口覆盖率另行判定)
+        lo: 各窗口起始下标数组 (按起点递增)
+        hi: 各窗口结束下标数组 (不含，递增)
+        fs: 采样率 (Hz)
+        dtype: 信号读取精度
+        **thresholds: 覆盖 EMG_QUALITY 中的阈值
+    Returns:
+        uint8 标志数组，0 为合格
+    """
+    t = dict(EMG_QUALITY, **thresholds)
+    lo = np.asarray(lo, dtype=np.int64)
+    hi = np.asarray(hi, dtype=np.int64)
+    flags = np.zeros(lo.size, dtype=np.uint8)
+    if lo.size == 0 or len(signal) == 0:
+        return flags
+    level = session_rail(signal, dtype) if t['clip_level'] is None else t['clip_level']
+    for sel, start, stop in _window_groups(lo, hi):
+        x = np.nan_to_num(np.asarray(signal[start:stop], dtype=float_dtype(dtype)).astype(np.float64, copy=False))
+        l, h, out = lo[sel] - start, hi[sel] - start, flags[sel]
+        out[_flatline(x, l, h, t['flat_delta'], t['min_active'])] |= FLATLINE
+        out[_clipping(x, l, h, level, t['max_clip_fraction'])] |= CLIPPING
+        # 去均值使方差与工频系数的前缀和量级较小
+        out[_line_ratio(x - x.mean(), l, h, fs, t['mains_hz']) > t['max_line_ratio']] |= POWERLINE
+    return flags
+
+
+def gsr_quality(signal, lo, hi, dtype=np.float64, **thresholds):
+    """
+    GSR窗口的质量标志 (FLATLINE / OUT_OF_RANGE 的按位或)
+    Args:
+        signal: GSR信号 (皮电导，µS；其他单位需设置 valid_range)
+        lo: 各窗口起始下标数组 (按起点递增)
+        hi: 各窗口结束下标数组 (不含，递增)
+        dtype: 信号读取精度
+        **thresholds: 覆盖 GSR_QUALITY 中的阈值
+    Returns:
+        uint8 标志数组，0 为合格
+    """
+    t = dict(GSR_QUALITY, **thresholds)
+    lo = np.asarray(lo, dtype=np.int64)
+    hi = np.asarray(hi, dtype=np.int64)
+    flags = np.zeros(lo.size, dtype=np.uint8)
+    if lo.size == 0 or len(signal) == 0:
+        return flags
+    low, high = t['valid_range']
+    for sel, start, stop in _window_groups(lo, hi):
+        x = np.asarray(signal[start:stop], dtype=float_dtype(dtype)).astype(np.float64, copy=False)
+        l, h, out = lo[sel] - start, hi[sel] - start, flags[sel]
+        outside = ~np.isnan(x) & ((x < low) | (x > high))
+        count = np.maximum(h - l, 1)
+        out[_window_sum(outside, l, h) / count > t['max_out_fraction']] |= OUT_OF_RANGE
+        out[_flatline(np.nan_to_num(x), l, h, t['flat_delta'], t['min_active'])] |= FLATLINE
+    return flags
+
+
+def rolling_emg_quality(signal, window, step, fs, include_last=False, dtype=np.float64, **thresholds):
+    """滑动窗口版 emg_quality，签名与 rolling_rms 一致，可配合 chunked_windows 分块计算"""
+    starts = window_starts(len(signal), window, step, include_last)
+    return emg_quality(signal, starts, starts + window, fs, dtype=dtype, **thresholds)
+
+
+def rolling_gsr_quality(signal, window, step, include_last=False, dtype=np.float64, **thresholds):
+    """滑动窗口版 gsr_quality，签名与 rolling_slope 一致，可配合 chunked_windows 分块计算"""
+    starts = window_starts(len(signal), window, step, include_last)
+    return gsr_quality(signal, starts, starts + window, dtype=dtype, **thresholds)
+
+
+def quality_summary(flags):
+    """
+    会话级质量统计
+    Returns:
+        {'n_windows': ..., 'good_fraction': ..., 各检查项: 触发比例}
+    """
+    flags = np.asarray(flags, dtype=np.uint8)
+    n = int(flags.size)
+    summary = {'n_windows': n, 'good_fraction': float(np.mean(flags == 0)) if n else float('nan')}
+    for name, bit in CHECKS.items():
+        summary[name] = float(np.mean((flags & bit) > 0)) if n else float('nan')
+    return summary
+
+
+def warn_if_all_rejected(flags, name):
+    """全部窗口都不合格时发出 RuntimeWarning (列出触发的检查项)，通常是阈值与信号单位不符"""
+    summary = quality_summary(flags)
+    if summary['n_windows'] and summary['good_fraction'] == 0:
+        triggered = ', '.join(f"{check} {summary[check]:.0%}" for check in CHECKS if summary[check] > 0)
+        warnings.warn(f"{name} 质量检查拒绝了全部 {summary['n_windows']} 个窗口 ({triggered})，"
+                      f"请检查阈值与信号单位 (GSR 默认 valid_range 以 µS 为单位)", RuntimeWarning, stacklevel=3)
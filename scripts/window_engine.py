@@ -0,0 +1,508 @@
+#!/usr/bin/env python3
+"""
+GestureFlow 滑动窗口计算引擎
+一次性向量化计算所有窗口的特征，替代逐窗口的Python循环
+窗口定义与 compute_cei_and_stats.py 中的参考实现保持一致
+"""
+
+from functools import lru_cache
+
+import numpy as np
+
+
+def window_samples(fs, win_s, step_s):
+    """
+    将窗口/步长 (秒) 换算为样本数，批处理与流式计算共用
+    Args:
+        fs: 采样率 (Hz)
+        win_s: 窗口长度 (秒)
+        step_s: 步长 (秒)
+    Returns:
+        (窗口样本数, 步长样本数)
+    """
+    return int(win_s * fs), int(step_s * fs)
+
+
+def float_dtype(precision):
+    """
+    解析计算精度
+    float32 模式下原始信号、窗口矩阵与块内前缀和按单精度存储、结果以单精度输出 (12-16位ADC数据精度足够)；
+    只有块起点的累计值 (见 blocked_prefix_sum) 与斜率的段内行前缀和 (按组计算，大小有界) 用 float64；
+    RMS 的峰值内存约为 float64 模式的一半，斜率约 0.7 倍
+    Args:
+        precision: 'float64' / 'float32' 或对应的 numpy dtype
+    Returns:
+        np.dtype
+    """
+    dtype = np.dtype(precision)
+    if dtype not in (np.float32, np.float64):
+        raise ValueError(f"不支持的计算精度: {precision}")
+    return dtype
+
+
+def window_mask(mask, n_windows):
+    """
+    校验窗口掩码 (True 为需要计算的窗口)
+    Returns:
+        bool 数组；mask 为 None 时返回 None
+    """
+    if mask is None:
+        return None
+    mask = np.asarray(mask, dtype=bool)
+    if mask.shape != (n_windows,):
+        raise ValueError(f"窗口掩码长度 {mask.shape} 与窗口数 {n_windows} 不一致")
+    return mask
+
+
+def window_starts(n_samples, window, step, include_last=False):
+    """
+    计算所有窗口的起始下标
+    Args:
+        n_samples: 信号长度
+        window: 窗口长度 (样本数)
+        step: 步长 (样本数)
+        include_last: 是否包含恰好结束于信号末尾的窗口
+            False 对应 GestureFlowAnalyzer 的 range(0, n - w, step)
+            True 对应 features() 的 range(0, n - w + 1, step)
+    Returns:
+        起始下标数组 (int64)
+    """
+    if step <= 0:
+        raise ValueError(f"step必须为正整数: {step}")
+    stop = n_samples - window + (1 if include_last else 0)
+    if window <= 0 or stop <= 0:
+        return np.empty(0, dtype=np.int64)
+    return np.arange(0, stop, step, dtype=np.int64)
+
+
+# 非 float64 输入按块转换后累加：np.cumsum(dtype=float64) 会先整体复制一份 float64 输入；
+# 每块的转换缓冲区也计入峰值内存，块取小值使短会话下单精度的峰值内存不高于双精度
+CAST_BLOCK = 1 << 12
+
+
+def prefix_sum(values):
+    """
+    带前导0的累积和，prefix[j] - prefix[i] 即为 values[i:j] 之和
+    Args:
+        values: 输入数组
+    Returns:
+        长度为 len(values)+1 的float64数组
+    """
+    out = np.zeros(len(values) + 1, dtype=np.float64)
+    if values.dtype == np.float64:
+        np.cumsum(values, out=out[1:])
+        return out
+    for k in range(0, len(values), CAST_BLOCK):
+        part = out[k + 1:k + 1 + CAST_BLOCK]
+        np.cumsum(values[k:k + CAST_BLOCK], dtype=np.float64, out=part)
+        part += out[k]
+    return out
+
+
+# 分块前缀和的块长：块内累积和按计算精度存储，量级只到一块之和 (与1s EMG窗口同量级)，
+# float32 下窗口和的相对误差约为 块长/窗口长 × 1e-7；各块起点的累计值另以 float64 保存，
+# 整段不需要与信号等长的 float64 数组
+PREFIX_BLOCK = 1 << 8
+
+
+def blocked_prefix_sum(values, dtype=np.float64, transform=None):
+    """
+    分块前缀和
+    Args:
+        values: 输入数组
+        dtype: 块内累积和的存储精度
+        transform: 逐段作用于输入的函数 (如平方)，避免生成整段的临时数组
+    Returns:
+        (local, base)：local[k, r] 为第k块前 r+1 个值之和 (dtype)，base[k] 为前k块之和 (float64)；
+        区间和由 range_sum 求出
+    """
+    n = len(values)
+    local = np.zeros((-(-n // PREFIX_BLOCK), PREFIX_BLOCK), dtype=dtype)
+    chunk = PREFIX_BLOCK * 64
+    for k in range(0, n, chunk):
+        part = np.asarray(values[k:k + chunk])
+        if transform is not None:
+            part = transform(part)
+        tail = -len(part) % PREFIX_BLOCK
+        if tail:
+            part = np.concatenate([part, np.zeros(tail, dtype=part.dtype)])
+        row = k // PREFIX_BLOCK
+        rows = part.reshape(-1, PREFIX_BLOCK)
+        np.cumsum(rows, axis=1, dtype=dtype, out=local[row:row + len(rows)])
+    base = np.zeros(len(local) + 1, dtype=np.float64)
+    np.cumsum(local[:, -1], dtype=np.float64, out=base[1:])
+    return local, base
+
+
+def range_sum(prefix, lo, hi):
+    """
+    blocked_prefix_sum 结果上各区间 [lo, hi) 之和
+    Returns:
+        float64 数组
+    """
+    local, base = prefix
+
+    def at(j):
+        # 前 j 个值之和：所在块之前各块之和 + 块内累积和 (j=0 为0)
+        k, r = np.divmod(np.maximum(j - 1, 0), PREFIX_BLOCK)
+        return base[k], np.where(j > 0, local[k, r], 0).astype(np.float64)
+
+    base_hi, local_hi = at(hi)
+    base_lo, local_lo = at(lo)
+    return (base_hi - base_lo) + (local_hi - local_lo)
+
+
+def windowed_rms(signal, lo, hi, dtype=np.float64, mask=None):
+    """
+    任意窗口 [lo, hi) 的向量化RMS (平方累积和)
+    含NaN或为空的窗口输出NaN，与逐窗口 np.mean 的行为一致
+    Args:
+        signal: 输入信号
+        lo: 各窗口起始下标数组
+        hi: 各窗口结束下标数组 (不含)
+        dtype: 计算精度 (见 float_dtype)，平方和为分块前缀和 (见 blocked_prefix_sum)，块内按 dtype 累加
+        mask: 窗口掩码，False 的窗口不计算、输出NaN (如信号质量不合格的窗口)
+    Returns:
+        每个窗口的RMS值数组 (dtype)
+    """
+    dtype = float_dtype(dtype)
+    lo = np.asarray(lo, dtype=np.int64)
+    hi = np.asarray(hi, dtype=np.int64)
+    mask = window_mask(mask, lo.size)
+    if mask is not None:
+        out = np.full(lo.size, np.nan, dtype=dtype)
+        out[mask] = windowed_rms(signal, lo[mask], hi[mask], dtype=dtype)
+        return out
+    if lo.size == 0:
+        return np.empty(0, dtype=dtype)
+
+    # 信号按段转换精度并平方，不生成整段的副本；和为NaN时才需要按窗口统计NaN个数
+    has_nan = np.isnan(np.sum(signal, dtype=np.float64))
+
+    def square(part):
+        part = part.astype(dtype, copy=False)
+        return np.square(np.where(np.isnan(part), dtype.type(0), part) if has_nan else part)
+
+    sq = range_sum(blocked_prefix_sum(signal, dtype, square), lo, hi)
+    count = hi - lo
+    # 累积和相减可能产生极小的负数舍入误差
+    with np.errstate(invalid='ignore', divide='ignore'):
+        rms = np.sqrt(np.maximum(sq, 0.0) / count)
+    rms[count <= 0] = np.nan
+
+    if has_nan:
+        nan_count = range_sum(blocked_prefix_sum(signal, dtype, np.isnan), lo, hi)
+        rms[nan_count > 0] = np.nan
+    return rms.astype(dtype, copy=False)
+
+
+def rolling_rms(signal, window, step, include_last=False, dtype=np.float64, mask=None):
+    """
+    向量化滑动窗口RMS
+    Args:
+        signal: 输入信号
+        window: 窗口长度 (样本数)
+        step: 步长 (样本数)
+        include_last: 见 window_starts
+        dtype: 计算精度 (见 float_dtype)
+        mask: 窗口掩码 (见 windowed_rms)
+    Returns:
+        每个窗口的RMS值数组
+    """
+    starts = window_starts(len(signal), window, step, include_last)
+    return windowed_rms(signal, starts, starts + window, dtype=dtype, mask=mask)
+
+
+def _segment_view(values, seg_starts, seg_len, fill=0, dtype=None):
+    """
+    分段矩阵：第k行为 values[seg_starts[k] : seg_starts[k] + seg_len]，末尾不足补 fill
+    只读取并按 dtype 转换各段覆盖的范围 (可为 np.memmap)
+    """
+    start, stop = int(seg_starts[0]), int(seg_starts[-1]) + seg_len
+    part = np.asarray(values[start:stop], dtype=dtype)
+    if len(part) < stop - start:
+        part = np.concatenate([part, np.full(stop - start - len(part), fill, dtype=part.dtype)])
+    return np.lib.stride_tricks.sliding_window_view(part, seg_len)[seg_starts - start]
+
+
+# windowed_slope 每组段矩阵覆盖的样本数
+SLOPE_GROUP = 1 << 16
+
+
+def _row_prefix(matrix):
+    """按行累积和 (float64)，每行带前导0"""
+    out = np.zeros((matrix.shape[0], matrix.shape[1] + 1), dtype=np.float64)
+    if matrix.dtype == np.float64:
+        np.cumsum(matrix, axis=1, out=out[:, 1:])
+        return out
+    rows = max(1, CAST_BLOCK // max(matrix.shape[1], 1))
+    for k in range(0, matrix.shape[0], rows):
+        np.cumsum(matrix[k:k + rows], axis=1, dtype=np.float64, out=out[k:k + rows, 1:])
+    return out
+
+
+def windowed_slope(signal, lo, hi, x=None, dt=1.0, block=1024, dtype=np.float64, mask=None):
+    """
+    任意窗口 [lo, hi) 的向量化最小二乘斜率 (闭式解，x/y/x*y 前缀和)
+    与逐窗口 np.polyfit(x, seg, 1)[0] 等价；NaN样本不参与拟合，
+    有效样本少于2个的窗口输出NaN
+    Args:
+        signal: 输入信号
+        lo: 各窗口起始下标数组
+        hi: 各窗口结束下标数组 (不含)
+        x: 每个样本的横坐标 (如时间戳，需单调)；None 时为样本序号
+        dt: 横坐标单位换算，斜率除以 dt
+        block: 分段前缀和的段长 (样本数)
+        dtype: 计算精度 (见 float_dtype)；段内矩阵按 dtype 存储，
+            行前缀和与窗口内坐标平移以 float64 计算，横坐标 x 始终按 float64 读取；
+            各段按组计算 (每组约 SLOPE_GROUP 个样本)，临时矩阵不随会话长度增长
+        mask: 窗口掩码，False 的窗口不计算、输出NaN
+    Returns:
+        每个窗口的斜率数组 (dtype)
+    """
+    dtype = float_dtype(dtype)
+    lo = np.asarray(lo, dtype=np.int64)
+    hi = np.asarray(hi, dtype=np.int64)
+    mask = window_mask(mask, lo.size)
+    if mask is not None:
+        out = np.full(lo.size, np.nan, dtype=dtype)
+        out[mask] = windowed_slope(signal, lo[mask], hi[mask], x=x, dt=dt, block=block, dtype=dtype)
+        return out
+    if np.any(lo[1:] < lo[:-1]):
+        # 分组计算要求窗口按起点递增
+        order = np.argsort(lo, kind='stable')
+        out = np.empty(lo.size, dtype=dtype)
+        out[order] = windowed_slope(signal, lo[order], hi[order], x=x, dt=dt, block=block, dtype=dtype)
+        return out
+    if lo.size == 0:
+        return np.empty(0, dtype=dtype)
+
+    # 斜率与y平移无关，先去均值以减小累积和的量级 (均值按段累加，不生成整段副本)
+    total, count = 0.0, 0
+    for k in range(0, len(signal), SLOPE_GROUP):
+        part = np.asarray(signal[k:k + SLOPE_GROUP], dtype=dtype)
+        ok = np.isfinite(part)
+        total += float(part[ok].sum(dtype=np.float64))
+        count += int(ok.sum())
+    if count == 0:
+        return np.full(lo.size, np.nan, dtype=dtype)
+    center = dtype.type(total / count)
+
+    # 全局 x*y 前缀和的量级随会话长度平方增长，长会话下相减会丢失精度；
+    # 因此按 block 分段，每段覆盖 [段起点, 段起点 + block + 最长窗口)，x取段内坐标
+    seg_id = lo // block
+    seg_ids, seg_row = np.unique(seg_id, return_inverse=True)
+    seg_starts = seg_ids * block
+    seg_len = block + int(np.max(hi - lo))
+    lo_seg = lo - seg_starts[seg_row]
+    hi_seg = hi - seg_starts[seg_row]
+    if x is None:
+        shift = lo_seg.astype(np.float64)
+    else:
+        xs = np.asarray(x, dtype=np.float64)
+        shift = xs[np.minimum(lo, len(xs) - 1)] - xs[seg_starts][seg_row]
+
+    n, sy, sx, sxx, sxy = (np.empty(lo.size, dtype=np.float64) for _ in range(5))
+    # 窗口按起点递增，同一组段的窗口连续；每组的段矩阵与行前缀和只在组内存在
+    rows_per_group = max(1, SLOPE_GROUP // seg_len)
+    for g in range(0, len(seg_starts), rows_per_group):
+        starts = seg_starts[g:g + rows_per_group]
+        w = slice(np.searchsorted(seg_row, g), np.searchsorted(seg_row, g + len(starts)))
+        row, lo_w, hi_w = seg_row[w] - g, lo_seg[w], hi_seg[w]
+
+        Y = _segment_view(signal, starts, seg_len, fill=np.nan, dtype=dtype)
+        valid = np.isfinite(Y)
+        Y = np.where(valid, Y - center, dtype.type(0))
+        V = valid.astype(dtype)
+        if x is None:
+            X = np.arange(seg_len, dtype=dtype)
+        else:
+            # 绝对时间戳在 float32 下会丢失精度，段内相对坐标再转换为 dtype
+            X = (_segment_view(xs, starts, seg_len) - xs[starts][:, None]).astype(dtype, copy=False)
+
+        def window_sum(matrix):
+            prefix = _row_prefix(matrix)
+            return prefix[row, hi_w] - prefix[row, lo_w]
+
+        n[w] = window_sum(V)
+        sy[w] = window_sum(Y)
+        sx[w] = window_sum(V * X)
+        sxx[w] = window_sum(V * (X * X))
+        sxy[w] = window_sum(Y * X)
+
+    # 平移到窗口内坐标 (以窗口首样本为原点)
+    sxx = sxx - 2 * shift * sx + shift * shift * n
+    sx = sx - shift * n
+    sxy = sxy - shift * sy
+
+    denom = n * sxx - sx * sx
+    with np.errstate(invalid='ignore', divide='ignore'):
+        slope = (n * sxy - sx * sy) / denom / dt
+    slope[(n < 2) | ~(denom > 0)] = np.nan
+    return slope.astype(dtype, copy=False)
+
+
+def rolling_slope(signal, window, step, dt=1.0, include_last=False, block=1024, dtype=np.float64, mask=None):
+    """
+    向量化滑动窗口最小二乘斜率
+    Args:
+        signal: 输入信号
+        window: 窗口长度 (样本数)
+        step: 步长 (样本数)
+        dt: 样本间隔 (x轴单位)，GestureFlowAnalyzer 使用 1/fs
+        include_last: 见 window_starts
+        block: 分段前缀和的段长 (样本数)
+        dtype: 计算精度 (见 float_dtype)
+        mask: 窗口掩码 (见 windowed_slope)
+    Returns:
+        每个窗口的斜率数组
+    """
+    starts = window_starts(len(signal), window, step, include_last)
+    return windowed_slope(signal, starts, starts + window, dt=dt, block=block, dtype=dtype, mask=mask)
+
+
+def nearest_window(times, window_starts_t, win):
+    """
+    为每个时刻找中心最近的窗口 (用于对齐窗口长度/步长不同的两路特征)
+    Args:
+        times: 查询时刻数组
+        window_starts_t: 递增的窗口起始时刻数组
+        win: 窗口长度 (与时刻同单位)
+    Returns:
+        窗口下标数组；没有窗口时为空数组
+    """
+    centers = np.asarray(window_starts_t, dtype=np.float64) + win / 2.0
+    times = np.asarray(times, dtype=np.float64)
+    if centers.size == 0:
+        return np.empty(0, dtype=np.int64)
+    right = np.clip(np.searchsorted(centers, times), 0, centers.size - 1)
+    left = np.maximum(right - 1, 0)
+    closer_left = np.abs(times - centers[left]) <= np.abs(centers[right] - times)
+    return np.where(closer_left, left, right).astype(np.int64)
+
+
+def time_grid(t_first, t_last, win, step):
+    """
+    共享时间窗口网格：起点为 t_first + k*step，且窗口 [t, t+win) 不超过 t_last
+    Args:
+        t_first: 最早时间戳
+        t_last: 最晚时间戳
+        win: 窗口长度 (与时间戳同单位)
+        step: 步长 (与时间戳同单位)
+    Returns:
+        窗口起始时间数组
+    """
+    span = t_last - t_first
+    if not np.isfinite(span) or span < win:
+        return np.empty(0, dtype=np.float64)
+    # 容忍浮点时间戳的舍入误差
+    n = int(np.floor((span - win) / step + 1e-9)) + 1
+    return t_first + np.arange(n, dtype=np.float64) * step
+
+
+def grid_bounds(timestamps, grid_starts, win):
+    """
+    将已排序的时间戳划分到时间窗口网格上 (searchsorted)
+    Args:
+        timestamps: 单调递增的样本时间戳
+        grid_starts: 窗口起始时间数组
+        win: 窗口长度
+    Returns:
+        (lo, hi)：各窗口 [t, t+win) 内样本的下标范围
+    """
+    t = np.asarray(timestamps, dtype=np.float64)
+    lo = np.searchsorted(t, grid_starts, side='left')
+    hi = np.searchsorted(t, grid_starts + win, side='left')
+    return lo.astype(np.int64), hi.astype(np.int64)
+
+
+@lru_cache(maxsize=16)
+def taper(window, dtype='float64'):
+    """缓存的Hann窗 (只读)，同一窗口长度与精度只计算一次"""
+    w = np.hanning(window).astype(dtype)
+    w.flags.writeable = False
+    return w
+
+
+# spectral_features 每批窗口矩阵的样本数上限 (批内的FFT与中间数组随之有界)
+SPECTRAL_BATCH = 1 << 18
+
+
+def spectral_features(signal, lo, window, fs, zc_threshold=0.0, batch=None, dtype=np.float64, mask=None):
+    """
+    定长窗口的EMG过零率与中值频率 (MDF)
+    窗口矩阵取自信号的二维跨步视图，每批窗口做一次批量实数FFT
+    Args:
+        signal: 输入信号
+        lo: 各窗口起始下标数组
+        window: 窗口长度 (样本数)
+        fs: 采样率 (Hz)
+        zc_threshold: 过零判定的最小幅度差 (抑制噪声)
+        batch: 每批处理的窗口数 (限制窗口矩阵的内存)，None 为 SPECTRAL_BATCH // window
+        dtype: 计算精度 (见 float_dtype)；float32 下窗口矩阵与FFT均为单精度
+        mask: 窗口掩码，False 的窗口不做FFT、输出NaN
+    Returns:
+        (过零率 [次/秒], 中值频率 [Hz])；越界或含NaN的窗口为NaN
+    """
+    dtype = float_dtype(dtype)
+    x = np.asarray(signal, dtype=dtype)
+    lo = np.asarray(lo, dtype=np.int64)
+    zcr = np.full(lo.size, np.nan, dtype=dtype)
+    mdf = np.full(lo.size, np.nan, dtype=dtype)
+    inside = (lo >= 0) & (lo + window <= len(x))
+    mask = window_mask(mask, lo.size)
+    ok = np.flatnonzero(inside if mask is None else inside & mask)
+    if ok.size == 0 or window < 2:
+        return zcr, mdf
+
+    view = np.lib.stride_tricks.sliding_window_view(x, window)
+    w = taper(window, dtype.name)
+    freqs = np.fft.rfftfreq(window, d=1.0 / fs)
+    batch = batch or max(1, SPECTRAL_BATCH // window)
+    for k in range(0, ok.size, batch):
+        rows = ok[k:k + batch]
+        # 每个窗口去均值后再计算过零与频谱 (m 为取出的副本，原位修改)
+        m = view[lo[rows]]
+        m -= m.mean(axis=1, keepdims=True)
+
+        sign = np.signbit(m)
+        crossing = sign[:, 1:] != sign[:, :-1]
+        if zc_threshold > 0:
+            crossing &= np.abs(np.diff(m, axis=1)) >= zc_threshold
+        zcr[rows] = crossing.sum(axis=1) / (window / fs)
+
+        m *= w
+        power = np.abs(np.fft.rfft(m, axis=1)) ** 2
+        cum = np.cumsum(power, axis=1)
+        total = cum[:, -1]
+        # 累积功率首次达到总功率一半的频点
+        idx = (cum < 0.5 * total[:, None]).sum(axis=1)
+        with np.errstate(invalid='ignore'):
+            mdf[rows] = np.where(total > 0, freqs[np.minimum(idx, len(freqs) - 1)], np.nan)
+
+    # 含NaN的窗口在计算中已传播为NaN，统一置为缺失
+    bad = np.isnan(zcr) | np.isnan(mdf)
+    zcr[bad] = np.nan
+    mdf[bad] = np.nan
+    return zcr, mdf
+
+
+def rolling_emg_features(signal, window, step, fs, include_last=False, zc_threshold=0.0, dtype=np.float64,
+                         mask=None):
+    """
+    一次计算每个滑动窗口的 RMS / 过零率 / 中值频率
+    Args:
+        signal: 输入信号
+        window: 窗口长度 (样本数)
+        step: 步长 (样本数)
+        fs: 采样率 (Hz)
+        include_last: 见 window_starts
+        zc_threshold: 过零判定的最小幅度差
+        dtype: 计算精度 (见 float_dtype)
+        mask: 窗口掩码，False 的窗口不计算、输出NaN
+    Returns:
+        {'rms': ..., 'zcr': ..., 'mdf': ...}
+    """
+    starts = window_starts(len(signal), window, step, include_last)
+    zcr, mdf = spectral_features(signal, starts, window, fs, zc_threshold, dtype=dtype, mask=mask)
+    return {'rms': windowed_rms(signal, starts, starts + window, dtype=dtype, mask=mask), 'zcr': zcr, 'mdf': mdf}